@@ -120,7 +120,42 @@ EOF
 cp autoscale_hook.py "$INSTALL_DIR/"
 cp logging.conf "$INSTALL_DIR/"
 
-if [ "$CRON_METHOD" == "pbs_hook" ]; then
+if [ "$CRON_METHOD" == "watch" ]; then
+    echo Installing "autoscale_trigger" hook
+    cat > "$INSTALL_DIR/autoscale_trigger_hook_config.json" << EOF
+{
+    "trigger_file": "$INSTALL_DIR/autoscale.trigger"
+}
+EOF
+    cp autoscale_trigger_hook.py "$INSTALL_DIR/"
+    /opt/pbs/bin/qmgr -c "list hook autoscale_trigger" 1>&2 2>/dev/null || /opt/pbs/bin/qmgr -c "create hook autoscale_trigger" 1>&2
+    /opt/pbs/bin/qmgr -c "import hook autoscale_trigger application/x-python default $INSTALL_DIR/autoscale_trigger_hook.py"
+    /opt/pbs/bin/qmgr -c "import hook autoscale_trigger application/x-config default $INSTALL_DIR/autoscale_trigger_hook_config.json"
+    /opt/pbs/bin/qmgr -c "set hook autoscale_trigger event = 'queuejob,modifyjob'"
+
+    # a long running autoscaler replaces the periodic hook
+    if /opt/pbs/bin/qmgr -c "list hook autoscale" 1>&2 2>/dev/null; then
+        /opt/pbs/bin/qmgr -c "set hook autoscale enabled = false"
+    fi
+
+    echo Installing azpbs-autoscale service
+    cat > /etc/systemd/system/azpbs-autoscale.service << EOF
+[Unit]
+Description=CycleCloud ${SCHEDULER} autoscaler
+After=pbs.service
+
+[Service]
+ExecStart=$VENV/bin/azpbs autoscale --config $INSTALL_DIR/autoscale.json --watch
+Environment=PATH=/usr/bin:/bin:/opt/pbs/bin
+Restart=always
+RestartSec=15
+
+[Install]
+WantedBy=multi-user.target
+EOF
+    systemctl daemon-reload
+    systemctl enable --now azpbs-autoscale.service
+elif [ "$CRON_METHOD" == "pbs_hook" ]; then
     /opt/pbs/bin/qmgr -c "list hook autoscale" 1>&2 2>/dev/null || /opt/pbs/bin/qmgr -c "create hook autoscale" 1>&2
     /opt/pbs/bin/qmgr -c "import hook autoscale application/x-python default $INSTALL_DIR/autoscale_hook.py"
     /opt/pbs/bin/qmgr -c "import hook autoscale application/x-config default $INSTALL_DIR/autoscale_hook_config.json"
@@ -156,6 +156,7 @@ def execute() -> None:
     _add("generate_autoscale_json.sh", mode=os.stat("generate_autoscale_json.sh")[0])
     _add("server_dyn_res_wrapper.sh", mode=os.stat("server_dyn_res_wrapper.sh")[0])
     _add("autoscale_hook.py", "pbspro/conf/autoscale_hook.py")
+    _add("autoscale_trigger_hook.py", "pbspro/conf/autoscale_trigger_hook.py")
     _add("logging.conf", "pbspro/conf/logging.conf")
 
     print("Downloading release files...")
@@ -7,6 +7,7 @@ import json
 import os
 import shutil
 import subprocess
+import time
 import traceback
 
 import pbs
@@ -20,6 +21,108 @@ def error(msg):
     pbs.logmsg(pbs.EVENT_ERROR, "azpbs_autoscale - %s" % msg)
 
 
+# $0 of the wrapper, so that is_running can tell it apart from whatever else
+# ends up with its pid
+WRAPPER_NAME = "azpbs_autoscale"
+
+# Runs the autoscaler, then records how long it took and its exit code. The
+# wrapper writes its own pid file and removes it once the iteration is over.
+DETACHED_WRAPPER = """
+status_path=$1
+pid_path=$2
+log_path=$3
+shift 3
+echo $$ > "$pid_path"
+start=$(date +%s)
+"$@" > "$log_path" 2>&1
+exit_code=$?
+end=$(date +%s)
+echo "{\\"exit_code\\": $exit_code, \\"duration\\": $((end - start)), \\"finished\\": $end}" > "$status_path.tmp"
+mv -f "$status_path.tmp" "$status_path"
+rm -f "$pid_path"
+"""
+
+
+def is_running(pid_path):
+    """
+    Whether the wrapper that wrote pid_path is still alive. If the wrapper was
+    killed, the pid file is left behind and its pid may be reused, so where
+    /proc exists we also check that the pid still belongs to the wrapper.
+    """
+    try:
+        with open(pid_path) as fr:
+            pid = int(fr.read().strip())
+        os.kill(pid, 0)
+    except (IOError, OSError, ValueError):
+        return False
+
+    try:
+        with open("/proc/%s/cmdline" % pid, "rb") as fr:
+            cmdline = fr.read()
+    except (IOError, OSError):
+        return not os.path.isdir("/proc")
+    # empty right after the wrapper started, so give it the benefit of the doubt
+    return not cmdline or WRAPPER_NAME.encode() in cmdline.split(b"\0")
+
+
+def report_last_iteration(status_path):
+    try:
+        with open(status_path) as fr:
+            status = json.load(fr)
+    except (IOError, OSError, ValueError):
+        return
+
+    msg = "last autoscale iteration took %ss and exited with %s (%s ago)" % (
+        status.get("duration"),
+        status.get("exit_code"),
+        int(time.time() - status.get("finished", time.time())),
+    )
+    if status.get("exit_code") == 0:
+        debug(msg)
+    else:
+        error(msg)
+
+
+def run_detached(cmd, environ, hook_config):
+    """
+    Starts the autoscaler in the background and returns immediately, instead of
+    holding on to the hook until the iteration is done. Nothing is started while
+    the previous iteration is still running.
+    """
+    state_dir = hook_config.get("state_dir", "/opt/cycle/pbspro")
+    pid_path = os.path.join(state_dir, "autoscale_hook.pid")
+    status_path = os.path.join(state_dir, "autoscale_hook_status.json")
+    log_path = os.path.join(state_dir, "autoscale_hook_last.log")
+
+    if is_running(pid_path):
+        started = os.path.getmtime(pid_path)
+        debug(
+            "autoscale has been running for %ss, skipping this interval"
+            % int(time.time() - started)
+        )
+        return
+
+    report_last_iteration(status_path)
+
+    wrapper = ["/bin/sh", "-c", DETACHED_WRAPPER, WRAPPER_NAME]
+    proc = subprocess.Popen(
+        wrapper + [status_path, pid_path, log_path] + cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=environ,
+        close_fds=True,
+        start_new_session=True,
+    )
+    debug("Started autoscale in the background, pid %s" % proc.pid)
+
+
+def poke(trigger_file):
+    with open(trigger_file, "a"):
+        pass
+    os.utime(trigger_file, None)
+
+
 def perform_hook():
     """
     See /var/spool/pbs/server_logs/* or /opt/cycle/jetpack/logs/autoscale.log for log messages
@@ -31,6 +134,11 @@ def perform_hook():
         with open(pbs.hook_config_filename) as fr:
             hook_config = json.load(fr)
 
+        if hook_config.get("trigger_file"):
+            # a long running autoscaler (pbspro.autoscaler --watch) does the work
+            poke(hook_config["trigger_file"])
+            return
+
         azpbs_path = hook_config.get("azpbs_path")
         if not azpbs_path:
             azpbs_path = shutil.which("azpbs")
@@ -55,6 +163,10 @@ def perform_hook():
         pbs_bin = pbs.pbs_conf["PBS_EXEC"] + os.sep + "bin"
         environ["PATH"] = environ.get("PATH", ".") + os.pathsep + pbs_bin
 
+        if hook_config.get("detached"):
+            run_detached(cmd, environ, hook_config)
+            return
+
         debug("Running %s with env %s" % (cmd, environ))
 
         proc = subprocess.Popen(
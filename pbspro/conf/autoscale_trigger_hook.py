@@ -0,0 +1,40 @@
+
+# Copyright (c) Microsoft Corporation. All rights reserved.
+# Licensed under the MIT License.
+#
+
+import json
+import os
+
+import pbs
+
+DEFAULT_TRIGGER_FILE = "/opt/cycle/pbspro/autoscale.trigger"
+
+
+def debug(msg):
+    pbs.logmsg(pbs.EVENT_DEBUG, "azpbs_autoscale_trigger - %s" % msg)
+
+
+def perform_hook():
+    """
+    queuejob/modifyjob hook that only tells the autoscaler (pbspro.autoscaler --watch)
+    that there is something new to look at, by touching a file. It has to stay
+    cheap, as it runs for every qsub, and must never reject a job.
+    """
+    try:
+        trigger_file = DEFAULT_TRIGGER_FILE
+        if pbs.hook_config_filename:
+            with open(pbs.hook_config_filename) as fr:
+                trigger_file = json.load(fr).get("trigger_file", trigger_file)
+
+        with open(trigger_file, "a"):
+            pass
+        os.utime(trigger_file, None)
+    except Exception as e:
+        debug("Could not trigger autoscale: %s" % e)
+
+    pbs.event().accept()
+
+
+# hooks must not have a __name__ == "__main__" guard
+perform_hook()
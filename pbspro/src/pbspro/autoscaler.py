@@ -1,7 +1,8 @@
 import os
 import sys
+import time
 from argparse import ArgumentParser
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import hpc.autoscale.job.driver
 from hpc.autoscale import hpclogging as logging
@@ -15,8 +16,21 @@ from hpc.autoscale.results import DefaultContextHandler, register_result_handler
 from hpc.autoscale.util import SingletonLock, json_load
 
 from pbspro import environment as envlib
+from pbspro.demandcache import DemandCache, demand_fingerprint, get_demand_cache
+from pbspro.demandhistory import (
+    PREBOOT_ASSIGNMENT_ID,
+    DemandHistory,
+    is_demand_history_enabled,
+    node_bucket_key,
+    plan_preboot,
+)
 from pbspro.driver import PBSProDriver
 from pbspro.environment import PBSProEnvironment
+from pbspro.nodeindex import NodeIndex
+from pbspro.output import STREAM_FORMATS, iter_rows, write_rows
+from pbspro.scaledown import select_for_scaledown
+from pbspro.snapshot import RecordingPBSCMD, default_snapshot_path
+from pbspro.trigger import DEFAULT_TRIGGER_FILE, AutoscaleTrigger
 
 _exit_code = 0
 
@@ -44,6 +58,18 @@ def autoscale_pbspro(
         # allow tests to pass in a mock
         pbs_driver = PBSProDriver(config)
 
+    # record what we read from PBS, so that azpbs can answer from a snapshot
+    recorder: Optional[RecordingPBSCMD] = None
+    snapshot_path = default_snapshot_path(config)
+    if (
+        pbs_env is None
+        and not dry_run
+        and config.get("pbspro", {}).get("snapshot", {}).get("enabled", True)
+        and os.path.isdir(os.path.dirname(snapshot_path))
+    ):
+        recorder = RecordingPBSCMD(pbs_driver.pbscmd)
+        pbs_driver.pbscmd = recorder  # type: ignore
+
     if pbs_env is None:
         pbs_env = envlib.from_driver(config, pbs_driver)
 
@@ -56,11 +82,12 @@ def autoscale_pbspro(
     demand_calculator = calculate_demand(config, pbs_env, ctx_handler, node_history)
 
     failed_nodes = demand_calculator.node_mgr.get_failed_nodes()
-    for node in pbs_env.scheduler_nodes:
-        if "down" in node.metadata.get("pbs_state", ""):
-            failed_nodes.append(node)
+    failed_nodes.extend(NodeIndex(pbs_env.scheduler_nodes).with_state("down"))
     pbs_driver.handle_failed_nodes(failed_nodes)
 
+    demand_history = pbs_driver.new_demand_history(config)
+    preboot(config, demand_calculator.node_mgr, demand_history, dry_run)
+
     demand_result = demand_calculator.finish()
 
     if ctx_handler:
@@ -84,6 +111,9 @@ def autoscale_pbspro(
 
     if not dry_run:
         demand_calculator.update_history()
+        if is_demand_history_enabled(config):
+            demand_history.update(demand_result)
+            demand_history.save()
 
     # we also tell the driver about nodes that are unmatched. It filters them out
     # and returns a list of ones we can delete.
@@ -91,7 +121,12 @@ def autoscale_pbspro(
     boot_timeout = int(config.get("boot_timeout", 3600))
     logging.fine("Idle timeout is %s", idle_timeout)
 
-    unmatched_for_5_mins = demand_calculator.find_unmatched_for(at_least=idle_timeout)
+    unmatched_for_5_mins = select_for_scaledown(
+        config,
+        demand_calculator.find_unmatched_for(at_least=idle_timeout),
+        demand_calculator.node_mgr.get_nodes(),
+        demand_history,
+    )
     timed_out_booting = demand_calculator.find_booting(at_least=boot_timeout)
 
     # I don't care about nodes that have keep_alive=true
@@ -140,11 +175,78 @@ def autoscale_pbspro(
             logging.warning("Deletion failed, will retry on next iteration: %s", e)
             logging.exception(str(e))
 
+    # release the PBS connection, if the backend holds one open for the iteration
+    pbs_driver.pbscmd.close()
+
+    if recorder:
+        recorder.save(snapshot_path)
+
     print_demand(config, demand_result, log=not dry_run)
 
     return demand_result
 
 
+def preboot(
+    config: Dict,
+    node_mgr: NodeManager,
+    demand_history: DemandHistory,
+    dry_run: bool = False,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Optionally allocates nodes ahead of the jobs we expect to be submitted
+    within the next pbspro.preboot.window seconds, based on the per bucket
+    arrival rate. Idle nodes in those buckets are held onto first, and at most
+    pbspro.preboot.max_nodes new nodes are booted per iteration. With
+    pbspro.preboot.dry_run (or a dry run of autoscale) it only reports what it
+    would have done.
+    """
+    preboot_config = config.get("pbspro", {}).get("preboot", {})
+    if not preboot_config.get("enabled", False):
+        return {}
+
+    window = int(preboot_config.get("window", 600))
+    max_nodes = int(preboot_config.get("max_nodes", 10))
+    report_only = dry_run or preboot_config.get("dry_run", False)
+
+    idle_by_bucket: Dict[str, int] = {}
+    for node in node_mgr.get_nodes():
+        if node.assignments or node.closed or node.state == "Failed":
+            continue
+        key = node_bucket_key(node)
+        idle_by_bucket[key] = idle_by_bucket.get(key, 0) + 1
+
+    plans = plan_preboot(demand_history, idle_by_bucket, window, max_nodes)
+
+    for key, plan in plans.items():
+        logging.info(
+            "Preboot%s %s: expecting %s nodes of new jobs within %ss, %s idle, booting %s",
+            " (dry run)" if report_only else "",
+            key,
+            plan["expected"],
+            window,
+            plan["idle"],
+            plan["boot"],
+        )
+        decision = {"time": time.time(), "bucket": key, "dry_run": report_only}
+        decision.update(plan)
+        demand_history.record_decision(decision)
+
+        if report_only or plan["keep"] + plan["boot"] < 1:
+            continue
+
+        nodearray, vm_size = key.split("/", 1)
+        result = node_mgr.allocate(
+            {"node.nodearray": nodearray, "node.vm_size": vm_size, "exclusive": True},
+            node_count=plan["keep"] + plan["boot"],
+            allow_existing=True,
+            assignment_id=PREBOOT_ASSIGNMENT_ID,
+        )
+        if not result:
+            logging.warning("Could not preboot %s: %s", key, result)
+
+    return plans
+
+
 def new_demand_calculator(
     config: Dict,
     pbs_env: Optional[PBSProEnvironment] = None,
@@ -207,6 +309,21 @@ def calculate_demand(
         config, pbs_env, ctx_handler, node_history
     )
 
+    demand_cache: Optional[DemandCache] = None
+    fingerprint = ""
+    if config.get("pbspro", {}).get("demand_cache", False):
+        node_mgr = demand_calculator.node_mgr
+        demand_cache = get_demand_cache()
+        fingerprint = demand_fingerprint(
+            config, pbs_env.jobs, node_mgr.get_nodes(), node_mgr.get_buckets()
+        )
+        if demand_cache.replay(fingerprint, node_mgr.get_nodes()):
+            logging.info(
+                "Jobs, nodes and buckets are unchanged since the last iteration."
+                + " Reusing its job assignments."
+            )
+            return demand_calculator
+
     for job in pbs_env.jobs:
         if job.metadata.get("job_state") == "running":
             continue
@@ -215,6 +332,9 @@ def calculate_demand(
             ctx_handler.set_context("[job {}]".format(job.name))
         demand_calculator.add_job(job)
 
+    if demand_cache is not None:
+        demand_cache.store(fingerprint, demand_calculator.node_mgr.get_nodes())
+
     return demand_calculator
 
 
@@ -224,6 +344,8 @@ def print_demand(
     output_columns: Optional[List[str]] = None,
     output_format: Optional[str] = None,
     log: bool = False,
+    filters: Optional[List[Tuple[str, bool, str]]] = None,
+    limit: int = 0,
 ) -> None:
     # and let's use the demand printer to print the demand_result.
     if not output_columns:
@@ -254,6 +376,14 @@ def print_demand(
 
     output_format = output_format or "table"
 
+    if output_format in STREAM_FORMATS:
+        # rows are written as they are rendered, so "all" is not supported here.
+        if not output_columns:
+            output_columns = ["name", "hostname", "job_ids", "state", "vm_size"]
+        rows = iter_rows(demand_result.compute_nodes, output_columns, filters, limit)
+        write_rows(rows, output_columns, output_format, sys.stdout)
+        return demand_result
+
     demandprinter.print_demand(
         output_columns, demand_result, output_format=output_format, log=log,
     )
@@ -324,5 +454,32 @@ def main() -> int:
     return _exit_code
 
 
+def watch(
+    config: Dict, iteration: Callable[[], Any], ctx_handler: DefaultContextHandler
+) -> None:
+    """
+    Runs an iteration, then waits for the queuejob/modifyjob trigger hook or
+    for watch_interval seconds to pass, whichever comes first. See
+    azpbs autoscale --watch.
+    """
+    pbspro_config = config.get("pbspro", {})
+    trigger = AutoscaleTrigger(
+        pbspro_config.get("trigger_file", DEFAULT_TRIGGER_FILE),
+        debounce=float(pbspro_config.get("trigger_debounce", 2)),
+        max_delay=float(pbspro_config.get("trigger_max_delay", 10)),
+    )
+    interval = float(pbspro_config.get("watch_interval", 15))
+
+    while True:
+        ctx_handler.set_context("[initialization]")
+        try:
+            iteration()
+        except Exception:
+            logging.exception("Autoscale iteration failed")
+
+        if trigger.wait(interval):
+            logging.debug("Autoscale triggered by %s", trigger.path)
+
+
 if __name__ == "__main__":
     sys.exit(main())
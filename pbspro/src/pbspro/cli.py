@@ -1,27 +1,51 @@
+import copy
 import json
 import os
 import sys
+import typing
 from argparse import ArgumentParser
 from shutil import which
 from subprocess import CalledProcessError, check_output
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 
 from hpc.autoscale import clilib
 from hpc.autoscale import hpclogging as logging
 from hpc.autoscale.clilib import str_list
-from hpc.autoscale.job.demandcalculator import DemandCalculator
-from hpc.autoscale.job.driver import SchedulerDriver
-from hpc.autoscale.job.job import Job
-from hpc.autoscale.node.nodemanager import NodeManager
-from hpc.autoscale.results import DefaultContextHandler
-from hpc.autoscale.util import is_standalone_dns, partition_single
-
-from pbspro import environment
-from pbspro.autoscaler import new_demand_calculator
-from pbspro.driver import PBSProDriver
+
 from pbspro.parser import PBSProParser, get_pbspro_parser, set_pbspro_parser
-from pbspro.pbscmd import PBSCMD
-from pbspro.resource import read_resource_definitions
+from pbspro.pbscmd import PBSCMD, new_pbscmd
+
+# The driver, environment and autoscaler (and the parts of scalelib only they
+# need) are imported by the commands that use them, so that simple commands
+# like offline/online start quickly. See test/pbspro_test/cli_test.py
+if typing.TYPE_CHECKING:
+    from hpc.autoscale.job.demandcalculator import DemandCalculator
+    from hpc.autoscale.job.driver import SchedulerDriver
+    from hpc.autoscale.job.job import Job
+    from hpc.autoscale.node.nodemanager import NodeManager
+
+    from pbspro.driver import PBSProDriver
+    from pbspro.environment import PBSProEnvironment
+    from pbspro.resource import PBSProResourceDefinition
+    from pbspro.serverconfig import ServerConfig
+    from pbspro.snapshot import ReplayPBSCMD
+
+
+# read only commands that may use the snapshot the autoscaler saves every iteration
+SNAPSHOT_COMMANDS = [
+    "nodes",
+    "jobs",
+    "buckets",
+    "demand",
+    "shell",
+    "stream",
+    "capacity",
+    "placement_groups",
+]
+
+# commands that only need PBSCMD, unless they are asked about CycleCloud nodes.
+# They read the server config and resource definitions themselves if they have to.
+PBSCMD_ONLY_COMMANDS = ["offline", "online", "nodes"]
 
 
 class PBSCLI(clilib.CommonCLI):
@@ -29,25 +53,90 @@ class PBSCLI(clilib.CommonCLI):
         clilib.CommonCLI.__init__(self, "pbspro")
         # bootstrap parser
         set_pbspro_parser(PBSProParser({}))
-        self.pbscmd = PBSCMD(get_pbspro_parser())
         # lazily initialized
-        self.__pbs_env: Optional[environment.PBSProEnvironment] = None
-        self.__driver: Optional[PBSProDriver] = None
+        self.__pbscmd: Optional[PBSCMD] = None
+        self.__pbs_env: Optional["PBSProEnvironment"] = None
+        self.__driver: Optional["PBSProDriver"] = None
+        self.__server_config: Optional["ServerConfig"] = None
         self.autoscale_dir = os.path.join("/", "opt", "cycle", "pbspro")
+        # set by --fresh, bypasses the snapshot
+        self.fresh = False
+
+    @property
+    def pbscmd(self) -> PBSCMD:
+        if self.__pbscmd is None:
+            self.__pbscmd = PBSCMD(get_pbspro_parser())
+        return self.__pbscmd
+
+    @pbscmd.setter
+    def pbscmd(self, value: PBSCMD) -> None:
+        self.__pbscmd = value
 
     def connect(self, config: Dict) -> None:
         """Tests connection to CycleCloud"""
         self._node_mgr(config)
 
     def _initialize(self, command: str, config: Dict) -> None:
+        if command in PBSCMD_ONLY_COMMANDS:
+            self.pbscmd = new_pbscmd(get_pbspro_parser(), config)
+            return
+        self._read_pbs_state(command, config)
+
+    def _read_pbs_state(self, command: str, config: Dict) -> None:
+        from pbspro.resource import read_resource_definitions
+        from pbspro.serverconfig import read_server_config
+
+        snapshot = None
+        if command in SNAPSHOT_COMMANDS and not self.fresh:
+            snapshot = self._load_snapshot(config)
+
+        if snapshot:
+            self.pbscmd = snapshot  # type: ignore
+
+        # one qmgr call, shared with the driver
+        self.__server_config = read_server_config(self.pbscmd)
+        resource_definitions = read_resource_definitions(
+            self.pbscmd, config, self.__server_config
+        )
+        # azpbs autoscale --watch calls this every iteration. The job tracker
+        # starts over whenever the parser changes, so keep it if we can.
+        current = get_pbspro_parser().resource_definitions
+        if _definitions_key(current) != _definitions_key(resource_definitions):
+            set_pbspro_parser(PBSProParser(resource_definitions))
+
+        if snapshot:
+            snapshot.parser = get_pbspro_parser()
+        else:
+            self.pbscmd = new_pbscmd(get_pbspro_parser(), config)
+
+    def _load_snapshot(self, config: Dict) -> Optional["ReplayPBSCMD"]:
+        from pbspro.snapshot import default_snapshot_path, load_snapshot
+
+        snapshot_config = config.get("pbspro", {}).get("snapshot", {})
+        if not snapshot_config.get("enabled", True):
+            return None
+
+        snapshot = load_snapshot(
+            default_snapshot_path(config),
+            get_pbspro_parser(),
+            lambda: new_pbscmd(get_pbspro_parser(), config),
+            max_age=float(snapshot_config.get("max_age", 120)),
+        )
+        if snapshot:
+            print(
+                "Using PBS state from {:.0f} seconds ago."
+                " Pass --fresh to query PBS directly.".format(snapshot.age()),
+                file=sys.stderr,
+            )
+        return snapshot
 
-        resource_definitions = read_resource_definitions(self.pbscmd, config)
-        set_pbspro_parser(PBSProParser(resource_definitions))
-        self.pbscmd = PBSCMD(get_pbspro_parser())
+    def _driver(self, config: Dict) -> "SchedulerDriver":
+        from pbspro.driver import PBSProDriver
 
-    def _driver(self, config: Dict) -> SchedulerDriver:
         if self.__driver is None:
-            self.__driver = PBSProDriver(config, self.pbscmd)
+            self.__driver = PBSProDriver(
+                config, self.pbscmd, server_config=self.__server_config
+            )
         return self.__driver
 
     def _initconfig(self, config: Dict) -> None:
@@ -106,7 +195,9 @@ class PBSCLI(clilib.CommonCLI):
             ],
         )
 
-    def _pbs_env(self, pbs_driver: PBSProDriver) -> environment.PBSProEnvironment:
+    def _pbs_env(self, pbs_driver: "PBSProDriver") -> "PBSProEnvironment":
+        from pbspro import environment
+
         if self.__pbs_env is None:
             self.__pbs_env = environment.from_driver(pbs_driver.config, pbs_driver)
         return self.__pbs_env
@@ -114,10 +205,12 @@ class PBSCLI(clilib.CommonCLI):
     def _demand_calc(
         self,
         config: Dict,
-        driver: SchedulerDriver,
-        node_mgr: Optional[NodeManager] = None,
-    ) -> Tuple[DemandCalculator, List[Job]]:
-        pbs_driver: PBSProDriver = driver
+        driver: "SchedulerDriver",
+        node_mgr: Optional["NodeManager"] = None,
+    ) -> Tuple["DemandCalculator", List["Job"]]:
+        from pbspro.autoscaler import new_demand_calculator
+
+        pbs_driver: "PBSProDriver" = driver  # type: ignore
         pbs_env = self._pbs_env(pbs_driver)
         dcalc = new_demand_calculator(
             config, pbs_env=pbs_env, pbs_driver=pbs_driver, node_mgr=node_mgr
@@ -129,9 +222,15 @@ class PBSCLI(clilib.CommonCLI):
         Provides read only interactive shell. type pbsprohelp()
         in the shell for more information
         """
+        from hpc.autoscale.results import DefaultContextHandler
+        from hpc.autoscale.util import partition_single
+
+        from pbspro.nodetable import NodeTable
+
         ctx = DefaultContextHandler("[interactive-readonly]")
 
-        pbs_driver = PBSProDriver(config)
+        # shares the CLI's PBSCMD, i.e. the snapshot if one is in use
+        pbs_driver: "PBSProDriver" = self._driver(config)  # type: ignore
         pbs_env = self._pbs_env(pbs_driver)
 
         def pbsprohelp() -> None:
@@ -164,6 +263,10 @@ class PBSCLI(clilib.CommonCLI):
                 "node_mgr             - ScaleLib NodeManager - interacts with CycleCloud for all node related"
                 + "                    activities - creation, deletion, limits, buckets etc."
             )
+            print(
+                "node_table           - NodeTable of the nodes' numeric resources, e.g."
+                + " node_table.sum_by('ncpus', 'nodearray')"
+            )
             print("pbsprohelp            - This help function")
 
         # try to make the key "15" instead of "15.hostname" if only
@@ -200,6 +303,7 @@ class PBSCLI(clilib.CommonCLI):
             "pbs_driver": pbs_driver,
             "demand_calc": demand_calc,
             "node_mgr": demand_calc.node_mgr,
+            "node_table": NodeTable(demand_calc.node_mgr.get_nodes()),
             "pbsprohelp": pbsprohelp,
         }
 
@@ -209,6 +313,10 @@ class PBSCLI(clilib.CommonCLI):
         """
         Best-effort validation of your PBS environment's compatibility with this autoscaler.
         """
+        from hpc.autoscale.util import is_standalone_dns
+
+        from pbspro.driver import PBSProDriver
+
         pbs_driver = PBSProDriver(config)
         pbs_env = self._pbs_env(pbs_driver)
         sched = pbs_env.default_scheduler
@@ -289,6 +397,188 @@ class PBSCLI(clilib.CommonCLI):
 
         sys.exit(exit)
 
+    def capacity_parser(self, parser: ArgumentParser) -> None:
+        from pbspro.nodetable import GROUP_KEYS
+
+        parser.add_argument(
+            "--by", dest="group_by", choices=list(GROUP_KEYS), default="nodearray"
+        )
+        parser.add_argument("--resources", "-r", type=str_list, default=["ncpus"])
+
+    def capacity(self, config: Dict, group_by: str, resources: List[str]) -> None:
+        """
+        Prints node count and free/total of numeric resources per nodearray,
+        bucket or placement group.
+        """
+        from pbspro.nodetable import NodeTable
+
+        driver = self._driver(config)
+        dcalc, _ = self._demand_calc(config, driver)
+        table = NodeTable(dcalc.node_mgr.get_nodes(), resources)
+
+        counts = table.count_by(group_by)
+        free = [table.sum_by(r, group_by) for r in resources]
+        total = [table.sum_by(r, group_by, available=False) for r in resources]
+
+        rows = [[group_by, "nodes"] + resources]
+        for group in sorted(counts):
+            row = [group or "-", str(counts[group])]
+            for i in range(len(resources)):
+                row.append("{:g}/{:g}".format(free[i][group], total[i][group]))
+            rows.append(row)
+
+        _print_columns(rows)
+
+    def placement_groups_parser(self, parser: ArgumentParser) -> None:
+        parser.set_defaults(read_only=True)
+
+    def placement_groups(self, config: Dict) -> None:
+        """
+        Prints free nodes per placement group and which group each pending
+        colocated job fits in, if any. Useful for debugging stuck MPI jobs.
+        """
+        from pbspro.placementgroups import PlacementGroupIndex
+
+        driver = self._driver(config)
+        dcalc, jobs = self._demand_calc(config, driver)
+        index = PlacementGroupIndex(dcalc.node_mgr.get_nodes())
+
+        rows = [["group_id", "nodearray", "vm_size", "free", "nodes", "free_ncpus"]]
+        for summary in sorted(index.groups.values(), key=lambda s: s.group_id):
+            rows.append(
+                [
+                    summary.group_id,
+                    summary.nodearray,
+                    summary.vm_size,
+                    str(summary.free_count),
+                    str(summary.node_count),
+                    str(summary.free_ncpus),
+                ]
+            )
+        _print_columns(rows)
+
+        matches = index.match_jobs(jobs)
+        if matches:
+            print()
+            rows = [["job", "node_count", "group_id"]]
+            by_name = dict([(job.name, job) for job in jobs])
+            for job_name, group_id in matches.items():
+                rows.append(
+                    [
+                        job_name,
+                        str(by_name[job_name].node_count),
+                        group_id or "(needs new nodes)",
+                    ]
+                )
+            _print_columns(rows)
+
+    def stream_parser(self, parser: ArgumentParser) -> None:
+        from pbspro.output import STREAM_FORMATS, parse_filter
+
+        parser.add_argument("listing", choices=["nodes", "jobs"])
+        parser.add_argument(
+            "--format", dest="stream_format", choices=STREAM_FORMATS, default="jsonl"
+        )
+        parser.add_argument(
+            "--filter",
+            dest="filters",
+            type=parse_filter,
+            action="append",
+            default=[],
+            help="key=value or key!=value, wildcards allowed. May be repeated.",
+        )
+        parser.add_argument("--limit", type=int, default=0)
+        parser.add_argument("--columns", type=str_list, default=None)
+
+    def stream(
+        self,
+        config: Dict,
+        listing: str,
+        stream_format: str,
+        filters: List[Tuple[str, bool, str]],
+        limit: int,
+        columns: Optional[List[str]],
+    ) -> None:
+        """
+        Prints nodes or jobs as JSON lines or TSV, one row at a time, so that
+        large listings can be piped into jq/awk without rendering a table first.
+        """
+        from pbspro.autoscaler import print_demand
+        from pbspro.output import iter_rows, write_rows
+
+        driver = self._driver(config)
+        dcalc, jobs = self._demand_calc(config, driver)
+
+        if listing == "jobs":
+            columns = columns or [
+                "name",
+                "node_count",
+                "colocated",
+                "packing_strategy",
+                "executing_hostnames",
+            ]
+            rows = iter_rows(jobs, columns, filters, limit)
+            write_rows(rows, columns, stream_format, sys.stdout)
+            return
+
+        dcalc.add_jobs(jobs)
+        print_demand(
+            config,
+            dcalc.finish(),
+            output_columns=columns,
+            output_format=stream_format,
+            filters=filters,
+            limit=limit,
+        )
+
+    def autoscale_parser(self, parser: ArgumentParser) -> None:
+        clilib.CommonCLI.autoscale_parser(self, parser)
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            default=False,
+            help="Keep running, autoscaling whenever the trigger hook fires or"
+            + " pbspro.watch_interval seconds have passed.",
+        )
+
+    def autoscale(
+        self,
+        config: Dict,
+        output_columns: Optional[List[str]],
+        output_format: str,
+        dry_run: bool = False,
+        long: bool = False,
+        watch: bool = False,
+    ) -> None:
+        """End-to-end autoscale process, including creation, deletion and joining of nodes."""
+        if not watch:
+            clilib.CommonCLI.autoscale(
+                self, config, output_columns, output_format, dry_run=dry_run, long=long
+            )
+            return
+
+        from hpc.autoscale.results import DefaultContextHandler, register_result_handler
+
+        from pbspro import autoscaler
+
+        ctx_handler = register_result_handler(DefaultContextHandler("[initialization]"))
+
+        def iteration() -> None:
+            # read the resource definitions and server config again, so that new
+            # custom resources are picked up without restarting the service
+            self.__driver = None
+            self.__pbs_env = None
+            iteration_config = copy.deepcopy(config)
+            self._initialize("autoscale", iteration_config)
+            autoscaler.autoscale_pbspro(
+                iteration_config,
+                pbs_driver=self._driver(iteration_config),  # type: ignore
+                ctx_handler=ctx_handler,
+                dry_run=dry_run,
+            )
+
+        autoscaler.watch(config, iteration, ctx_handler)
+
     def offline_parser(self, parser: ArgumentParser) -> None:
         parser.set_defaults(read_only=False)
         self._add_hostnames(parser)
@@ -298,20 +588,17 @@ class PBSCLI(clilib.CommonCLI):
     def offline(
         self, config: Dict, hostnames: List[str], node_names: List[str], comment: str
     ) -> None:
-        driver: PBSProDriver
-        driver_sched, _, nodes = self._find_nodes(config, hostnames, node_names)
-        driver = driver_sched  # type: ignore
         exit_code = 0
         actual_comment = (
             f"cyclecloud keep offline: {comment}"
             if comment
             else "cyclecloud keep offline"
         )
-        for node in nodes:
+        for hostname in self._pbs_hostnames("offline", config, hostnames, node_names):
             try:
-                driver.pbscmd.pbsnodes("-o", node.hostname, "-C", actual_comment)
+                self.pbscmd.pbsnodes("-o", hostname, "-C", actual_comment)
             except CalledProcessError as e:
-                logging.error(f"Could not set {node.hostname} offline - {e}")
+                logging.error(f"Could not set {hostname} offline - {e}")
                 exit_code = 1
         sys.exit(exit_code)
 
@@ -324,24 +611,86 @@ class PBSCLI(clilib.CommonCLI):
     def online(
         self, config: Dict, hostnames: List[str], node_names: List[str], comment: str
     ) -> None:
-        driver: PBSProDriver
-        driver_sched, _, nodes = self._find_nodes(config, hostnames, node_names)
-        driver = driver_sched  # type: ignore
         exit_code = 0
         actual_comment = (
             f"cyclecloud restored: {comment}" if comment else "cyclecloud restored"
         )
-        for node in nodes:
+        for hostname in self._pbs_hostnames("online", config, hostnames, node_names):
             try:
-                driver.pbscmd.pbsnodes("-r", node.hostname, "-C", actual_comment)
+                self.pbscmd.pbsnodes("-r", hostname, "-C", actual_comment)
             except CalledProcessError as e:
-                logging.error(f"Could not set {node.hostname} offline - {e}")
+                logging.error(f"Could not set {hostname} offline - {e}")
                 exit_code = 1
         sys.exit(exit_code)
 
+    def _pbs_hostnames(
+        self, command: str, config: Dict, hostnames: List[str], node_names: List[str]
+    ) -> List[str]:
+        """
+        Hostnames are passed to pbsnodes as is. Only node names have to be
+        looked up in CycleCloud, which needs the full driver.
+        """
+        if not node_names:
+            return hostnames
+        self._read_pbs_state(command, config)
+        _, _, nodes = self._find_nodes(config, hostnames, node_names)
+        return [node.hostname for node in nodes]
+
+    def nodes_parser(self, parser: ArgumentParser) -> None:
+        clilib.CommonCLI.nodes_parser(self, parser)
+        parser.add_argument(
+            "--pbs-only",
+            action="store_true",
+            default=False,
+            help="Only list what pbsnodes -a reports, without asking CycleCloud.",
+        )
+
+    def nodes(self, config: Dict, pbs_only: bool = False, **kwargs: Any) -> None:
+        """Query nodes"""
+        if not pbs_only:
+            self._read_pbs_state("nodes", config)
+            clilib.CommonCLI.nodes(self, config, **kwargs)
+            return
+
+        rows = [["hostname", "state", "jobs", "ccnodeid", "comment"]]
+        for ndict in self.pbscmd.pbsnodes_parsed("-a"):
+            rows.append(
+                [
+                    ndict["name"],
+                    ndict.get("state", ""),
+                    ndict.get("jobs", ""),
+                    ndict.get("resources_available.ccnodeid", ""),
+                    ndict.get("comment", ""),
+                ]
+            )
+        _print_columns(rows)
+
+
+def _definitions_key(
+    resource_definitions: Dict[str, "PBSProResourceDefinition"],
+) -> List[Tuple[str, str, str, bool]]:
+    return sorted(
+        [
+            (r.name, r.type.name, r.flag, r.read_only)
+            for r in resource_definitions.values()
+        ]
+    )
+
+
+def _print_columns(rows: List[List[str]]) -> None:
+    widths = [max([len(row[i]) for row in rows]) for i in range(len(rows[0]))]
+    for row in rows:
+        print("  ".join([c.ljust(w) for c, w in zip(row, widths)]).rstrip())
+
 
 def main(argv: Iterable[str] = None) -> None:
-    clilib.main(argv or sys.argv[1:], "pbspro", PBSCLI())
+    args = list(argv or sys.argv[1:])
+    cli = PBSCLI()
+    # clilib owns the subcommand parsers, so handle --fresh before it sees it
+    if "--fresh" in args:
+        args.remove("--fresh")
+        cli.fresh = True
+    clilib.main(args, "pbspro", cli)
 
 
 if __name__ == "__main__":
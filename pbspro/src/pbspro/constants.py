@@ -55,3 +55,25 @@ class VNodeStates:
     state_unknown_down = "state-unknown,down"
     unresolvable = "unresolvable"
     wait_provisioning = "wait-provisioning"
+
+
+class JoinStatus:
+    """Outcome of the join pipeline for a single node"""
+
+    joined = "joined"
+    restored = "restored"
+    already_joined = "already-joined"
+    skipped = "skipped"
+    failed = "failed"
+
+
+class JobEligibility:
+    """Whether a pending job should create demand, and if not, why"""
+
+    eligible = "eligible"
+    held = "held"
+    dependency = "dependency"
+    execution_time = "execution-time"
+    waiting = "waiting"
+    reservation = "reservation"
+    ineligible = "ineligible"
@@ -0,0 +1,124 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from hpc.autoscale import hpclogging as logging
+
+
+class DemandCache:
+    """
+    Remembers which nodes each job was matched to in the previous iteration,
+    along with a fingerprint of everything the matching depended on - the
+    pending jobs, the nodes and their resources, the buckets and the config.
+    If the fingerprint is unchanged, the same assignments are replayed onto the
+    nodes instead of packing every job again.
+
+    Only the matching is skipped. Joins, timeouts, drains and deletes are time
+    dependent and still run every iteration.
+    """
+
+    def __init__(self) -> None:
+        self.fingerprint: Optional[str] = None
+        # node name -> assignment ids
+        self.assignments: Dict[str, List[str]] = {}
+
+    def store(self, fingerprint: str, nodes: List[Any]) -> None:
+        self.fingerprint = fingerprint
+        self.assignments = dict(
+            [(n.name, sorted(n.assignments)) for n in nodes if n.assignments]
+        )
+
+    def replay(self, fingerprint: str, nodes: List[Any]) -> bool:
+        """
+        Reassigns the cached assignments, if the fingerprint matches and every
+        node they refer to still exists. Returns False if the jobs need to be
+        matched again.
+        """
+        if fingerprint != self.fingerprint:
+            return False
+
+        assignments = self.assignments
+        by_name = dict([(node.name, node) for node in nodes])
+        missing = [name for name in assignments if name not in by_name]
+        if missing:
+            logging.debug("Demand cache refers to unknown nodes %s", missing)
+            return False
+
+        for name, assignment_ids in assignments.items():
+            node = by_name[name]
+            for assignment_id in assignment_ids:
+                if assignment_id not in node.assignments:
+                    node.assign(assignment_id)
+        return True
+
+
+def demand_fingerprint(
+    config: Dict, jobs: List[Any], nodes: List[Any], buckets: List[Any]
+) -> str:
+    """
+    sha1 of the inputs to the demand calculation. Jobs and nodes are sorted,
+    so the order PBS or CycleCloud report them in does not matter.
+    """
+    job_keys = sorted([_dumps(job.to_dict()) for job in jobs if not _is_running(job)])
+    node_keys = sorted(
+        [
+            _dumps(
+                [
+                    node.name,
+                    node.hostname,
+                    node.state,
+                    node.exists,
+                    node.closed,
+                    node.vm_size,
+                    sorted(node.assignments),
+                    node.resources,
+                    node.available,
+                ]
+            )
+            for node in nodes
+        ]
+    )
+    bucket_keys = sorted(
+        [
+            _dumps(
+                [
+                    bucket.nodearray,
+                    bucket.vm_size,
+                    bucket.available_count,
+                    bucket.max_count,
+                ]
+            )
+            for bucket in buckets
+        ]
+    )
+
+    sha = hashlib.sha1()
+    for part in [[_dumps(config)], job_keys, node_keys, bucket_keys]:
+        for key in part:
+            sha.update(key.encode())
+            sha.update(b"\n")
+        sha.update(b"\0")
+    return sha.hexdigest()
+
+
+def _is_running(job: Any) -> bool:
+    return job.metadata.get("job_state") == "running"
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, default=str)
+
+
+_CACHE: Optional[DemandCache] = None
+
+
+def get_demand_cache() -> DemandCache:
+    """
+    One cache per process, so that azpbs autoscale --watch can skip matching
+    when nothing changed since its previous iteration. A cron or hook driven
+    azpbs autoscale is a new process every iteration and always matches.
+    """
+    global _CACHE
+    if _CACHE is None:
+        _CACHE = DemandCache()
+    return _CACHE
@@ -0,0 +1,213 @@
+import json
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from hpc.autoscale import hpclogging as logging
+from hpc.autoscale.job.demand import DemandResult
+from hpc.autoscale.node.node import Node
+
+PREBOOT_ASSIGNMENT_ID = "preboot"
+
+
+def bucket_key(nodearray: str, vm_size: str) -> str:
+    return "{}/{}".format(nodearray, vm_size)
+
+
+def node_bucket_key(node: Node) -> str:
+    return bucket_key(node.nodearray, node.vm_size)
+
+
+def is_demand_history_enabled(config: Dict) -> bool:
+    """
+    Only pbspro.preboot and pbspro.scaledown.demand_window use the history.
+    """
+    pbspro_config = config.get("pbspro", {})
+    return bool(
+        pbspro_config.get("preboot", {}).get("enabled", False)
+        or int(pbspro_config.get("scaledown", {}).get("demand_window", 0)) > 0
+    )
+
+
+class BucketDemand:
+    """
+    Demand history for a single nodearray/vm_size. count is the number of
+    nodes with jobs assigned to them as of the last update, demand an EWMA of
+    that count and arrival_rate an EWMA of how many nodes were added to it per
+    second.
+    """
+
+    def __init__(
+        self,
+        arrival_rate: float = 0.0,
+        demand: float = 0.0,
+        last_demand_time: float = 0.0,
+        count: int = 0,
+    ) -> None:
+        self.arrival_rate = arrival_rate
+        self.demand = demand
+        self.last_demand_time = last_demand_time
+        self.count = count
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "arrival_rate": self.arrival_rate,
+            "demand": self.demand,
+            "last_demand_time": self.last_demand_time,
+            "count": self.count,
+        }
+
+    @staticmethod
+    def from_dict(d: Dict[str, float]) -> "BucketDemand":
+        return BucketDemand(
+            arrival_rate=float(d.get("arrival_rate", 0)),
+            demand=float(d.get("demand", 0)),
+            last_demand_time=float(d.get("last_demand_time", 0)),
+            count=int(d.get("count", 0)),
+        )
+
+    def __repr__(self) -> str:
+        return "BucketDemand(arrival_rate={:.4f}/s, demand={:.1f})".format(
+            self.arrival_rate, self.demand
+        )
+
+
+class DemandHistory:
+    """
+    Per bucket demand history, persisted as json next to the node history so
+    that it survives between autoscale iterations. Only per bucket counts are
+    kept, not the jobs themselves, so arrivals are the growth in nodes with jobs
+    since the last update. Jobs that start on nodes freed up by finished jobs
+    do not count, as they need no new nodes.
+
+    Passing path=None keeps the history in memory only.
+    """
+
+    def __init__(
+        self, path: Optional[str], alpha: float = 0.3, max_decisions: int = 100
+    ) -> None:
+        self.path = path
+        self.alpha = alpha
+        self.max_decisions = max_decisions
+        self.buckets: Dict[str, BucketDemand] = {}
+        self.last_update = 0.0
+        # what preboot decided (or would have decided) recently
+        self.decisions: List[Dict[str, Any]] = []
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def get(self, key: str) -> BucketDemand:
+        return self.buckets.get(key) or BucketDemand()
+
+    def update(self, demand_result: DemandResult, now: Optional[float] = None) -> None:
+        now = now if now is not None else time.time()
+        first_update = self.last_update <= 0
+        elapsed = max(1.0, now - self.last_update)
+
+        demand: Dict[str, int] = {}
+        for node in demand_result.compute_nodes:
+            if not set(node.assignments) - set([PREBOOT_ASSIGNMENT_ID]):
+                continue
+            key = node_bucket_key(node)
+            demand[key] = demand.get(key, 0) + 1
+
+        for key in set(self.buckets.keys()) | set(demand.keys()):
+            bucket = self.buckets.setdefault(key, BucketDemand())
+            count = demand.get(key, 0)
+            bucket.demand = _ewma(self.alpha, count, bucket.demand)
+            if count:
+                bucket.last_demand_time = now
+            # every node looks new the first time, which is not a real arrival rate
+            if not first_update:
+                arrivals = max(0, count - bucket.count)
+                bucket.arrival_rate = _ewma(
+                    self.alpha, arrivals / elapsed, bucket.arrival_rate
+                )
+            bucket.count = count
+
+        self.last_update = now
+
+    def forecast(self, window: int) -> Dict[str, float]:
+        """
+        Expected number of nodes newly submitted jobs will need per bucket over
+        the next window seconds.
+        """
+        return dict([(key, b.arrival_rate * window) for key, b in self.buckets.items()])
+
+    def record_decision(self, decision: Dict[str, Any]) -> None:
+        self.decisions.append(decision)
+        self.decisions = self.decisions[-self.max_decisions :]
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as fw:
+                json.dump(
+                    {
+                        "last_update": self.last_update,
+                        "buckets": dict(
+                            [(k, b.to_dict()) for k, b in self.buckets.items()]
+                        ),
+                        "decisions": self.decisions,
+                    },
+                    fw,
+                )
+            os.rename(tmp_path, self.path)
+        except OSError as e:
+            logging.warning("Could not save demand history to %s: %s", self.path, e)
+
+    def _load(self, path: str) -> None:
+        try:
+            with open(path) as fr:
+                data = json.load(fr)
+            self.last_update = float(data.get("last_update", 0))
+            self.buckets = dict(
+                [
+                    (k, BucketDemand.from_dict(v))
+                    for k, v in data.get("buckets", {}).items()
+                ]
+            )
+            self.decisions = data.get("decisions", [])
+        except (OSError, ValueError, AttributeError) as e:
+            logging.warning("Ignoring unreadable demand history %s: %s", path, e)
+
+    def __repr__(self) -> str:
+        return "DemandHistory({})".format(self.buckets)
+
+
+def plan_preboot(
+    demand_history: DemandHistory,
+    idle_by_bucket: Dict[str, int],
+    window: int,
+    max_nodes: int,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    How many idle nodes each bucket should hold onto, and how many to boot, so
+    that it can absorb the jobs we expect to arrive within the window. At most
+    max_nodes are booted in total, starting with the busiest buckets.
+    """
+    ret: Dict[str, Dict[str, Any]] = {}
+    remaining = max(0, max_nodes)
+    forecast = demand_history.forecast(window)
+
+    for key in sorted(forecast, key=lambda k: -forecast[k]):
+        expected = int(math.floor(forecast[key]))
+        if expected < 1:
+            continue
+        idle = idle_by_bucket.get(key, 0)
+        to_boot = min(max(0, expected - idle), remaining)
+        remaining -= to_boot
+        ret[key] = {
+            "expected": round(forecast[key], 2),
+            "idle": idle,
+            "keep": min(expected, idle),
+            "boot": to_boot,
+        }
+    return ret
+
+
+def _ewma(alpha: float, value: float, previous: float) -> float:
+    return alpha * value + (1 - alpha) * previous
@@ -2,6 +2,8 @@ import datetime
 import os
 import re
 import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from subprocess import CalledProcessError, SubprocessError
 from typing import Any, Dict, List, Optional, Set, Tuple
@@ -25,12 +27,21 @@ from hpc.autoscale.util import (
     partition_single,
 )
 
-from pbspro.constants import PBSProJobStates
+from pbspro.constants import JobEligibility, JoinStatus, PBSProJobStates
+from pbspro.demandhistory import DemandHistory, is_demand_history_enabled
+from pbspro.eligibility import PENDING_STATES, EligibilityClassifier
+from pbspro.jobdescriptor import ConstraintTemplates, JobDescriptor
+from pbspro.jobtracker import JobTracker, get_job_tracker
+from pbspro.journal import TransitionJournal
+from pbspro.limits import RunLimits, job_owner
+from pbspro.nodeindex import NodeIndex, parse_pbs_time
+from pbspro.parallel import ResourceListConverter, new_resource_list_converter
 from pbspro.parser import get_pbspro_parser
-from pbspro.pbscmd import PBSCMD
-from pbspro.pbsqueue import PBSProQueue, read_queues
+from pbspro.pbscmd import PBSCMD, new_pbscmd
+from pbspro.pbsqueue import PBSProLimit, PBSProQueue, read_queues
 from pbspro.resource import PBSProResourceDefinition
 from pbspro.scheduler import PBSProScheduler, read_schedulers
+from pbspro.serverconfig import ServerConfig, read_server_config
 
 # sched_config = "/var/spool/pbs/sched_priv/sched_config"
 
@@ -51,10 +62,11 @@ class PBSProDriver(SchedulerDriver):
         pbscmd: Optional[PBSCMD] = None,
         resource_definitions: Optional[Dict[str, PBSProResourceDefinition]] = None,
         down_timeout: int = 300,
+        server_config: Optional[ServerConfig] = None,
     ) -> None:
         super().__init__("pbspro")
         self.config = config
-        self.pbscmd = pbscmd or PBSCMD(get_pbspro_parser())
+        self.pbscmd = pbscmd or new_pbscmd(get_pbspro_parser(), config)
         self.__queues: Optional[Dict[str, PBSProQueue]] = None
         self.__shared_resources: Optional[Dict[str, SharedResource]]
         self.__resource_definitions = resource_definitions
@@ -64,6 +76,13 @@ class PBSProDriver(SchedulerDriver):
         self.__node_history: Optional[NodeHistory] = None
         self.down_timeout = down_timeout
         self.down_timeout_td = datetime.timedelta(seconds=self.down_timeout)
+        self.__initialized = False
+        # node name -> JoinStatus from the last add_nodes_to_cluster
+        self.join_results: Dict[str, str] = {}
+        # JobEligibility -> count from the last parse_jobs
+        self.job_exclusions: Dict[str, int] = {}
+        self.__journal: Optional[TransitionJournal] = None
+        self.__server_config = server_config
 
     @property
     def autoscale_home(self) -> str:
@@ -71,6 +90,44 @@ class PBSProDriver(SchedulerDriver):
             return os.environ["AUTOSCALE_HOME"]
         return os.path.join("/opt", "cycle", self.name)
 
+    def new_demand_history(self, config: Dict) -> DemandHistory:
+        """
+        Per bucket demand history, stored next to the node history. Read only
+        runs can still read it, they just should not save it. Kept in memory
+        only, and empty, unless preboot or scaledown.demand_window use it.
+        """
+        path: Optional[str] = None
+        if is_demand_history_enabled(config) and os.path.isdir(self.autoscale_home):
+            path = os.path.join(self.autoscale_home, "demand_history.json")
+        return DemandHistory(
+            path, alpha=float(config.get("pbspro", {}).get("demand_history_alpha", 0.3))
+        )
+
+    @property
+    def journal(self) -> TransitionJournal:
+        """
+        Journal of join/drain/delete transitions, stored under autoscale_home.
+        Kept in memory only for read only runs or if pbspro.journal is false.
+        """
+        if self.__journal is None:
+            path: Optional[str] = None
+            if (
+                not self.config.get("read_only", False)
+                and self.config.get("pbspro", {}).get("journal", True)
+                and os.path.isdir(self.autoscale_home)
+            ):
+                path = os.path.join(self.autoscale_home, "transitions.jsonl")
+            self.__journal = TransitionJournal(path)
+        return self.__journal
+
+    @property
+    def server_config(self) -> ServerConfig:
+        """
+        Server, scheduler, queue and resource records from a single qmgr call.
+        """
+        if self.__server_config is None:
+            self.__server_config = read_server_config(self.pbscmd)
+        return self.__server_config
 
     @property
     def resource_definitions(self) -> Dict[str, PBSProResourceDefinition]:
@@ -89,12 +146,17 @@ class PBSProDriver(SchedulerDriver):
     def initialize(self) -> None:
         """
         Placeholder for subclasses to customize initialization
-        By default, we make sure that the ccnodeid exists
+        By default, we make sure that the ccnodeid exists. This is called more than
+        once per iteration, so only do the work once.
         """
+        if self.__initialized:
+            return
+
         try:
             self.pbscmd.qmgr("list", "resource", "ccnodeid")
         except CalledProcessError:
             self.pbscmd.qmgr("create", "resource", "ccnodeid", "type=string,", "flag=h")
+        self.__initialized = True
 
     def preprocess_config(self, config: Dict) -> Dict:
         """
@@ -144,9 +206,7 @@ class PBSProDriver(SchedulerDriver):
     def validate_nodes(
         self, scheduler_nodes: List[SchedulerNode], cc_nodes: List[Node]
     ) -> None:
-        cc_by_node_id = partition_single(
-            cc_nodes, lambda n: n.delayed_node_id.node_id or n.hostname_or_uuid,
-        )
+        cc_by_node_id = NodeIndex(cc_nodes)
         # Special case handling when users change their hostname after the node is already
         # added to the cluster. Note that the hostname MUST MATCH THAT IN CYCLECLOUD!
         # We also only do this for state-unknown,down nodes.
@@ -165,21 +225,17 @@ class PBSProDriver(SchedulerDriver):
                 )
                 should_remove = True
 
-            elif cc_by_node_id[ccnodeid].state == "Failed":
+            elif cc_by_node_id.by_ccnodeid[ccnodeid].state == "Failed":
                 logging.warning(
                     f"{snode.name} {snode.hostname} exists in the cluster but is in a Failed state. Removing it."
                 )
                 should_remove = True
 
             if should_remove:
-                try:
-                    to_remove.append(snode)
-                    self.handle_post_delete([snode])
-                except Exception:
-                    logging.exception(f"Failed to remove node {pbs_hostname}")
+                to_remove.append(snode)
                 continue
 
-            cc_node = cc_by_node_id[ccnodeid]
+            cc_node = cc_by_node_id.by_ccnodeid[ccnodeid]
             cc_hostname = cc_node.hostname.lower()
 
             if pbs_hostname != cc_hostname:
@@ -196,13 +252,17 @@ class PBSProDriver(SchedulerDriver):
                     logging.warning(
                         f"Removing node {pbs_hostname} so that the correct hostname ({cc_hostname}) can join."
                     )
-                    try:
-                        to_remove.append(snode)
-                        self.handle_post_delete([snode])
-                    except Exception:
-                        logging.exception(f"Failed to remove node {pbs_hostname}")
-        for snode in to_remove:
-            scheduler_nodes.remove(snode)
+                    to_remove.append(snode)
+        if to_remove:
+            try:
+                self.handle_post_delete(to_remove)
+            except Exception:
+                logging.exception(
+                    "Failed to remove nodes %s", [n.hostname for n in to_remove]
+                )
+            removed = set([id(snode) for snode in to_remove])
+            # filter in place - the caller holds on to this list
+            scheduler_nodes[:] = [n for n in scheduler_nodes if id(n) not in removed]
 
     def handle_failed_nodes(self, nodes: List[Node]) -> List[Node]:
         to_delete = []
@@ -252,12 +312,11 @@ class PBSProDriver(SchedulerDriver):
         return []
 
     def _down_long_enough(self, now: datetime.datetime, node: Node) -> bool:
-        last_state_change_time_str = node.metadata.get("last_state_change_time")
+        last_state_change_time = parse_pbs_time(
+            node.metadata.get("last_state_change_time") or ""
+        )
 
-        if last_state_change_time_str:
-            last_state_change_time = datetime.datetime.strptime(
-                last_state_change_time_str, "%a %b %d %H:%M:%S %Y"
-            )
+        if last_state_change_time:
             delta = now - last_state_change_time
             if delta > self.down_timeout_td:
                 return True
@@ -282,169 +341,277 @@ class PBSProDriver(SchedulerDriver):
         return now > omega
 
     def add_nodes_to_cluster(self, nodes: List[Node]) -> List[Node]:
+        """
+        Joins nodes to PBS. Each node goes through the same pipeline - validate,
+        create, set resources, set ccnodeid and finally online. The nodes are
+        independent of each other, so pbspro.join_concurrency > 1 runs the pipeline
+        for that many nodes at a time. The returned list is always in the same
+        order as the nodes passed in.
+        """
         self.initialize()
         node_history = self.new_node_history(self.config)
         ignored_nodes = node_history.find_ignored()
-        ignored_node_ids = [n[0] for n in ignored_nodes if n[0]]
+        ignored_node_ids = set([n[0] for n in ignored_nodes if n[0]])
 
         all_nodes = self.pbscmd.pbsnodes_parsed("-a")
         by_ccnodeid = partition(
             all_nodes, lambda x: x.get("resources_available.ccnodeid")
         )
+        by_hostname = partition_single(all_nodes, lambda x: x["name"].lower())
 
-        ret = []
-        for node in nodes:
-            if node.metadata.get("_marked_offline_this_iteration_"):
-                continue
+        self._reconcile_in_flight(nodes, by_hostname)
 
-            if node.delayed_node_id.node_id in ignored_node_ids:
-                node.metadata["pbs_state"] = "removed!"
-                continue
+        def join(node: Node) -> str:
+            return self._join_node(node, ignored_node_ids, by_ccnodeid, by_hostname)
 
-            if not node.hostname:
-                continue
+        concurrency = max(
+            1, int(self.config.get("pbspro", {}).get("join_concurrency", 1))
+        )
+        if concurrency > 1 and len(nodes) > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                statuses = list(pool.map(join, nodes))
+        else:
+            statuses = [join(node) for node in nodes]
 
-            if not node.private_ip:
-                continue
+        self.join_results = dict(
+            [(node.name, status) for node, status in zip(nodes, statuses)]
+        )
 
-            if node.state == "Failed":
-                continue
+        summary: Dict[str, int] = {}
+        for status in statuses:
+            summary[status] = summary.get(status, 0) + 1
+        if summary:
+            logging.debug("Join results: %s", summary)
 
-            # special handling of "keep_offline" created during preprocess_node_mgr
-            if "keep_offline" in node.assignments:
-                continue
+        return [
+            node for node, status in zip(nodes, statuses) if status == JoinStatus.joined
+        ]
 
-            node_id = node.delayed_node_id.node_id
+    def _reconcile_in_flight(
+        self, nodes: List[Node], by_hostname: Dict[str, Dict[str, str]]
+    ) -> None:
+        """
+        Finishes transitions that were interrupted, i.e. a 'begin' without an
+        'end', based on what pbsnodes -a reports now. Joins of nodes we are
+        about to join again are resumed by _join_node. Anything else that did
+        not take effect is marked failed, and is retried if it is still needed.
+        """
+        in_flight = self.journal.in_flight()
+        if not in_flight:
+            return
+
+        logging.info(
+            "Reconciling %s node transitions that did not finish: %s",
+            len(in_flight),
+            ["{}({})".format(r["hostname"], r["transition"]) for r in in_flight],
+        )
+        joining = set([n.delayed_node_id.node_id for n in nodes])
 
-            if not node_id:
-                logging.error("%s does not have a nodeid! Skipping", node)
-                continue
+        for record in in_flight:
+            transition = record["transition"]
+            node_id = record["node_id"]
+            hostname = record["hostname"]
+            pbs_record = by_hostname.get(hostname.lower())
 
-            if node_id in by_ccnodeid:
-                skip_node = False
-                for ndict in by_ccnodeid[node_id]:
-                    if ndict["name"].lower() != node.hostname.lower():
-                        logging.error(
-                            "Duplicate hostname found for the same node id! %s and %s. See 'valid_hostnames' in autoscale as a possible workaround.",
-                            node,
-                            ndict["name"],
-                        )
-                        skip_node = True
-                        break
-                if skip_node:
+            if transition == "join":
+                if node_id in joining:
                     continue
-
-            if not is_valid_hostname(self.config, node):
-                continue
-
-            if not self._validate_reverse_dns(node):
-                logging.fine(
-                    "%s still has a hostname that can not be looked via reverse dns. This should repair itself.",
-                    node,
+                # ccnodeid is set last, so it is only there if the join finished
+                done = bool(
+                    pbs_record
+                    and pbs_record.get("resources_available.ccnodeid") == node_id
                 )
-                continue
+            elif transition == "drain":
+                done = bool(
+                    pbs_record
+                    and "offline" in pbs_record.get("state", "")
+                    and pbs_record.get("comment", "").startswith("cyclecloud offline")
+                )
+            else:
+                done = not pbs_record
 
-            if not node.resources.get("ccnodeid"):
-                logging.info(
-                    "%s is not managed by CycleCloud, or at least 'ccnodeid' is not defined. Ignoring",
-                    node,
+            if done:
+                self.journal.end(transition, node_id, hostname)
+            else:
+                logging.warning(
+                    "Could not finish %s of %s, marking it failed.",
+                    transition,
+                    hostname,
                 )
-                continue
-            try:
-                try:
-                    ndicts = self.pbscmd.qmgr_parsed("list", "node", node.hostname)
-                    if ndicts and ndicts[0].get("resources_available.ccnodeid"):
-                        comment = ndicts[0].get("comment", "")
-
-                        if "offline" in ndicts[0].get("state", "") and (
-                            comment.startswith("cyclecloud offline")
-                            or comment.startswith("cyclecloud joined")
-                            or comment.startswith("cyclecloud restored")
-                        ):
-                            logging.info(
-                                "%s is offline. Setting it back to online", node
-                            )
-                            self.pbscmd.pbsnodes(
-                                "-r", node.hostname, "-C", "cyclecloud restored"
-                            )
-                        else:
-                            logging.fine(
-                                "ccnodeid is already defined on %s. Skipping", node
-                            )
-                        continue
-                    # TODO RDH should we just delete it instead?
-                    logging.info(
-                        "%s already exists in this cluster. Setting resources.", node
-                    )
-                except CalledProcessError:
-                    logging.info(
-                        "%s does not exist in this cluster yet. Creating.", node
+                self.journal.failed(transition, node_id, hostname)
+
+    def _join_node(
+        self,
+        node: Node,
+        ignored_node_ids: Set[str],
+        by_ccnodeid: Dict[str, List[Dict[str, str]]],
+        by_hostname: Dict[str, Dict[str, str]],
+    ) -> str:
+        if node.metadata.get("_marked_offline_this_iteration_"):
+            return JoinStatus.skipped
+
+        if node.delayed_node_id.node_id in ignored_node_ids:
+            node.metadata["pbs_state"] = "removed!"
+            return JoinStatus.skipped
+
+        if not node.hostname:
+            return JoinStatus.skipped
+
+        if not node.private_ip:
+            return JoinStatus.skipped
+
+        if node.state == "Failed":
+            return JoinStatus.skipped
+
+        # special handling of "keep_offline" created during preprocess_node_mgr
+        if "keep_offline" in node.assignments:
+            return JoinStatus.skipped
+
+        node_id = node.delayed_node_id.node_id
+
+        if not node_id:
+            logging.error("%s does not have a nodeid! Skipping", node)
+            return JoinStatus.skipped
+
+        if node_id in by_ccnodeid:
+            for ndict in by_ccnodeid[node_id]:
+                if ndict["name"].lower() != node.hostname.lower():
+                    logging.error(
+                        "Duplicate hostname found for the same node id! %s and %s. See 'valid_hostnames' in autoscale as a possible workaround.",
+                        node,
+                        ndict["name"],
                     )
-                    self.pbscmd.qmgr("create", "node", node.hostname)
+                    return JoinStatus.skipped
 
-                for res_name, res_value in node.resources.items():
-                    # we set ccnodeid last, so that we can see that we have completely joined a node
-                    # if and only if ccnodeid has been set
-                    if res_name == "ccnodeid":
-                        continue
+        if not is_valid_hostname(self.config, node):
+            return JoinStatus.skipped
 
-                    if res_value is None:
-                        continue
+        if not self._validate_reverse_dns(node):
+            logging.fine(
+                "%s still has a hostname that can not be looked via reverse dns. This should repair itself.",
+                node,
+            )
+            return JoinStatus.skipped
 
-                    # TODO RDH track down
-                    if res_name == "group_id" and res_value == "None":
-                        continue
+        if not node.resources.get("ccnodeid"):
+            logging.info(
+                "%s is not managed by CycleCloud, or at least 'ccnodeid' is not defined. Ignoring",
+                node,
+            )
+            return JoinStatus.skipped
+        try:
+            pbs_record = by_hostname.get(node.hostname.lower())
+            if (
+                pbs_record
+                and pbs_record.get("resources_available.ccnodeid") == node_id
+                and self.journal.is_joined(node_id, node.hostname)
+            ):
+                # we finished joining this node in an earlier iteration, so
+                # pbsnodes -a has everything we need - no need to ask qmgr.
+                return self._reconcile_joined_node(node, pbs_record)
 
-                    # skip things like host which are useful to set default resources on non-existent
-                    # nodes for autoscale packing, but not on actual nodes
-                    if res_name in self.read_only_resources:
-                        continue
+            try:
+                ndicts = self.pbscmd.qmgr_parsed("list", "node", node.hostname)
+                if ndicts and ndicts[0].get("resources_available.ccnodeid"):
+                    return self._reconcile_joined_node(node, ndicts[0])
+                # TODO RDH should we just delete it instead?
+                logging.info(
+                    "%s already exists in this cluster. Setting resources.", node
+                )
+                self.journal.begin("join", node_id, node.hostname)
+            except CalledProcessError:
+                logging.info("%s does not exist in this cluster yet. Creating.", node)
+                self.journal.begin("join", node_id, node.hostname)
+                self.pbscmd.qmgr("create", "node", node.hostname)
+
+            for res_name, res_value in node.resources.items():
+                # we set ccnodeid last, so that we can see that we have completely joined a node
+                # if and only if ccnodeid has been set
+                if res_name == "ccnodeid":
+                    continue
 
-                    if res_name not in self.resource_definitions:
-                        # TODO bump to a warning?
-                        logging.fine(
-                            "%s is an unknown PBS resource for node %s. Skipping this resource",
-                            res_name,
-                            node,
-                        )
-                        continue
-                    res_value_str: str
+                if res_value is None:
+                    continue
 
-                    # pbs size does not support decimals
-                    if isinstance(res_value, ht.Size):
-                        res_value_str = "{}{}".format(
-                            int(res_value.value), res_value.magnitude
-                        )
-                    elif isinstance(res_value, bool):
-                        res_value_str = "1" if bool else "0"
-                    else:
-                        res_value_str = str(res_value)
+                # TODO RDH track down
+                if res_name == "group_id" and res_value == "None":
+                    continue
+
+                # skip things like host which are useful to set default resources on non-existent
+                # nodes for autoscale packing, but not on actual nodes
+                if res_name in self.read_only_resources:
+                    continue
 
-                    self.pbscmd.qmgr(
-                        "set",
-                        "node",
-                        node.hostname,
-                        "resources_available.{}={}".format(res_name, res_value_str),
+                if res_name not in self.resource_definitions:
+                    # TODO bump to a warning?
+                    logging.fine(
+                        "%s is an unknown PBS resource for node %s. Skipping this resource",
+                        res_name,
+                        node,
                     )
+                    continue
+                res_value_str: str
+
+                # pbs size does not support decimals
+                if isinstance(res_value, ht.Size):
+                    res_value_str = "{}{}".format(
+                        int(res_value.value), res_value.magnitude
+                    )
+                elif isinstance(res_value, bool):
+                    res_value_str = "1" if bool else "0"
+                else:
+                    res_value_str = str(res_value)
 
                 self.pbscmd.qmgr(
                     "set",
                     "node",
                     node.hostname,
-                    "resources_available.{}={}".format(
-                        "ccnodeid", node.resources["ccnodeid"]
-                    ),
-                )
-                self.pbscmd.pbsnodes("-r", node.hostname, "-C", "cyclecloud joined")
-                ret.append(node)
-            except SubprocessError as e:
-                logging.error(
-                    "Could not fully add %s to cluster: %s. Will attempt next cycle",
-                    node,
-                    e,
+                    "resources_available.{}={}".format(res_name, res_value_str),
                 )
 
-        return ret
+            self.pbscmd.qmgr(
+                "set",
+                "node",
+                node.hostname,
+                "resources_available.{}={}".format(
+                    "ccnodeid", node.resources["ccnodeid"]
+                ),
+            )
+            self.pbscmd.pbsnodes("-r", node.hostname, "-C", "cyclecloud joined")
+            self.journal.end("join", node_id, node.hostname)
+            return JoinStatus.joined
+        except SubprocessError as e:
+            logging.error(
+                "Could not fully add %s to cluster: %s. Will attempt next cycle",
+                node,
+                e,
+            )
+            self.journal.failed("join", node_id, node.hostname)
+            return JoinStatus.failed
+
+    def _reconcile_joined_node(self, node: Node, ndict: Dict[str, str]) -> str:
+        """
+        ccnodeid is already set on this node, so it was fully joined at some
+        point. Bring it back online if we were the ones who took it offline.
+        """
+        node_id = node.delayed_node_id.node_id
+        comment = ndict.get("comment", "")
+
+        if "offline" in ndict.get("state", "") and (
+            comment.startswith("cyclecloud offline")
+            or comment.startswith("cyclecloud joined")
+            or comment.startswith("cyclecloud restored")
+        ):
+            logging.info("%s is offline. Setting it back to online", node)
+            self.pbscmd.pbsnodes("-r", node.hostname, "-C", "cyclecloud restored")
+            self.journal.end("join", node_id, node.hostname)
+            return JoinStatus.restored
+
+        logging.fine("ccnodeid is already defined on %s. Skipping", node)
+        if not self.journal.is_joined(node_id, node.hostname):
+            # e.g. joined before the journal existed
+            self.journal.end("join", node_id, node.hostname)
+        return JoinStatus.already_joined
 
     def handle_post_join_cluster(self, nodes: List[Node]) -> List[Node]:
         return nodes
@@ -502,10 +669,13 @@ class PBSProDriver(SchedulerDriver):
                         logging.warning(
                             f"Unexpected failure while running 'pbsnodes {node.hostname}' - {e.stderr}"
                         )
+                journal_key = node.delayed_node_id.node_id or node.hostname
                 try:
+                    self.journal.begin("drain", journal_key, node.hostname)
                     self.pbscmd.pbsnodes(
                         "-o", node.hostname, "-C", "cyclecloud offline"
                     )
+                    self.journal.end("drain", journal_key, node.hostname)
                     node.metadata["_marked_offline_this_iteration_"] = True
 
                     # # Due to a delay in when pbsnodes -o exits to when pbsnodes -a
@@ -517,6 +687,7 @@ class PBSProDriver(SchedulerDriver):
                     node.metadata["pbs_state"] = "offline"
 
                 except CalledProcessError as e:
+                    self.journal.failed("drain", journal_key, node.hostname)
                     if node.private_ip:
                         logging.error(
                             "'pbsnodes -o %s' failed and this node will not be scaled down: %s",
@@ -526,31 +697,59 @@ class PBSProDriver(SchedulerDriver):
         return ret
 
     def handle_post_delete(self, nodes: List[Node]) -> List[Node]:
+        """
+        Removes the nodes from PBS with a single qmgr call. Nodes that are not in
+        this iteration's pbsnodes output, and that we did not try to join since,
+        are already gone. Returns the nodes that are no longer in PBS.
+        """
         ret = []
+        existing = set(
+            [n.hostname.lower() for n in self.parse_scheduler_nodes() if n.hostname]
+        )
+        to_delete: Dict[str, Node] = {}
         for node in nodes:
             if not node.hostname:
                 continue
 
-            try:
-                self.pbscmd.qmgr("list", "node", node.hostname)
-            except CalledProcessError as e:
-                if "Server has no node list" in str(e) or node.state == "Failed":
-                    ret.append(node)
-                    continue
-                logging.error(
-                    "Could not list node with hostname %s - %s", node.hostname, e
-                )
+            # a join that failed part way may have created the node already
+            join_attempted = self.join_results.get(node.name) in [
+                JoinStatus.joined,
+                JoinStatus.failed,
+            ]
+            if node.hostname.lower() not in existing and not join_attempted:
+                logging.fine("%s is not in PBS, nothing to delete", node.hostname)
+                ret.append(node)
                 continue
+            to_delete[node.hostname] = node
 
-            try:
-                self.pbscmd.qmgr("delete", "node", node.hostname)
+        if not to_delete:
+            return ret
+
+        for hostname, node in to_delete.items():
+            journal_key = node.delayed_node_id.node_id or hostname
+            self.journal.begin("delete", journal_key, hostname)
+
+        try:
+            failures = self.pbscmd.qmgr_script(
+                *[("delete", "node", hostname) for hostname in to_delete]
+            )
+        except CalledProcessError as e:
+            failures = dict([(hostname, str(e)) for hostname in to_delete])
+        failures = dict([(k.lower(), v) for k, v in failures.items()])
+
+        for hostname, node in to_delete.items():
+            journal_key = node.delayed_node_id.node_id or hostname
+            error = failures.get(hostname.lower())
+            if error is None or "Unknown node" in error:
+                self.journal.end("delete", journal_key, hostname)
                 node.metadata["pbs_state"] = "deleted"
                 ret.append(node)
-            except CalledProcessError as e:
+            else:
+                self.journal.failed("delete", journal_key, hostname)
                 logging.error(
                     "Could not remove %s from cluster: %s. Will retry next cycle.",
                     node,
-                    e,
+                    error,
                 )
         return ret
 
@@ -559,7 +758,9 @@ class PBSProDriver(SchedulerDriver):
 
     @lru_cache(1)
     def read_schedulers(self) -> Dict[str, PBSProScheduler]:
-        return read_schedulers(self.pbscmd, self.resource_definitions)
+        return read_schedulers(
+            self.pbscmd, self.resource_definitions, self.server_config
+        )
 
     @lru_cache(1)
     def read_default_scheduler(self) -> PBSProScheduler:
@@ -577,7 +778,11 @@ class PBSProDriver(SchedulerDriver):
         if self.__queues is None:
             self.__shared_resources = shared_resources
             self.__queues = read_queues(
-                self.config, self.pbscmd, self.resource_definitions, shared_resources
+                self.config,
+                self.pbscmd,
+                self.resource_definitions,
+                shared_resources,
+                self.server_config,
             )
         assert shared_resources == self.__shared_resources
         return self.__queues
@@ -587,11 +792,61 @@ class PBSProDriver(SchedulerDriver):
         queues: Dict[str, PBSProQueue],
         resources_for_scheduling: Set[str],
         force: bool = False,
+        server_limits: Optional[Dict[str, PBSProLimit]] = None,
+        schedulers: Optional[Dict[str, PBSProScheduler]] = None,
     ) -> List[Job]:
+        """
+        Pass in schedulers to handle multi-sched partitions. Without them, or if
+        there is only the default scheduler, every job is parsed with
+        resources_for_scheduling.
+        """
 
         if force or self.__jobs_cache is None:
-            self.__jobs_cache = parse_jobs(
-                self.pbscmd, self.resource_definitions, queues, resources_for_scheduling
+            run_limits = None
+            if self.config.get("pbspro", {}).get("enforce_run_limits", True):
+                run_limits = RunLimits(
+                    server_limits or {},
+                    dict([(q.name, q.limits) for q in queues.values()]),
+                )
+            eligibility = EligibilityClassifier(
+                int(self.config.get("pbspro", {}).get("eligibility_lookahead", 600))
+            )
+            job_tracker = None
+            if self.config.get("pbspro", {}).get("incremental_jobs", True):
+                job_tracker = get_job_tracker()
+            converter = new_resource_list_converter(self.config, get_pbspro_parser())
+            active = [s for s in (schedulers or {}).values() if s.is_active]
+            if any([s.partitions for s in active]):
+                self.__jobs_cache = parse_partitioned_jobs(
+                    self.pbscmd,
+                    self.resource_definitions,
+                    queues,
+                    active,
+                    run_limits,
+                    eligibility,
+                    job_tracker,
+                    converter,
+                )
+            else:
+                self.__jobs_cache = parse_jobs(
+                    self.pbscmd,
+                    self.resource_definitions,
+                    queues,
+                    resources_for_scheduling,
+                    run_limits,
+                    eligibility,
+                    job_tracker=job_tracker,
+                    converter=converter,
+                )
+            eligibility.log_summary()
+            if job_tracker is not None:
+                job_tracker.log_summary()
+            self.job_exclusions = dict(
+                [
+                    (k, v)
+                    for k, v in eligibility.counts.items()
+                    if k != JobEligibility.eligible
+                ]
             )
 
         return self.__jobs_cache
@@ -605,7 +860,12 @@ class PBSProDriver(SchedulerDriver):
         scheduler = self.read_default_scheduler()
         queues = self.read_queues(scheduler.resource_state.shared_resources)
         nodes = self.parse_scheduler_nodes()
-        jobs = self.parse_jobs(queues, scheduler.resources_for_scheduling)
+        jobs = self.parse_jobs(
+            queues,
+            scheduler.resources_for_scheduling,
+            server_limits=scheduler.limits,
+            schedulers=self.read_schedulers(),
+        )
         return jobs, nodes
 
     def parse_scheduler_nodes(self, force: bool = False,) -> List[Node]:
@@ -693,22 +953,182 @@ class PBSProNodeQueue(NodeQueue):
         return super().early_bailout(node)
 
 
+def count_running_jobs(response: Dict, run_limits: RunLimits) -> None:
+    """
+    First pass - what the running jobs already count against each limit
+    """
+    for jdict in response.get("Jobs", {}).values():
+        if jdict.get("job_state") not in [
+            PBSProJobStates.Running,
+            PBSProJobStates.Exiting,
+        ]:
+            continue
+        if not jdict.get("queue"):
+            continue
+        user, group, project = job_owner(jdict)
+        run_limits.add_running_job(
+            jdict["queue"], user, group, project, jdict.get("Resource_List", {})
+        )
+
+
+def parse_partitioned_jobs(
+    pbscmd: PBSCMD,
+    resource_definitions: Dict[str, PBSProResourceDefinition],
+    queues: Dict[str, PBSProQueue],
+    schedulers: List[PBSProScheduler],
+    run_limits: Optional[RunLimits] = None,
+    eligibility: Optional[EligibilityClassifier] = None,
+    job_tracker: Optional[JobTracker] = None,
+    converter: Optional[ResourceListConverter] = None,
+) -> List[Job]:
+    """
+    multi-sched: each scheduler's jobs are parsed with its own queues and the
+    resources from its own sched_config. The default scheduler also gets the jobs
+    of any queue no other scheduler claims, so those are still reported.
+    qstat is only run once, and a failure in one partition does not stop the rest.
+    """
+    response: Dict = pbscmd.qstat_json("-f", "-t")
+    all_jobs: Dict[str, Dict] = response.get("Jobs", {})
+    if eligibility:
+        eligibility.add_jobs(all_jobs)
+    if run_limits:
+        count_running_jobs(response, run_limits)
+    if job_tracker is not None:
+        job_tracker.retain([job_id.split(".")[0] for job_id in all_jobs])
+
+    claimed: Set[str] = set()
+    by_scheduler: Dict[str, Dict[str, PBSProQueue]] = {}
+    for sched in schedulers:
+        sched_queues = dict(
+            [(qname, q) for qname, q in queues.items() if sched.serves_queue(q)]
+        )
+        by_scheduler[sched.name] = sched_queues
+        claimed.update(sched_queues.keys())
+
+    ret: List[Job] = []
+    for sched in schedulers:
+        sched_queues = by_scheduler[sched.name]
+        sched_jobs = dict(
+            [
+                (job_id, jdict)
+                for job_id, jdict in all_jobs.items()
+                if jdict.get("queue") in sched_queues
+                or (sched.is_default and jdict.get("queue") not in claimed)
+            ]
+        )
+        if not sched_jobs:
+            continue
+
+        start = time.time()
+        try:
+            jobs = parse_jobs(
+                pbscmd,
+                resource_definitions,
+                sched_queues,
+                sched.resources_for_scheduling,
+                run_limits,
+                eligibility,
+                jobs_response={"Jobs": sched_jobs},
+                job_tracker=job_tracker,
+                converter=converter,
+            )
+        except Exception:
+            logging.exception(
+                "Could not parse the jobs of scheduler %s. Skipping them.", sched.name
+            )
+            continue
+        logging.debug(
+            "Parsed %d jobs for scheduler %s in %.2f seconds",
+            len(jobs),
+            sched.name,
+            time.time() - start,
+        )
+        ret.extend(jobs)
+    return ret
+
+
 def parse_jobs(
     pbscmd: PBSCMD,
     resource_definitions: Dict[str, PBSProResourceDefinition],
     queues: Dict[str, PBSProQueue],
     resources_for_scheduling: Set[str],
+    run_limits: Optional[RunLimits] = None,
+    eligibility: Optional[EligibilityClassifier] = None,
+    jobs_response: Optional[Dict] = None,
+    job_tracker: Optional[JobTracker] = None,
+    converter: Optional[ResourceListConverter] = None,
 ) -> List[Job]:
     """
     Parses PBS qstat output and creates relevant hpc.autoscale.job.job.Job objects
+    See parse_job_descriptors
+    """
+    descriptors = parse_job_descriptors(
+        pbscmd,
+        resource_definitions,
+        queues,
+        resources_for_scheduling,
+        run_limits,
+        eligibility,
+        jobs_response,
+        job_tracker,
+        converter,
+    )
+    return [d.to_job() for d in descriptors]
+
+
+def parse_job_descriptors(
+    pbscmd: PBSCMD,
+    resource_definitions: Dict[str, PBSProResourceDefinition],
+    queues: Dict[str, PBSProQueue],
+    resources_for_scheduling: Set[str],
+    run_limits: Optional[RunLimits] = None,
+    eligibility: Optional[EligibilityClassifier] = None,
+    jobs_response: Optional[Dict] = None,
+    job_tracker: Optional[JobTracker] = None,
+    converter: Optional[ResourceListConverter] = None,
+    templates: Optional[ConstraintTemplates] = None,
+) -> List[JobDescriptor]:
+    """
+    Parses PBS qstat output into a JobDescriptor per job (or per chunk of a
+    multi-chunk job). Identical constraints are shared through templates, so
+    pass the same ConstraintTemplates to share them across calls.
+
+    jobs_response is a subset of the qstat -f -t response, e.g. one partition's
+    jobs. The caller is then responsible for adding all jobs to eligibility and
+    the running jobs to run_limits, and for calling job_tracker.retain.
+
+    job_tracker skips parsing the Resource_List of jobs that have not changed
+    since the previous call, converter parses the rest, by default serially.
     """
     parser = get_pbspro_parser()
+    converter = converter or ResourceListConverter(parser)
+    if templates is None:
+        templates = ConstraintTemplates()
     # alternate format triggered by
     # -a, -i, -G, -H, -M, -n, -r, -s, -T, or -u
-    ret: List[Job] = []
+    ret: List[JobDescriptor] = []
+
+    response: Dict
+    if jobs_response is not None:
+        response = jobs_response
+    else:
+        response = pbscmd.qstat_json("-f", "-t")
+        if eligibility:
+            eligibility.add_jobs(response.get("Jobs", {}))
+
+        if run_limits:
+            count_running_jobs(response, run_limits)
+
+        if job_tracker is not None:
+            job_tracker.retain(
+                [job_id.split(".")[0] for job_id in response.get("Jobs", {})]
+            )
 
-    response: Dict = pbscmd.qstat_json("-f", "-t")
+    host_resources = set(
+        [name for name, rdef in resource_definitions.items() if rdef.is_host]
+    )
 
+    pending: List[Tuple[str, Dict, PBSProQueue]] = []
     for job_id, jdict in response.get("Jobs", {}).items():
         job_id = job_id.split(".")[0]
 
@@ -717,7 +1137,10 @@ def parse_jobs(
             logging.warning("No job_state defined for job %s. Skipping", job_id)
             continue
 
-        if job_state != PBSProJobStates.Queued:
+        if job_state not in PENDING_STATES:
+            continue
+
+        if not eligibility and job_state != PBSProJobStates.Queued:
             continue
 
         # ensure we don't autoscale jobs from disabled or non-started queues
@@ -738,13 +1161,40 @@ def parse_jobs(
         # handle array vs individual jobs
         if jdict.get("array"):
             continue
-        else:
-            iterations = 1
-            remaining = 1
 
-        res_list = jdict["Resource_List"]
-        res_list["schedselect"] = jdict["schedselect"]
-        rdict = parser.convert_resource_list(res_list)
+        if eligibility:
+            reason = eligibility.classify(jdict)
+            if reason != JobEligibility.eligible:
+                logging.fine("Skipping job %s: %s", job_id, reason)
+                continue
+
+        jdict["Resource_List"]["schedselect"] = jdict["schedselect"]
+        pending.append((job_id, jdict, queue))
+
+    rdicts: Dict[str, Dict[str, Any]] = {}
+    to_convert: Dict[str, Dict[str, Any]] = {}
+    for job_id, jdict, _ in pending:
+        cached = None
+        if job_tracker is not None:
+            cached = job_tracker.lookup(parser, job_id, jdict)
+        if cached is None:
+            to_convert[job_id] = jdict["Resource_List"]
+        else:
+            rdicts[job_id] = cached
+
+    if to_convert:
+        converted = converter.convert(to_convert)
+        if job_tracker is not None:
+            for job_id, jdict, _ in pending:
+                if job_id in converted:
+                    job_tracker.store(job_id, jdict, converted[job_id])
+        rdicts.update(converted)
+
+    for job_id, jdict, queue in pending:
+        qname = queue.name
+        iterations = 1
+        remaining = 1
+        rdict = rdicts[job_id]
 
         pack = (
             PackingStrategy.PACK
@@ -790,10 +1240,6 @@ def parse_jobs(
             if "ncpus" not in chunk_base:
                 chunk["ncpus"] = chunk["ncpus"] // effective_node_count
 
-            if smp_multiplier > 1:
-                for key, value in list(chunk_base.items()):
-                    if isinstance(value, (int, float)):
-                        chunk_base[key] = value * smp_multiplier
             # do this _after_ rdict, since the chunks
             # will override the top level resources
             # e.g. notice that ncpus=4. This will be the rdict value
@@ -803,6 +1249,12 @@ def parse_jobs(
             # Resource_List.select = 2:ncpus=2
 
             chunk.update(chunk_base)
+
+            if smp_multiplier > 1:
+                # scale the copy - chunk_base may be shared via the job tracker
+                for key, value in chunk_base.items():
+                    if isinstance(value, (int, float)):
+                        chunk[key] = value * smp_multiplier
             working_constraint: Dict[str, Any] = {}
             constraints = [working_constraint]
 
@@ -842,12 +1294,10 @@ def parse_jobs(
                 # required for get_non_host_constraints
                 job_resources[rname] = rvalue
 
-                resource_def = resource_definitions.get(rname)
-
                 # constraints are for the node/host
                 # queue/scheduler level ones will be added using
                 # > queue.get_non_host_constraints(job_resource)
-                if not resource_def or not resource_def.is_host:
+                if rname not in host_resources:
                     continue
 
                 if rname not in working_constraint:
@@ -863,16 +1313,31 @@ def parse_jobs(
             )
             constraints.extend(queue_constraints)
 
-            job = Job(
-                name=my_job_id,
-                constraints=constraints,
-                iterations=iterations,
-                node_count=node_count,
-                colocated=colocated,
-                packing_strategy=pack,
+            if run_limits:
+                user, group, project = job_owner(jdict)
+                constraints.extend(
+                    run_limits.get_constraints(
+                        qname,
+                        user,
+                        group,
+                        project,
+                        chunk,
+                        1.0 / (effective_node_count * len(rdict["schedselect"])),
+                    )
+                )
+
+            ret.append(
+                JobDescriptor(
+                    name=my_job_id,
+                    constraints=constraints,
+                    iterations=iterations,
+                    remaining=remaining,
+                    node_count=node_count,
+                    colocated=colocated,
+                    packing_strategy=pack,
+                    templates=templates,
+                )
             )
-            job.iterations_remaining = remaining
-            ret.append(job)
 
     return ret
 
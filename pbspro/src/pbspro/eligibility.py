@@ -0,0 +1,160 @@
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from hpc.autoscale import hpclogging as logging
+
+from pbspro.constants import JobEligibility, PBSProJobStates
+from pbspro.nodeindex import parse_pbs_time
+
+# reservation (R123), standing reservation (S123) and maintenance (M123) queues
+RESERVATION_QUEUE_RE = re.compile(r"^[RSM][0-9]+$")
+
+AFTER_DEPENDENCIES = ["after", "afterok", "afternotok", "afterany"]
+
+PENDING_STATES = [
+    PBSProJobStates.Queued,
+    PBSProJobStates.Waiting,
+    PBSProJobStates.Held,
+]
+
+
+class EligibilityClassifier:
+    """
+    Decides whether a pending job can start within the look ahead window,
+    which should roughly match how long a node takes to boot. Only those jobs
+    should create demand. Jobs that are held, wait on dependencies or an
+    Execution_Time (qsub -a) further out than that, run in a reservation or
+    are marked ineligible by PBS (accrue_type=1) are excluded, and counted by
+    reason in self.counts.
+    """
+
+    def __init__(self, lookahead: int = 600, now: Optional[float] = None) -> None:
+        self.lookahead = lookahead
+        self.now = now if now is not None else time.time()
+        self.counts: Dict[str, int] = {}
+        self.__jobs_by_short_id: Dict[str, Dict[str, Any]] = {}
+
+    def add_jobs(self, jobs: Dict[str, Dict[str, Any]]) -> None:
+        """
+        All jobs, keyed by job id, as qstat reports them - used to resolve
+        dependencies.
+        """
+        for job_id, jdict in jobs.items():
+            # dependencies may or may not include the server name
+            self.__jobs_by_short_id[_short_job_id(job_id)] = jdict
+
+    def classify(self, jdict: Dict[str, Any]) -> str:
+        ret = self._classify(jdict)
+        self.counts[ret] = self.counts.get(ret, 0) + 1
+        return ret
+
+    def _classify(self, jdict: Dict[str, Any]) -> str:
+        job_state = jdict.get("job_state")
+        if job_state not in PENDING_STATES:
+            return JobEligibility.ineligible
+
+        if RESERVATION_QUEUE_RE.match(jdict.get("queue", "")):
+            # these run on the nodes PBS already set aside for the reservation
+            return JobEligibility.reservation
+
+        hold_types = jdict.get("Hold_Types", "n")
+        # dependencies are implemented as a system hold. Once PBS releases it,
+        # depend is still set but no longer matters.
+        on_dependencies = False
+        if job_state == PBSProJobStates.Held:
+            if hold_types != "s" or not jdict.get("depend"):
+                return JobEligibility.held
+            on_dependencies = True
+        elif hold_types != "n":
+            return JobEligibility.held
+
+        if str(jdict.get("accrue_type", "")) == "1":
+            return JobEligibility.ineligible
+
+        if on_dependencies and not self._dependencies_met(jdict["depend"]):
+            return JobEligibility.dependency
+
+        execution_time = parse_pbs_time(jdict.get("Execution_Time") or "")
+        if execution_time:
+            if time.mktime(execution_time.timetuple()) - self.now > self.lookahead:
+                return JobEligibility.execution_time
+        elif job_state == PBSProJobStates.Waiting:
+            # e.g. a stage in failure
+            return JobEligibility.waiting
+
+        return JobEligibility.eligible
+
+    def _dependencies_met(self, depend: str) -> bool:
+        """
+        True if every job this one runs after is gone or will end within the
+        look ahead window, based on its requested walltime.
+        """
+        for dep_job_id in _after_job_ids(depend):
+            dep = self.__jobs_by_short_id.get(_short_job_id(dep_job_id))
+            if not dep:
+                # already finished
+                continue
+
+            if dep.get("job_state") not in [
+                PBSProJobStates.Running,
+                PBSProJobStates.Exiting,
+            ]:
+                return False
+
+            remaining = _remaining_walltime(dep)
+            if remaining is None or remaining > self.lookahead:
+                return False
+
+        return True
+
+    def log_summary(self) -> None:
+        excluded = dict(
+            [(k, v) for k, v in self.counts.items() if k != JobEligibility.eligible]
+        )
+        if excluded:
+            logging.info(
+                "Excluded %s pending jobs from demand: %s",
+                sum(excluded.values()),
+                excluded,
+            )
+
+
+def _after_job_ids(depend: str) -> List[str]:
+    # e.g. afterok:123.server:124.server,before:125.server
+    ret = []
+    for tok in depend.split(","):
+        dep_type, _, job_ids = tok.strip().partition(":")
+        if dep_type not in AFTER_DEPENDENCIES:
+            continue
+        ret.extend([j for j in job_ids.split(":") if j])
+    return ret
+
+
+def _short_job_id(job_id: str) -> str:
+    return job_id.split("@")[0].split(".")[0]
+
+
+def _remaining_walltime(jdict: Dict[str, Any]) -> Optional[int]:
+    requested = _parse_duration(jdict.get("Resource_List", {}).get("walltime"))
+    if requested is None:
+        return None
+    used = _parse_duration(jdict.get("resources_used", {}).get("walltime")) or 0
+    return max(0, requested - used)
+
+
+def _parse_duration(expr: Any) -> Optional[int]:
+    """
+    [[HH:]MM:]SS, as PBS reports walltime.
+    """
+    if expr is None:
+        return None
+    if isinstance(expr, (int, float)):
+        return int(expr)
+    try:
+        ret = 0
+        for tok in str(expr).split(":"):
+            ret = ret * 60 + int(float(tok))
+        return ret
+    except ValueError:
+        return None
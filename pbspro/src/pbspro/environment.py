@@ -1,6 +1,5 @@
 from typing import Dict, List, Optional
 
-from hpc.autoscale.hpctypes import Hostname
 from hpc.autoscale.job.job import Job
 from hpc.autoscale.node.node import Node
 
@@ -19,7 +18,7 @@ max_run_res etc - group/user/project syntax
 class PBSProEnvironment:
     def __init__(
         self,
-        schedulers: Dict[Hostname, PBSProScheduler],
+        schedulers: Dict[str, PBSProScheduler],
         queues: Dict[str, PBSProQueue],
         resource_definitions: Dict[str, PBSProResourceDefinition],
         jobs: List[Job],
@@ -55,7 +54,12 @@ def from_driver(
 
     queues = pbs_driver.read_queues(default_scheduler.resource_state.shared_resources)
 
-    jobs = pbs_driver.parse_jobs(queues, default_scheduler.resources_for_scheduling)
+    jobs = pbs_driver.parse_jobs(
+        queues,
+        default_scheduler.resources_for_scheduling,
+        server_limits=default_scheduler.limits,
+        schedulers=schedulers,
+    )
     scheduler_nodes = pbs_driver.parse_scheduler_nodes()
 
     return PBSProEnvironment(
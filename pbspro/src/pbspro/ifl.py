@@ -0,0 +1,510 @@
+"""
+Optional PBSCMD backend that talks to the PBS server directly through the IFL API
+in libpbs, instead of spawning qstat, qmgr and pbsnodes for every query.
+
+Only the read paths that the autoscaler relies on (and the simple qmgr
+create/set/delete commands) are implemented natively. Everything else falls
+through to the CLI implementation in PBSCMD.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import threading
+import time
+from subprocess import CalledProcessError
+from typing import Any, Dict, List, Optional, Tuple
+
+from hpc.autoscale import hpclogging as logging
+
+from pbspro.parser import PBSProParser
+from pbspro.pbscmd import PBSCMD
+
+
+class Attrl(ctypes.Structure):
+    """struct attrl / struct attropl - both share the same layout"""
+
+
+Attrl._fields_ = [
+    ("next", ctypes.POINTER(Attrl)),
+    ("name", ctypes.c_char_p),
+    ("resource", ctypes.c_char_p),
+    ("value", ctypes.c_char_p),
+    ("op", ctypes.c_int),
+]
+
+
+class BatchStatus(ctypes.Structure):
+    """struct batch_status"""
+
+
+BatchStatus._fields_ = [
+    ("next", ctypes.POINTER(BatchStatus)),
+    ("name", ctypes.c_char_p),
+    ("attribs", ctypes.POINTER(Attrl)),
+    ("text", ctypes.c_char_p),
+]
+
+
+# enum batch_op
+SET = 0
+
+# manager commands, see pbs_ifl.h
+MGR_CMD_CREATE = 0
+MGR_CMD_DELETE = 1
+MGR_CMD_SET = 2
+MGR_CMD_UNSET = 3
+
+# manager object types, see pbs_ifl.h
+MGR_OBJ_SERVER = 0
+MGR_OBJ_QUEUE = 1
+MGR_OBJ_NODE = 3
+MGR_OBJ_RSC = 5
+MGR_OBJ_SCHED = 6
+
+MGR_COMMANDS = {
+    "create": MGR_CMD_CREATE,
+    "delete": MGR_CMD_DELETE,
+    "set": MGR_CMD_SET,
+    "unset": MGR_CMD_UNSET,
+}
+
+MGR_OBJECTS = {
+    "server": MGR_OBJ_SERVER,
+    "queue": MGR_OBJ_QUEUE,
+    "node": MGR_OBJ_NODE,
+    "resource": MGR_OBJ_RSC,
+    "sched": MGR_OBJ_SCHED,
+}
+
+# qmgr / pbsnodes -a / qstat -f all render these as ctime strings, the IFL
+# gives us seconds since the epoch.
+TIME_ATTRIBUTES = set(
+    [
+        "ctime",
+        "etime",
+        "mtime",
+        "qtime",
+        "stime",
+        "obittime",
+        "Execution_Time",
+        "last_state_change_time",
+        "last_used_time",
+    ]
+)
+
+DEFAULT_LIBPBS_PATHS = [
+    os.path.join("/opt", "pbs", "lib", "libpbs.so"),
+    os.path.join("/opt", "pbs", "lib", "libpbs.so.0"),
+]
+
+
+def load_libpbs(path: Optional[str] = None) -> Optional[Any]:
+    """
+    Loads libpbs and declares the IFL prototypes we use. Returns None
+    if the library can not be found, so callers can fall back to the CLI.
+    """
+    candidates: List[str] = []
+    if path:
+        candidates.append(path)
+
+    if os.getenv("PBS_EXEC"):
+        candidates.append(os.path.join(os.environ["PBS_EXEC"], "lib", "libpbs.so"))
+
+    candidates.extend(DEFAULT_LIBPBS_PATHS)
+
+    found = ctypes.util.find_library("pbs")
+    if found:
+        candidates.append(found)
+
+    for candidate in candidates:
+        try:
+            lib = ctypes.CDLL(candidate)
+        except OSError as e:
+            logging.fine("Could not load %s: %s", candidate, e)
+            continue
+
+        bs_p = ctypes.POINTER(BatchStatus)
+        attrl_p = ctypes.POINTER(Attrl)
+
+        lib.pbs_connect.argtypes = [ctypes.c_char_p]
+        lib.pbs_connect.restype = ctypes.c_int
+        lib.pbs_disconnect.argtypes = [ctypes.c_int]
+        lib.pbs_disconnect.restype = ctypes.c_int
+        lib.pbs_geterrmsg.argtypes = [ctypes.c_int]
+        lib.pbs_geterrmsg.restype = ctypes.c_char_p
+        lib.pbs_statfree.argtypes = [bs_p]
+        lib.pbs_statfree.restype = None
+
+        for func_name in ["pbs_statjob", "pbs_statvnode", "pbs_statque", "pbs_statrsc"]:
+            func = getattr(lib, func_name)
+            func.argtypes = [ctypes.c_int, ctypes.c_char_p, attrl_p, ctypes.c_char_p]
+            func.restype = bs_p
+
+        for func_name in ["pbs_statserver", "pbs_statsched"]:
+            func = getattr(lib, func_name)
+            func.argtypes = [ctypes.c_int, attrl_p, ctypes.c_char_p]
+            func.restype = bs_p
+
+        lib.pbs_manager.argtypes = [
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_int,
+            ctypes.c_char_p,
+            attrl_p,
+            ctypes.c_char_p,
+        ]
+        lib.pbs_manager.restype = ctypes.c_int
+
+        # newer versions define pbs_errno as (*__pbs_errno_location())
+        errno_location = getattr(lib, "__pbs_errno_location", None)
+        if errno_location is not None:
+            errno_location.argtypes = []
+            errno_location.restype = ctypes.POINTER(ctypes.c_int)
+
+        logging.debug("Loaded libpbs from %s", candidate)
+        return lib
+
+    return None
+
+
+def _decode(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bytes):
+        return value.decode()
+    return str(value)
+
+
+def _encode(value: Optional[str]) -> Optional[bytes]:
+    if value is None:
+        return None
+    return value.encode()
+
+
+def _render_time(value: str) -> str:
+    if value.isdigit():
+        return time.ctime(int(value))
+    return value
+
+
+class IFLPBSCMD(PBSCMD):
+    """
+    PBSCMD compatible backend on top of the PBS IFL API. One connection to the
+    server is kept open until close() is called, which the autoscaler does at
+    the end of every iteration.
+    """
+
+    def __init__(
+        self,
+        parser: PBSProParser,
+        libpbs: Any,
+        server: Optional[str] = None,
+        qmgr_session: bool = False,
+    ) -> None:
+        super().__init__(parser, qmgr_session=qmgr_session)
+        self.libpbs = libpbs
+        self.server = server
+        self.__connection: Optional[int] = None
+        # a connection handle must not be used by more than one thread at a time
+        self.__lock = threading.RLock()
+
+    def connection(self) -> int:
+        if self.__connection is None:
+            conn = self.libpbs.pbs_connect(_encode(self.server))
+            if conn < 0:
+                raise CalledProcessError(
+                    conn,
+                    ["pbs_connect", self.server or ""],
+                    stderr="Could not connect to PBS server {}".format(
+                        self.server or "(default)"
+                    ).encode(),
+                )
+            self.__connection = conn
+        return self.__connection
+
+    def close(self) -> None:
+        with self.__lock:
+            if self.__connection is not None:
+                try:
+                    self.libpbs.pbs_disconnect(self.__connection)
+                finally:
+                    self.__connection = None
+        super().close()
+
+    def qstat_json(self, *args: str) -> Dict:
+        with self.__lock:
+            return self._qstat_json(*args)
+
+    def qmgr(self, *args: str) -> str:
+        with self.__lock:
+            return self._qmgr(*args)
+
+    def qmgr_parsed(self, *args: str) -> List[Dict[str, str]]:
+        with self.__lock:
+            return self._qmgr_parsed(*args)
+
+    def pbsnodes_parsed(self, *args: str) -> List[Dict[str, str]]:
+        with self.__lock:
+            return self._pbsnodes_parsed(*args)
+
+    def qmgr_script_parsed(self, *commands: Tuple[str, ...]) -> List[Dict[str, str]]:
+        # no process to save here, so just stat each one. @server suffixes
+        # always refer to the server we are connected to.
+        ret: List[Dict[str, str]] = []
+        with self.__lock:
+            for cmd in commands:
+                toks = [str(x) for x in cmd if not str(x).startswith("@")]
+                ret.extend(self._qmgr_parsed(*toks))
+        return ret
+
+    def qmgr_script(self, *commands: Tuple[str, ...]) -> Dict[str, str]:
+        # one pbs_manager call per command, failures keyed by object name
+        failures: Dict[str, str] = {}
+        with self.__lock:
+            for cmd in commands:
+                toks = [str(x) for x in cmd]
+                try:
+                    self._qmgr(*toks)
+                except CalledProcessError as e:
+                    failures[toks[2]] = _decode(e.stderr) or str(e)
+        return failures
+
+    def _qstat_json(self, *args: str) -> Dict:
+        flags = [a for a in args if a not in ["-F", "json"]]
+        if sorted(flags) not in [["-f"], ["-f", "-t"]]:
+            return super().qstat_json(*args)
+
+        extend = "t" if "-t" in flags else None
+        records = self._stat(
+            "pbs_statjob", None, extend, cmd=["pbs_statjob"] + list(args)
+        )
+
+        jobs: Dict[str, Dict[str, Any]] = {}
+        for name, attrs in records:
+            jdict: Dict[str, Any] = {}
+            for attr_name, resource, value in attrs:
+                if attr_name in TIME_ATTRIBUTES:
+                    value = _render_time(value)
+
+                if resource:
+                    if attr_name not in jdict:
+                        jdict[attr_name] = {}
+                    jdict[attr_name][resource] = value
+                elif attr_name == "array":
+                    jdict[attr_name] = value.lower() == "true"
+                else:
+                    jdict[attr_name] = value
+            jobs[name] = jdict
+
+        return {"Jobs": jobs}
+
+    def _qmgr(self, *args: str) -> str:
+        toks = [str(x) for x in args]
+        if len(toks) >= 2 and toks[0] == "list":
+            records = self._qmgr_list(toks)
+            if records is not None:
+                return _render_key_value(records)
+
+        if (
+            len(toks) >= 3
+            and toks[0] in MGR_COMMANDS
+            and toks[1] in MGR_OBJECTS
+            and "," not in toks[2]
+        ):
+            self._manager(toks)
+            return ""
+
+        return super().qmgr(*args)
+
+    def _qmgr_parsed(self, *args: str) -> List[Dict[str, str]]:
+        toks = [str(x) for x in args]
+        if len(toks) >= 2 and toks[0] == "list":
+            records = self._qmgr_list(toks)
+            if records is not None:
+                return records
+        return super().qmgr_parsed(*args)
+
+    def _pbsnodes_parsed(self, *args: str) -> List[Dict[str, str]]:
+        if list(args) != ["-a"]:
+            return super().pbsnodes_parsed(*args)
+
+        ret = []
+        for name, attrs in self._stat(
+            "pbs_statvnode", None, None, cmd=["pbs_statvnode"]
+        ):
+            ret.append(_to_record("unknown", name, attrs))
+        return ret
+
+    def _qmgr_list(self, toks: List[str]) -> Optional[List[Dict[str, str]]]:
+        obj_type = toks[1]
+        names = [n for n in ",".join(toks[2:]).split(",") if n]
+        cmd = ["qmgr", "-c", " ".join(toks)]
+
+        if obj_type == "server":
+            records = self._stat_server_like("pbs_statserver", cmd)
+            obj_label = "Server"
+        elif obj_type == "sched":
+            records = self._stat_server_like("pbs_statsched", cmd)
+            obj_label = "Sched"
+        elif obj_type == "queue":
+            records = self._stat_by_name("pbs_statque", names, cmd)
+            obj_label = "Queue"
+        elif obj_type == "resource":
+            records = self._stat_by_name("pbs_statrsc", names, cmd)
+            obj_label = "Resource"
+        elif obj_type == "node":
+            records = self._stat_by_name("pbs_statvnode", names, cmd)
+            obj_label = "Node"
+        else:
+            return None
+
+        if names:
+            by_name = dict(records)
+            missing = [n for n in names if n not in by_name]
+            if missing:
+                raise CalledProcessError(
+                    1,
+                    cmd,
+                    stderr="qmgr obj={} svr=default: Unknown {}".format(
+                        missing[0], obj_type
+                    ).encode(),
+                )
+            records = [(n, by_name[n]) for n in names]
+
+        return [_to_record(obj_label, name, attrs) for name, attrs in records]
+
+    def _stat_server_like(
+        self, func_name: str, cmd: List[str]
+    ) -> List[Tuple[str, List[Tuple[str, str, str]]]]:
+        func = getattr(self.libpbs, func_name)
+        logger = logging.getLogger("pbspro.driver")
+        logger.info("Running: %s", func_name)
+        return self._collect(func(self.connection(), None, None), cmd)
+
+    def _stat_by_name(
+        self, func_name: str, names: List[str], cmd: List[str]
+    ) -> List[Tuple[str, List[Tuple[str, str, str]]]]:
+        if len(names) != 1:
+            # the IFL takes a single object name, so list them all and filter
+            return self._stat(func_name, None, None, cmd)
+        return self._stat(func_name, names[0], None, cmd)
+
+    def _stat(
+        self,
+        func_name: str,
+        obj_id: Optional[str],
+        extend: Optional[str],
+        cmd: List[str],
+    ) -> List[Tuple[str, List[Tuple[str, str, str]]]]:
+        func = getattr(self.libpbs, func_name)
+        logger = logging.getLogger("pbspro.driver")
+        logger.info("Running: %s %s", func_name, obj_id or "")
+        status = func(self.connection(), _encode(obj_id), None, _encode(extend))
+        return self._collect(status, cmd, missing_ok=obj_id is None)
+
+    def _collect(
+        self, status: Any, cmd: List[str], missing_ok: bool = True
+    ) -> List[Tuple[str, List[Tuple[str, str, str]]]]:
+        ret: List[Tuple[str, List[Tuple[str, str, str]]]] = []
+        if not status:
+            # NULL is returned both for errors and for an empty list
+            errno = self._pbs_errno()
+            if errno or not missing_ok:
+                errmsg = _decode(self.libpbs.pbs_geterrmsg(self.connection()))
+                raise CalledProcessError(errno or 1, cmd, stderr=errmsg.encode())
+            return ret
+
+        try:
+            current = status
+            while current:
+                bs = current.contents
+                attrs: List[Tuple[str, str, str]] = []
+                attr_p = bs.attribs
+                while attr_p:
+                    attr = attr_p.contents
+                    attrs.append(
+                        (
+                            _decode(attr.name),
+                            _decode(attr.resource),
+                            _decode(attr.value),
+                        )
+                    )
+                    attr_p = attr.next
+                ret.append((_decode(bs.name), attrs))
+                current = bs.next
+        finally:
+            self.libpbs.pbs_statfree(status)
+
+        return ret
+
+    def _pbs_errno(self) -> int:
+        errno_location = getattr(self.libpbs, "__pbs_errno_location", None)
+        if errno_location is not None:
+            return errno_location().contents.value
+        try:
+            return ctypes.c_int.in_dll(self.libpbs, "pbs_errno").value
+        except ValueError:
+            return 0
+
+    def _manager(self, toks: List[str]) -> None:
+        command, obj_type, obj_name = toks[0], toks[1], toks[2]
+        attr_exprs = [a.strip() for a in " ".join(toks[3:]).split(",") if a.strip()]
+
+        # keep the structures referenced until pbs_manager returns
+        attropls = [Attrl() for _ in attr_exprs]
+        for n, attr_expr in enumerate(attr_exprs):
+            key, value = attr_expr.split("=", 1)
+            key, value = key.strip(), value.strip()
+            name, resource = key, None
+            if "." in key:
+                name, resource = key.split(".", 1)
+            attropls[n].name = _encode(name)
+            attropls[n].resource = _encode(resource)
+            attropls[n].value = _encode(value)
+            attropls[n].op = SET
+            if n > 0:
+                attropls[n - 1].next = ctypes.pointer(attropls[n])
+
+        attrib = ctypes.pointer(attropls[0]) if attropls else None
+
+        logger = logging.getLogger("pbspro.driver")
+        logger.info("Running: pbs_manager %s", " ".join(toks))
+
+        rc = self.libpbs.pbs_manager(
+            self.connection(),
+            MGR_COMMANDS[command],
+            MGR_OBJECTS[obj_type],
+            _encode(obj_name),
+            attrib,
+            None,
+        )
+        if rc != 0:
+            errmsg = _decode(self.libpbs.pbs_geterrmsg(self.connection()))
+            raise CalledProcessError(
+                rc, ["qmgr", "-c", " ".join(toks)], stderr=errmsg.encode()
+            )
+
+
+def _to_record(
+    obj_type: str, name: str, attrs: List[Tuple[str, str, str]]
+) -> Dict[str, str]:
+    record = {"obj_type": obj_type, "name": name}
+    for attr_name, resource, value in attrs:
+        if attr_name in TIME_ATTRIBUTES:
+            value = _render_time(value)
+        key = "{}.{}".format(attr_name, resource) if resource else attr_name
+        record[key] = value
+    return record
+
+
+def _render_key_value(records: List[Dict[str, str]]) -> str:
+    lines = []
+    for record in records:
+        lines.append("{} {}".format(record["obj_type"], record["name"]))
+        for key, value in record.items():
+            if key in ["obj_type", "name"]:
+                continue
+            lines.append("    {} = {}".format(key, value))
+        lines.append("")
+    return "\n".join(lines)
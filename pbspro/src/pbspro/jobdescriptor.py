@@ -0,0 +1,109 @@
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+from hpc.autoscale.job.job import Job
+
+
+class ConstraintTemplates:
+    """
+    Hands out one shared, read only copy of each distinct constraint dict, with
+    interned resource names. 100k jobs from a handful of queues tend to have a
+    handful of distinct constraints, so descriptors reference those instead of
+    each holding their own dicts.
+
+    Constraints with unhashable values are not shared, and constraint objects,
+    e.g. the SharedConsumableConstraints for queue or server level resources
+    and run limits, are passed through as is.
+    """
+
+    def __init__(self) -> None:
+        self.__templates: Dict[Tuple, Dict[str, Any]] = {}
+        self.requests = 0
+
+    def __len__(self) -> int:
+        return len(self.__templates)
+
+    def get(self, constraint: Any) -> Any:
+        self.requests += 1
+        if not isinstance(constraint, dict):
+            return constraint
+        try:
+            key = tuple(sorted(constraint.items()))
+            hash(key)
+        except TypeError:
+            return dict([(sys.intern(k), v) for k, v in constraint.items()])
+
+        template = self.__templates.get(key)
+        if template is None:
+            template = dict([(sys.intern(k), v) for k, v in constraint.items()])
+            self.__templates[key] = template
+        return template
+
+
+class JobDescriptor:
+    """
+    Everything needed to create a hpc.autoscale Job, without creating one.
+    Small (slots, shared constraint templates) and picklable, so it can be
+    cached or sent to another process. Job objects are only created with
+    to_job, once the job is actually handed to the demand calculator.
+    """
+
+    __slots__ = (
+        "name",
+        "constraints",
+        "iterations",
+        "remaining",
+        "node_count",
+        "colocated",
+        "packing_strategy",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        constraints: List[Any],
+        iterations: int = 1,
+        remaining: int = 1,
+        node_count: int = 0,
+        colocated: bool = False,
+        packing_strategy: Optional[str] = None,
+        templates: Optional[ConstraintTemplates] = None,
+    ) -> None:
+        self.name = sys.intern(name)
+        if templates is not None:
+            self.constraints = tuple([templates.get(c) for c in constraints])
+        else:
+            self.constraints = tuple(constraints)
+        self.iterations = iterations
+        self.remaining = remaining
+        self.node_count = node_count
+        self.colocated = colocated
+        self.packing_strategy = packing_strategy
+
+    def to_job(self) -> Job:
+        # copies, as the templates are shared with other descriptors
+        job = Job(
+            name=self.name,
+            constraints=[
+                dict(c) if isinstance(c, dict) else c for c in self.constraints
+            ],
+            iterations=self.iterations,
+            node_count=self.node_count,
+            colocated=self.colocated,
+            packing_strategy=self.packing_strategy,
+        )
+        job.iterations_remaining = self.remaining
+        return job
+
+    def __getstate__(self) -> Tuple:
+        return tuple([getattr(self, attr) for attr in self.__slots__])
+
+    def __setstate__(self, state: Tuple) -> None:
+        for attr, value in zip(self.__slots__, state):
+            setattr(self, attr, value)
+        self.name = sys.intern(self.name)
+
+    def __repr__(self) -> str:
+        return "JobDescriptor({}, node_count={}, constraints={})".format(
+            self.name, self.node_count, list(self.constraints)
+        )
@@ -0,0 +1,107 @@
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from hpc.autoscale import hpclogging as logging
+
+
+class JobTracker:
+    """
+    Remembers the parsed Resource_List of every pending job, keyed by the job's
+    mtime, across autoscale iterations. PBS bumps mtime on any qalter, so a
+    job whose mtime and schedselect are unchanged since the last iteration does
+    not need to be parsed again. Jobs that are no longer reported are dropped.
+
+    The parsed dicts are shared between iterations and must not be modified.
+    """
+
+    def __init__(self) -> None:
+        # job_id -> ((mtime, schedselect), rdict)
+        self.__entries: Dict[str, Tuple[Tuple[str, str], Dict[str, Any]]] = {}
+        self.__parser: Any = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def convert_resource_list(
+        self, parser: Any, job_id: str, jdict: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        parser.convert_resource_list for jdict's Resource_List, which has to
+        include schedselect, unless the job has not changed since it was last
+        parsed with this parser.
+        """
+        rdict = self.lookup(parser, job_id, jdict)
+        if rdict is None:
+            rdict = parser.convert_resource_list(jdict["Resource_List"])
+            self.store(job_id, jdict, rdict)
+        return rdict
+
+    def lookup(
+        self, parser: Any, job_id: str, jdict: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        The parsed Resource_List if the job is unchanged, otherwise None and the
+        caller should parse it and store the result.
+        """
+        if parser is not self.__parser:
+            # new resource definitions, so nothing cached can be trusted
+            self.__entries.clear()
+            self.__parser = parser
+
+        entry = self.__entries.get(job_id)
+        key = _key(jdict)
+        if entry and key and entry[0] == key:
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        return None
+
+    def store(self, job_id: str, jdict: Dict[str, Any], rdict: Dict[str, Any]) -> None:
+        key = _key(jdict)
+        if key:
+            self.__entries[job_id] = (key, rdict)
+
+    def retain(self, job_ids: Iterable[str]) -> int:
+        """
+        Drops every job not in job_ids, i.e. the jobs that finished or were
+        deleted since the last iteration. Returns the number dropped.
+        """
+        keep = set(job_ids)
+        finished = [job_id for job_id in self.__entries if job_id not in keep]
+        for job_id in finished:
+            self.__entries.pop(job_id)
+        return len(finished)
+
+    def log_summary(self) -> None:
+        logging.debug(
+            "Job tracker: %d jobs parsed again, %d unchanged, %d tracked",
+            self.misses,
+            self.hits,
+            len(self),
+        )
+        self.hits = self.misses = 0
+
+
+def _key(jdict: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    mtime = jdict.get("mtime")
+    if not mtime:
+        # nothing to compare against
+        return None
+    return (str(mtime), str(jdict["Resource_List"].get("schedselect")))
+
+
+_TRACKER: Optional[JobTracker] = None
+
+
+def get_job_tracker() -> JobTracker:
+    """
+    One tracker per process, so that azpbs autoscale --watch reuses what it
+    parsed in its previous iterations. A cron or hook driven azpbs autoscale
+    is a new process every iteration, so it never finds anything here.
+    """
+    global _TRACKER
+    if _TRACKER is None:
+        _TRACKER = JobTracker()
+    return _TRACKER
@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+import typing_extensions
+from hpc.autoscale import hpclogging as logging
+
+Transition = typing_extensions.Literal["join", "drain", "delete"]
+Phase = typing_extensions.Literal["begin", "end", "failed"]
+
+
+class TransitionJournal:
+    """
+    Append-only journal of node state transitions (join, drain and delete),
+    one json record per line. Every transition writes a 'begin' record before
+    touching PBS and an 'end' or 'failed' record, with the duration, afterwards.
+
+    A node whose last record is a finished join does not need to be re-checked
+    with qmgr next iteration, while a 'begin' without an 'end' means the
+    autoscaler died part way through and that node has to be reconciled.
+
+    Passing path=None keeps the journal in memory only.
+    """
+
+    def __init__(self, path: Optional[str], max_records: int = 50000) -> None:
+        self.path = path
+        self.max_records = max_records
+        self.__latest: Dict[str, Dict] = {}
+        self.__num_records = 0
+        self.__lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def begin(self, transition: Transition, node_id: str, hostname: str) -> None:
+        self._append(transition, "begin", node_id, hostname)
+
+    def end(self, transition: Transition, node_id: str, hostname: str) -> None:
+        self._append(transition, "end", node_id, hostname)
+
+    def failed(self, transition: Transition, node_id: str, hostname: str) -> None:
+        self._append(transition, "failed", node_id, hostname)
+
+    def latest(self, node_id: str) -> Optional[Dict]:
+        return self.__latest.get(node_id)
+
+    def is_joined(self, node_id: str, hostname: str) -> bool:
+        record = self.__latest.get(node_id)
+        if not record:
+            return False
+        return (
+            record["transition"] == "join"
+            and record["phase"] == "end"
+            and record["hostname"].lower() == hostname.lower()
+        )
+
+    def in_flight(self) -> List[Dict]:
+        return [r for r in self.__latest.values() if r["phase"] == "begin"]
+
+    def _append(
+        self, transition: Transition, phase: Phase, node_id: str, hostname: str
+    ) -> None:
+        now = time.time()
+        record = {
+            "time": now,
+            "transition": transition,
+            "phase": phase,
+            "node_id": node_id,
+            "hostname": hostname,
+        }
+
+        with self.__lock:
+            previous = self.__latest.get(node_id)
+            if (
+                phase != "begin"
+                and previous
+                and previous["phase"] == "begin"
+                and previous["transition"] == transition
+            ):
+                record["duration"] = round(now - previous["time"], 3)
+
+            self.__latest[node_id] = record
+
+            if not self.path:
+                return
+
+            try:
+                with open(self.path, "a") as fw:
+                    fw.write(json.dumps(record) + "\n")
+                self.__num_records += 1
+                if self.__num_records > self.max_records:
+                    self._compact(self.path)
+            except OSError as e:
+                logging.warning(
+                    "Could not write to %s, disabling the journal: %s", self.path, e
+                )
+                self.path = None
+
+    def _load(self, path: str) -> None:
+        with open(path) as fr:
+            for n, line in enumerate(fr):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                    self.__latest[record["node_id"]] = record
+                except (ValueError, KeyError):
+                    # most likely a partial write when we were killed
+                    logging.warning(
+                        "Ignoring corrupt record on line %s of %s", n + 1, path
+                    )
+                self.__num_records += 1
+
+    def _compact(self, path: str) -> None:
+        """
+        Rewrites the journal with only the latest record per node.
+        """
+        tmp_path = path + ".tmp"
+        records = sorted(self.__latest.values(), key=lambda r: r["time"])
+        with open(tmp_path, "w") as fw:
+            for record in records:
+                fw.write(json.dumps(record) + "\n")
+        os.rename(tmp_path, path)
+        self.__num_records = len(records)
@@ -0,0 +1,150 @@
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from hpc.autoscale import hpclogging as logging
+from hpc.autoscale.node import constraints as conslib
+
+from pbspro.pbsqueue import PBSProLimit
+
+# (source, limit name, scope, entity) e.g. ("queue/workq", "max_run", "u", "alice")
+LimitKey = Tuple[str, str, str, str]
+
+
+class RunLimits:
+    """
+    Models the server and queue max_run and max_run_res.* limits as shared
+    consumable resources - one per limit and per user, group or project - so
+    that we do not ask for nodes for jobs that PBS will not start because the
+    owner is already at their limit.
+
+    All running jobs must be added via add_running_job before any constraints
+    are created, as that is what the remaining amount of each limit is based on.
+    """
+
+    def __init__(
+        self,
+        server_limits: Dict[str, PBSProLimit],
+        queue_limits: Dict[str, Dict[str, PBSProLimit]],
+    ) -> None:
+        self.__sources: Dict[str, Dict[str, PBSProLimit]] = {}
+        if server_limits:
+            self.__sources["server"] = server_limits
+        for qname, limits in queue_limits.items():
+            if limits:
+                self.__sources["queue/" + qname] = limits
+        self.__usage: Dict[LimitKey, float] = {}
+        self.__resources: Dict[LimitKey, conslib.SharedConsumableResource] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.__sources)
+
+    def add_running_job(
+        self,
+        queue: str,
+        user: Optional[str],
+        group: Optional[str],
+        project: Optional[str],
+        resource_list: Dict[str, Any],
+    ) -> None:
+        for key, _ in self._applicable_limits(queue, user, group, project):
+            amount = _amount(key[1], resource_list, 1)
+            if amount:
+                self.__usage[key] = self.__usage.get(key, 0) + amount
+
+    def get_constraints(
+        self,
+        queue: str,
+        user: Optional[str],
+        group: Optional[str],
+        project: Optional[str],
+        chunk: Dict[str, Any],
+        node_fraction: float,
+    ) -> List[conslib.NodeConstraint]:
+        """
+        chunk is the per node resource request, and node_fraction is the share
+        of one job each node represents, which is what max_run consumes.
+        """
+        ret: List[conslib.NodeConstraint] = []
+        for key, limit in self._applicable_limits(queue, user, group, project):
+            amount = _amount(key[1], chunk, node_fraction)
+            if not amount:
+                continue
+            ret.append(
+                conslib.SharedConsumableConstraint(
+                    [self._get_resource(key, limit)], amount
+                )
+            )
+        return ret
+
+    def _get_resource(
+        self, key: LimitKey, limit: int
+    ) -> conslib.SharedConsumableResource:
+        if key not in self.__resources:
+            source, limit_name, scope, entity = key
+            remaining = max(0, limit - self.__usage.get(key, 0))
+            if remaining <= 0:
+                logging.debug(
+                    "%s %s is at its limit of %s for %s:%s",
+                    source,
+                    limit_name,
+                    limit,
+                    scope,
+                    entity,
+                )
+            self.__resources[key] = conslib.SharedConsumableResource(
+                resource_name="{}[{}:{}]".format(limit_name, scope, entity),
+                source=source,
+                current_value=remaining,
+                initial_value=limit,
+            )
+        return self.__resources[key]
+
+    def _applicable_limits(
+        self,
+        queue: str,
+        user: Optional[str],
+        group: Optional[str],
+        project: Optional[str],
+    ) -> Iterator[Tuple[LimitKey, int]]:
+        for source in ["server", "queue/" + queue]:
+            limits = self.__sources.get(source)
+            if not limits:
+                continue
+
+            for limit_name, limit in limits.items():
+                if "PBS_ALL" in limit.overall:
+                    yield (source, limit_name, "o", "PBS_ALL"), limit.overall["PBS_ALL"]
+
+                for scope, entity, by_entity in [
+                    ("u", user, limit.user),
+                    ("g", group, limit.group),
+                    ("p", project, limit.project),
+                ]:
+                    if not entity:
+                        continue
+                    # PBS_GENERIC applies to each user/group/project individually
+                    value = by_entity.get(entity, by_entity.get("PBS_GENERIC"))
+                    if value is not None:
+                        yield (source, limit_name, scope, entity), value
+
+
+def job_owner(jdict: Dict[str, Any]) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Returns the user, group and project that PBS applies limits to for a job.
+    """
+    user = jdict.get("euser") or jdict.get("Job_Owner", "").split("@")[0]
+    return user, jdict.get("egroup"), jdict.get("project")
+
+
+def _amount(limit_name: str, resources: Dict[str, Any], max_run_amount: float) -> float:
+    if limit_name == "max_run":
+        return max_run_amount
+
+    value = resources.get(limit_name[len("max_run_res.") :])
+    if isinstance(value, str):
+        try:
+            value = float(value)
+        except ValueError:
+            return 0
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return 0
+    return value
@@ -0,0 +1,104 @@
+import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from hpc.autoscale import hpclogging as logging
+from hpc.autoscale.node.node import Node
+
+_MONTHS = {
+    "Jan": 1,
+    "Feb": 2,
+    "Mar": 3,
+    "Apr": 4,
+    "May": 5,
+    "Jun": 6,
+    "Jul": 7,
+    "Aug": 8,
+    "Sep": 9,
+    "Oct": 10,
+    "Nov": 11,
+    "Dec": 12,
+}
+
+
+class NodeIndex:
+    """
+    Lookups over one iteration's worth of nodes, so reconciliation does not
+    rescan the full node list per node. Keyed by ccnodeid, lower cased hostname
+    and by each comma separated token of the pbs_state (down, offline etc).
+    """
+
+    def __init__(self, nodes: Iterable[Node]) -> None:
+        self.nodes: List[Node] = list(nodes)
+        self.by_ccnodeid: Dict[str, Node] = {}
+        self.by_hostname: Dict[str, Node] = {}
+        self.by_state: Dict[str, List[Node]] = {}
+
+        for node in self.nodes:
+            node_id = _node_id(node)
+            if node_id in self.by_ccnodeid:
+                logging.warning(
+                    "%s and %s have the same node id %s",
+                    self.by_ccnodeid[node_id],
+                    node,
+                    node_id,
+                )
+            self.by_ccnodeid[node_id] = node
+
+            if node.hostname:
+                self.by_hostname[node.hostname.lower()] = node
+
+            pbs_state = node.metadata.get("pbs_state") or ""
+            for state in pbs_state.split(","):
+                state = state.strip()
+                if state:
+                    self.by_state.setdefault(state, []).append(node)
+
+    def get_by_ccnodeid(self, node_id: str) -> Optional[Node]:
+        return self.by_ccnodeid.get(node_id)
+
+    def get_by_hostname(self, hostname: str) -> Optional[Node]:
+        return self.by_hostname.get(hostname.lower())
+
+    def with_state(self, state: str) -> List[Node]:
+        return list(self.by_state.get(state, []))
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self.by_ccnodeid
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+
+def _node_id(node: Node) -> str:
+    return (
+        node.delayed_node_id.node_id
+        or node.resources.get("ccnodeid")
+        or node.hostname_or_uuid
+    )
+
+
+@lru_cache(maxsize=16384)
+def parse_pbs_time(expr: str) -> Optional[datetime.datetime]:
+    """
+    Parses times as PBS reports them, e.g. last_state_change_time, which are in
+    ctime format - 'Mon Oct  5 10:11:12 2020'. Nodes that go down together share
+    the same timestamp, and the same nodes are reported every iteration, so
+    results are cached. strptime is only used if the fast path fails.
+    """
+    if not expr:
+        return None
+    try:
+        _, month, day, hms, year = expr.split()
+        hour, minute, second = hms.split(":")
+        return datetime.datetime(
+            int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second)
+        )
+    except (KeyError, ValueError):
+        pass
+
+    try:
+        return datetime.datetime.strptime(expr, "%a %b %d %H:%M:%S %Y")
+    except ValueError:
+        logging.warning("Could not parse time '%s'", expr)
+        return None
@@ -0,0 +1,121 @@
+from typing import Any, Callable, Dict, List, Optional
+
+from pbspro.demandhistory import node_bucket_key
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore
+
+
+GROUP_KEYS: Dict[str, Callable[[Any], str]] = {
+    "nodearray": lambda n: n.nodearray or "",
+    "bucket": node_bucket_key,
+    "placement_group": lambda n: n.placement_group or "",
+}
+
+
+class NodeTable:
+    """
+    Columnar copy of the numeric resources of a list of nodes, built once so
+    that capacity summaries - free ncpus per nodearray, bucket or placement
+    group - do not walk every node's resource dicts again. Uses numpy arrays
+    when numpy is installed, plain lists otherwise.
+
+    Only int and float valued resources are tracked.
+    """
+
+    def __init__(self, nodes: List[Any], resources: Optional[List[str]] = None) -> None:
+        self.hostnames = [n.hostname or n.name for n in nodes]
+        self.__groups: Dict[str, Any] = {}
+        self.__group_names: Dict[str, List[str]] = {}
+        self.__aggregates: Dict[tuple, Dict[str, float]] = {}
+
+        if resources is None:
+            names = set()
+            for node in nodes:
+                for name, value in node.resources.items():
+                    if _is_number(value):
+                        names.add(name)
+            resources = sorted(names)
+        self.resources = list(resources)
+
+        self.__total: Dict[str, Any] = {}
+        self.__available: Dict[str, Any] = {}
+        for name in self.resources:
+            self.__total[name] = _array([_number(n.resources.get(name)) for n in nodes])
+            self.__available[name] = _array(
+                [_number(n.available.get(name)) for n in nodes]
+            )
+
+        for key, func in GROUP_KEYS.items():
+            codes: Dict[str, int] = {}
+            self.__groups[key] = _array(
+                [codes.setdefault(func(n), len(codes)) for n in nodes], int
+            )
+            self.__group_names[key] = list(codes.keys())
+
+    def __len__(self) -> int:
+        return len(self.hostnames)
+
+    def column(self, resource: str, available: bool = True) -> Any:
+        if resource not in self.__total:
+            raise KeyError(
+                "Unknown resource {}. Expected one of {}".format(
+                    resource, self.resources
+                )
+            )
+        return self.__available[resource] if available else self.__total[resource]
+
+    def total(self, resource: str, available: bool = True) -> float:
+        values = self.column(resource, available)
+        if np is not None:
+            return float(values.sum())
+        return float(sum(values))
+
+    def sum_by(
+        self, resource: str, key: str, available: bool = True
+    ) -> Dict[str, float]:
+        """
+        e.g. sum_by("ncpus", "nodearray") -> {"htc": 128.0, "hpc": 0.0}
+        """
+        cache_key = (resource, key, available)
+        if cache_key not in self.__aggregates:
+            self.__aggregates[cache_key] = self._group_sum(
+                self.column(resource, available), key
+            )
+        return self.__aggregates[cache_key]
+
+    def count_by(self, key: str) -> Dict[str, int]:
+        counts = self._group_sum(_array([1] * len(self)), key)
+        return dict([(k, int(v)) for k, v in counts.items()])
+
+    def _group_sum(self, values: Any, key: str) -> Dict[str, float]:
+        if key not in GROUP_KEYS:
+            raise KeyError(
+                "Unknown group {}. Expected one of {}".format(key, list(GROUP_KEYS))
+            )
+        codes = self.__groups[key]
+        names = self.__group_names[key]
+
+        if np is not None:
+            sums = np.bincount(codes, weights=values, minlength=len(names))
+        else:
+            sums = [0.0] * len(names)
+            for code, value in zip(codes, values):
+                sums[code] += value
+        return dict([(name, float(sums[i])) for i, name in enumerate(names)])
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _number(value: Any) -> float:
+    return float(value) if _is_number(value) else 0.0
+
+
+def _array(values: List[Any], dtype: Any = float) -> Any:
+    if np is not None:
+        return np.array(values, dtype=dtype)
+    return values
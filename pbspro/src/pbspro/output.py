@@ -0,0 +1,158 @@
+import json
+import re
+from fnmatch import fnmatchcase
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+STREAM_FORMATS = ["jsonl", "tsv"]
+
+# [alias@][*|/]name[[start:stop]]
+# e.g. ctr@create_time_remaining, /ncpus or instance_id[:11]
+_COLUMN_RE = re.compile(r"^(?:([^@]+)@)?([*/]?)([^\[]+)(?:\[(-?\d*):(-?\d*)\])?$")
+
+
+class Column:
+    """
+    The subset of the demand printer's column syntax that can be rendered one
+    row at a time.
+    """
+
+    def __init__(self, expr: str) -> None:
+        match = _COLUMN_RE.match(expr)
+        if not match:
+            raise ValueError("Invalid column {}".format(expr))
+        alias, self.prefix, self.attr, start, stop = match.groups()
+        self.name = alias or self.attr
+        self.slice: Optional[slice] = None
+        if start or stop:
+            self.slice = slice(
+                int(start) if start else None, int(stop) if stop else None
+            )
+
+    def value(self, obj: Any) -> Any:
+        if self.prefix == "*":
+            ret = _lookup(getattr(obj, "available", None), self.attr)
+        elif self.prefix == "/":
+            ret = "{}/{}".format(
+                _lookup(getattr(obj, "available", None), self.attr),
+                _lookup(getattr(obj, "resources", None), self.attr),
+            )
+        elif hasattr(obj, self.attr):
+            ret = getattr(obj, self.attr)
+        else:
+            ret = _lookup(getattr(obj, "resources", None), self.attr)
+
+        if self.slice and ret is not None:
+            ret = str(ret)[self.slice]
+        return ret
+
+
+def _lookup(d: Optional[Dict], key: str) -> Any:
+    if not d:
+        return None
+    return d.get(key)
+
+
+def parse_filter(expr: str) -> Tuple[str, bool, str]:
+    """
+    key=pattern or key!=pattern, where pattern may use shell style wildcards.
+    Used as an argparse type.
+    """
+    if "!=" in expr:
+        key, pattern = expr.split("!=", 1)
+        negate = True
+    elif "=" in expr:
+        key, pattern = expr.split("=", 1)
+        negate = False
+    else:
+        raise ValueError("Expected key=value or key!=value, got {}".format(expr))
+    if not key.strip():
+        raise ValueError("Expected key=value or key!=value, got {}".format(expr))
+    return (key.strip(), negate, pattern)
+
+
+def to_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple, set)):
+        return ",".join([to_text(x) for x in value])
+    return str(value)
+
+
+def to_json(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple, set)):
+        return [to_json(x) for x in value]
+    if isinstance(value, dict):
+        return dict([(str(k), to_json(v)) for k, v in value.items()])
+    return str(value)
+
+
+def iter_rows(
+    objs: Iterable[Any],
+    columns: List[str],
+    filters: Optional[List[Tuple[str, bool, str]]] = None,
+    limit: int = 0,
+) -> Iterator[Tuple[Any, ...]]:
+    """
+    Yields a tuple of values per object that passes the filters, at most limit
+    rows if limit > 0. Objects are only looked at as they are needed.
+    """
+    parsed_columns = [Column(c) for c in columns]
+    parsed_filters = [
+        (Column(key), negate, pattern) for key, negate, pattern in (filters or [])
+    ]
+    emitted = 0
+    for obj in objs:
+        matched = True
+        for column, negate, pattern in parsed_filters:
+            if fnmatchcase(to_text(column.value(obj)), pattern) == negate:
+                matched = False
+                break
+
+        if not matched:
+            continue
+
+        yield tuple([c.value(obj) for c in parsed_columns])
+        emitted += 1
+        if limit > 0 and emitted >= limit:
+            return
+
+
+def write_rows(
+    rows: Iterable[Tuple[Any, ...]],
+    columns: List[str],
+    output_format: str,
+    out: TextIO,
+    header: bool = True,
+) -> int:
+    """
+    Writes each row as soon as it is produced - no column widths to compute,
+    so nothing is buffered. Returns the number of rows written.
+    """
+    if output_format not in STREAM_FORMATS:
+        raise ValueError(
+            "Unknown output format {}, expected one of {}".format(
+                output_format, STREAM_FORMATS
+            )
+        )
+    names = [Column(c).name for c in columns]
+
+    if output_format == "tsv" and header:
+        out.write("\t".join(names) + "\n")
+
+    count = 0
+    for row in rows:
+        if output_format == "jsonl":
+            out.write(
+                json.dumps(dict([(n, to_json(v)) for n, v in zip(names, row)])) + "\n"
+            )
+        else:
+            out.write("\t".join([_tsv_escape(to_text(v)) for v in row]) + "\n")
+        count += 1
+    out.flush()
+    return count
+
+
+def _tsv_escape(value: str) -> str:
+    return value.replace("\t", " ").replace("\n", " ").replace("\r", " ")
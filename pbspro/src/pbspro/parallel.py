@@ -0,0 +1,106 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from hpc.autoscale import hpclogging as logging
+
+from pbspro.parser import PBSProParser
+
+DEFAULT_THRESHOLD = 10000
+DEFAULT_SHARDS_PER_WORKER = 4
+
+# the parser of a worker process, see _init_worker
+_WORKER_PARSER: Optional[PBSProParser] = None
+
+
+def _init_worker(resource_definitions: Dict[str, Any]) -> None:
+    global _WORKER_PARSER
+    _WORKER_PARSER = PBSProParser(resource_definitions)
+
+
+def _convert_shard(
+    shard: List[Tuple[str, Dict[str, Any]]]
+) -> List[Tuple[str, Dict[str, Any]]]:
+    assert _WORKER_PARSER is not None
+    return [
+        (job_id, _WORKER_PARSER.convert_resource_list(res_list))
+        for job_id, res_list in shard
+    ]
+
+
+class ResourceListConverter:
+    """
+    Converts the Resource_List of many jobs at once. With workers > 1 and at
+    least threshold jobs, the jobs are sharded across a pool of processes, each
+    with its own PBSProParser built from the same resource definitions, and only
+    the parsed dicts are sent back. Job objects are still created by the caller,
+    as they depend on the queues and run limits. Anything less, or any failure of
+    the pool, is parsed in this process.
+    """
+
+    def __init__(
+        self,
+        parser: PBSProParser,
+        workers: int = 0,
+        threshold: int = DEFAULT_THRESHOLD,
+    ) -> None:
+        self.parser = parser
+        self.workers = workers
+        self.threshold = threshold
+
+    def convert(
+        self, res_lists: Dict[str, Dict[str, Any]]
+    ) -> Dict[str, Dict[str, Any]]:
+        if self.workers > 1 and len(res_lists) >= max(1, self.threshold):
+            try:
+                return self._convert_parallel(res_lists)
+            except Exception:
+                logging.exception(
+                    "Could not parse %d jobs with %d processes."
+                    + " Parsing them serially instead.",
+                    len(res_lists),
+                    self.workers,
+                )
+
+        return dict(
+            [
+                (job_id, self.parser.convert_resource_list(res_list))
+                for job_id, res_list in res_lists.items()
+            ]
+        )
+
+    def _convert_parallel(
+        self, res_lists: Dict[str, Dict[str, Any]]
+    ) -> Dict[str, Dict[str, Any]]:
+        items = list(res_lists.items())
+        # a few shards per worker, so one slow shard does not hold up the rest
+        shard_size = max(1, len(items) // (self.workers * DEFAULT_SHARDS_PER_WORKER))
+        shards = [items[i : i + shard_size] for i in range(0, len(items), shard_size)]
+
+        ret: Dict[str, Dict[str, Any]] = {}
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.parser.resource_definitions,),
+        ) as pool:
+            for converted in pool.map(_convert_shard, shards):
+                ret.update(converted)
+        return ret
+
+
+def new_resource_list_converter(
+    config: Dict, parser: PBSProParser
+) -> ResourceListConverter:
+    """
+    "pbspro": {"parallel_parse": {"workers": 4, "threshold": 10000}}
+    workers defaults to 0, i.e. off. Use "auto" for one per cpu.
+    """
+    parallel_config = config.get("pbspro", {}).get("parallel_parse", {})
+    workers = parallel_config.get("workers", 0)
+    if workers == "auto":
+        workers = os.cpu_count() or 1
+    return ResourceListConverter(
+        parser,
+        workers=int(workers),
+        threshold=int(parallel_config.get("threshold", DEFAULT_THRESHOLD)),
+    )
@@ -290,6 +290,11 @@ class PBSProParser:
                     current_record = {}
                 continue
 
+            if current_record and "=" not in line and _is_object_header(line):
+                # several qmgr commands in one call, e.g. list server; list sched
+                ret.append(current_record)
+                current_record = {}
+
             if not current_record:
                 try:
                     obj_type, obj_name = line.split()
@@ -354,6 +359,22 @@ class PBSProParser:
 
         return ret
 
+    def parse_limits(self, record: Dict[str, str]) -> Dict[str, "PBSProLimit"]:
+        """
+        Parses the max_run and max_run_res.* limits of a server or queue record,
+        keyed by attribute name. Limits that are not plain integers, like
+        max_run_res.mem, are ignored.
+        """
+        ret: Dict[str, "PBSProLimit"] = {}
+        for key, value in record.items():
+            if key != "max_run" and not key.startswith("max_run_res."):
+                continue
+            try:
+                ret[key] = self.parse_limit_expression(value)
+            except (ValueError, RuntimeError) as e:
+                logging.warning("Ignoring limit %s = %s: %s", key, value, e)
+        return ret
+
     def parse_resources_from_sched_priv(self, path: str) -> Set[str]:
 
         with io.open(path, "r", encoding="utf-8") as fr:
@@ -368,6 +389,14 @@ class PBSProParser:
         )
 
 
+QMGR_OBJECT_TYPES = set(["Server", "Sched", "Queue", "Resource", "Node", "Hook"])
+
+
+def _is_object_header(line: str) -> bool:
+    toks = line.split()
+    return len(toks) == 2 and toks[0] in QMGR_OBJECT_TYPES
+
+
 _PARSER = None
 
 
@@ -1,9 +1,10 @@
 import json
 import os
+import threading
 from json.decoder import JSONDecodeError
 from shutil import which
-from subprocess import PIPE, CalledProcessError, check_output
-from typing import Dict, List
+from subprocess import PIPE, STDOUT, CalledProcessError, Popen, check_output
+from typing import Dict, List, Optional, Tuple
 
 from hpc.autoscale import hpclogging as logging
 
@@ -12,15 +13,180 @@ from pbspro.parser import PBSProParser
 QSTAT_BIN = which("qstat") or ""
 QMGR_BIN = which("qmgr") or ""
 PBSNODES_BIN = which("pbsnodes") or ""
+STDBUF_BIN = which("stdbuf") or ""
+
+
+class QmgrSessionDied(RuntimeError):
+    pass
+
+
+class QmgrSession:
+    """
+    A long lived qmgr coprocess. Commands are written to its stdin and every
+    command is followed by a sentinel command that fails with a unique object name,
+    so we know where one response ends and the next begins. qmgr keeps going
+    after a failed command unless -a is passed, so the sentinel is harmless.
+
+    qmgr uses stdio, so stdbuf is required to line buffer its output - otherwise
+    stdout and stderr can arrive out of order.
+    """
+
+    SENTINEL_PREFIX = "__azpbs_eor_"
+
+    def __init__(self, qmgr_bin: str, stdbuf_bin: str) -> None:
+        self.qmgr_bin = qmgr_bin
+        self.stdbuf_bin = stdbuf_bin
+        self.restarts = 0
+        self.__proc: Optional[Popen] = None
+        self.__counter = 0
+        self.__skip_trailer = False
+        self.__lock = threading.Lock()
+
+    def execute(self, command: str) -> str:
+        """
+        Runs a single qmgr command and returns its combined stdout/stderr.
+        Raises CalledProcessError if qmgr reported an error.
+        """
+        cmd = [self.qmgr_bin, "-c", command]
+        with self.__lock:
+            try:
+                output = self._execute(command)
+            except QmgrSessionDied as e:
+                logging.warning("qmgr session died (%s). Restarting it.", e)
+                self._terminate()
+                self.restarts += 1
+                try:
+                    output = self._execute(command)
+                except QmgrSessionDied as e:
+                    self._terminate()
+                    raise CalledProcessError(-1, cmd, b"", str(e).encode())
+
+        if _is_qmgr_error(output):
+            raise CalledProcessError(1, cmd, output.encode(), output.encode())
+        return output
+
+    def close(self) -> None:
+        with self.__lock:
+            self._terminate()
+
+    def _process(self) -> Popen:
+        if self.__proc is None or self.__proc.poll() is not None:
+            self.__proc = Popen(
+                [self.stdbuf_bin, "-oL", "-eL", self.qmgr_bin],
+                stdin=PIPE,
+                stdout=PIPE,
+                stderr=STDOUT,
+                universal_newlines=True,
+            )
+            self.__skip_trailer = False
+        return self.__proc
+
+    def _execute(self, command: str) -> str:
+        proc = self._process()
+        assert proc.stdin and proc.stdout
+
+        self.__counter += 1
+        sentinel = "{}{}_{}__".format(self.SENTINEL_PREFIX, os.getpid(), self.__counter)
+
+        try:
+            proc.stdin.write("{}\nlist node {}\n".format(command, sentinel))
+            proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise QmgrSessionDied(str(e))
+
+        lines = []
+        while True:
+            line = proc.stdout.readline()
+            if not line:
+                raise QmgrSessionDied("qmgr exited with {}".format(proc.poll()))
+
+            if line.startswith("Qmgr: "):
+                line = line[len("Qmgr: ") :]
+
+            if line.startswith("Max open servers:"):
+                # banner printed when qmgr starts up
+                continue
+
+            if sentinel in line:
+                break
+
+            # the previous sentinel's 'qmgr: Error (...) returned from server' line
+            if self.__skip_trailer and not lines and _is_error_trailer(line):
+                continue
+
+            lines.append(line)
+
+        self.__skip_trailer = True
+        return "".join(lines)
+
+    def _terminate(self) -> None:
+        if self.__proc is None:
+            return
+        proc, self.__proc = self.__proc, None
+        try:
+            if proc.stdin:
+                proc.stdin.close()
+            proc.wait(timeout=5)
+        except Exception:
+            proc.kill()
+
+
+def _is_error_trailer(line: str) -> bool:
+    return line.startswith("qmgr: Error (") and "returned from server" in line
+
+
+def parse_qmgr_failures(output: str) -> Dict[str, str]:
+    """
+    qmgr obj=host1 svr=default: Unknown node
+    qmgr: Error (15062) returned from server
+    -> {"host1": "Unknown node"}
+    """
+    ret: Dict[str, str] = {}
+    for line in output.splitlines():
+        if line.startswith("Qmgr: "):
+            line = line[len("Qmgr: ") :]
+        if not line.startswith("qmgr obj="):
+            continue
+        obj_expr, _, message = line.partition(":")
+        obj_name = obj_expr[len("qmgr obj=") :].split(" ")[0]
+        if obj_name:
+            ret[obj_name] = message.strip()
+    return ret
+
+
+def _decode_output(*outputs: Optional[bytes]) -> str:
+    decoded = []
+    for output in outputs:
+        if output:
+            decoded.append(
+                output.decode() if isinstance(output, bytes) else str(output)
+            )
+    return "\n".join(decoded)
+
+
+def _is_qmgr_error(output: str) -> bool:
+    for line in output.splitlines():
+        if line.startswith("qmgr obj=") or line.startswith("qmgr: "):
+            return True
+    return False
 
 
 class PBSCMD:
-    def __init__(self, parser: PBSProParser) -> None:
+    def __init__(self, parser: PBSProParser, qmgr_session: bool = False) -> None:
         super().__init__()
         self.parser = parser
         if not QSTAT_BIN or not QMGR_BIN or not PBSNODES_BIN:
             raise RuntimeError(f"Could not find qstat, qmgr and pbsnodes in the PATH. Current path is {os.environ['PATH']}")
 
+        self.qmgr_session: Optional[QmgrSession] = None
+        if qmgr_session:
+            if STDBUF_BIN:
+                self.qmgr_session = QmgrSession(QMGR_BIN, STDBUF_BIN)
+            else:
+                logging.warning(
+                    "stdbuf is not in the PATH, so pbspro.qmgr_session can not be used."
+                )
+
     def qstat(self, *args: str) -> str:
         cmd = [QSTAT_BIN] + list(args)
         return self._check_output(cmd)
@@ -47,12 +213,42 @@ class PBSCMD:
 
     def qmgr(self, *args: str) -> str:
         cmd = [QMGR_BIN, "-c"] + [" ".join([str(x) for x in args])]
+        if self.qmgr_session:
+            return self._session_output(self.qmgr_session, cmd)
         return self._check_output(cmd)
 
     def qmgr_parsed(self, *args: str) -> List[Dict[str, str]]:
         raw_output = self.qmgr(*args)
         return self.parser.parse_key_value(raw_output)
 
+    def qmgr_script_parsed(self, *commands: Tuple[str, ...]) -> List[Dict[str, str]]:
+        """
+        Runs several commands, e.g. ("list", "server"), ("list", "sched"), in a
+        single qmgr call. Use each record's obj_type to tell them apart.
+        """
+        script = "; ".join([" ".join([str(x) for x in cmd]) for cmd in commands])
+        return self.parser.parse_key_value(self.qmgr(script))
+
+    def qmgr_script(self, *commands: Tuple[str, ...]) -> Dict[str, str]:
+        """
+        Runs several commands that each name one object, e.g.
+        ("delete", "node", "host1"), ("delete", "node", "host2"), in a single qmgr
+        call. qmgr carries on past a failed command, so this returns the object
+        name -> error message of each command that failed. Raises the
+        CalledProcessError if qmgr failed without naming any object.
+        """
+        if not commands:
+            return {}
+        script = "; ".join([" ".join([str(x) for x in cmd]) for cmd in commands])
+        try:
+            self.qmgr(script)
+            return {}
+        except CalledProcessError as e:
+            failures = parse_qmgr_failures(_decode_output(e.output, e.stderr))
+            if not failures:
+                raise
+            return failures
+
     def pbsnodes(self, *args: str) -> str:
         cmd = [PBSNODES_BIN] + list(args)
         try:
@@ -67,6 +263,26 @@ class PBSCMD:
         raw_output = self.pbsnodes(*args)
         return self.parser.parse_key_value(raw_output)
 
+    def close(self) -> None:
+        """
+        Releases any long lived resources, i.e. the qmgr session.
+        """
+        if self.qmgr_session:
+            self.qmgr_session.close()
+
+    def _session_output(self, session: QmgrSession, cmd: List[str]) -> str:
+        logger = logging.getLogger("pbspro.driver")
+
+        logger.info("Running (session): %s", " ".join(cmd))
+
+        try:
+            ret = session.execute(cmd[-1])
+            logger.info("Response: %s", ret)
+            return ret
+        except CalledProcessError as e:
+            logger.debug(str(e))
+            raise
+
     def _check_output(self, cmd: List[str]) -> str:
         logger = logging.getLogger("pbspro.driver")
 
@@ -79,3 +295,35 @@ class PBSCMD:
         except CalledProcessError as e:
             logger.debug(str(e))
             raise
+
+
+def new_pbscmd(parser: PBSProParser, config: Optional[Dict] = None) -> PBSCMD:
+    """
+    Picks the PBSCMD backend based on pbspro.pbscmd_backend - either "cli" (default)
+    or "ifl", which uses libpbs directly and falls back to the cli if libpbs
+    can not be loaded. pbspro.qmgr_session=true routes all qmgr commands
+    through a single long lived qmgr process.
+    """
+    pbs_config = (config or {}).get("pbspro", {})
+    backend = pbs_config.get("pbscmd_backend", "cli")
+    qmgr_session = bool(pbs_config.get("qmgr_session", False))
+
+    if backend == "ifl":
+        from pbspro.ifl import IFLPBSCMD, load_libpbs
+
+        libpbs = load_libpbs(pbs_config.get("libpbs_path"))
+        if libpbs is not None:
+            return IFLPBSCMD(
+                parser,
+                libpbs,
+                server=pbs_config.get("pbs_server"),
+                qmgr_session=qmgr_session,
+            )
+        logging.warning("Could not load libpbs, falling back to the PBS cli commands.")
+    elif backend != "cli":
+        logging.warning(
+            "Unknown pbspro.pbscmd_backend '%s', expected cli or ifl. Using cli.",
+            backend,
+        )
+
+    return PBSCMD(parser, qmgr_session=qmgr_session)
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Tuple
 
 import typing_extensions
 from hpc.autoscale.node import constraints as conslib
@@ -6,6 +6,7 @@ from hpc.autoscale.node import constraints as conslib
 from pbspro.parser import get_pbspro_parser
 from pbspro.pbscmd import PBSCMD
 from pbspro.resource import PBSProResourceDefinition, ResourceState
+from pbspro.serverconfig import ServerConfig
 from pbspro.util import filter_non_host_resources
 
 StateCountType = typing_extensions.Literal[
@@ -38,6 +39,8 @@ class PBSProQueue:
         resource_definitions: Dict[str, PBSProResourceDefinition],
         enabled: bool,
         started: bool,
+        limits: Optional[Dict[str, "PBSProLimit"]] = None,
+        partition: Optional[str] = None,
     ) -> None:
         """{
             "type": "Queue",
@@ -60,7 +63,20 @@ class PBSProQueue:
         self.enabled = enabled
         self.started = started
         self.resource_state = resource_state
+        # max_run / max_run_res.* -> limit
+        self.limits: Dict[str, PBSProLimit] = limits or {}
+        # multi-sched partition, None for queues of the default scheduler
+        self.partition = partition
         self.__resource_definitions = filter_non_host_resources(resource_definitions)
+        self.__constraint_factory: Optional[QueueConstraintFactory] = None
+
+    @property
+    def constraint_factory(self) -> "QueueConstraintFactory":
+        if self.__constraint_factory is None:
+            self.__constraint_factory = QueueConstraintFactory(
+                self.__resource_definitions, self.resource_state.shared_resources
+            )
+        return self.__constraint_factory
 
     @property
     def uses_placement(self) -> bool:
@@ -100,71 +116,85 @@ class PBSProQueue:
     def get_non_host_constraints(
         self, pbs_resources: Dict[str, Any], nodect: int
     ) -> List[conslib.NodeConstraint]:
-        ret: List[conslib.NodeConstraint] = []
+        return self.constraint_factory.get_constraints(pbs_resources, nodect)
 
-        for rname, rvalue in pbs_resources.items():
-            resource = self.__resource_definitions.get(rname)
+    def __repr__(self) -> str:
+        return "Queue(name={}, running={}, queued={}, total={})".format(
+            self.name,
+            self.state_count.get("Running"),
+            self.state_count.get("Queued"),
+            self.total_jobs,
+        )
 
-            if not resource:
+
+class QueueConstraintFactory:
+    """
+    Builds the queue/server level (non-host) constraints for a job chunk. Which
+    resources are shared, and whether they are consumable, is worked out once
+    when the factory is created, so each chunk is only a dict lookup per resource.
+    Identical requests get the same constraint object back - constraints only
+    reference the shared resources, they do not hold any state of their own.
+    """
+
+    def __init__(
+        self,
+        resource_definitions: Dict[str, PBSProResourceDefinition],
+        shared_resources: Dict[str, List[conslib.SharedResource]],
+    ) -> None:
+        self.non_host_resources: FrozenSet[str] = frozenset(
+            [k for k, v in resource_definitions.items() if not v.is_host]
+        )
+        # resource name -> (is_consumable, shared resource list)
+        self.__shared: Dict[str, Tuple[bool, List[conslib.SharedResource]]] = {}
+        for rname in self.non_host_resources:
+            shared_resource_list = shared_resources.get(rname)
+            if shared_resource_list is None:
                 continue
+            self.__shared[rname] = (
+                bool(shared_resource_list) and shared_resource_list[0].is_consumable,
+                shared_resource_list,
+            )
+        self.__cache: Dict[Tuple[str, Hashable], conslib.NodeConstraint] = {}
+
+    def get_constraints(
+        self, pbs_resources: Dict[str, Any], nodect: int
+    ) -> List[conslib.NodeConstraint]:
+        ret: List[conslib.NodeConstraint] = []
 
-            if resource.is_host:
+        for rname, rvalue in pbs_resources.items():
+            if rname not in self.non_host_resources:
                 continue
 
-            if rname not in self.resource_state.shared_resources:
+            if rname not in self.__shared:
                 raise RuntimeError(
                     f"Undefined resource {rname}. Is this a misconfigured server_dyn_res?"
                 )
 
-            shared_resource_list: List[
-                conslib.SharedResource
-            ] = self.resource_state.shared_resources[rname]
-
+            is_consumable, shared_resource_list = self.__shared[rname]
             assert (
                 shared_resource_list
             ), "Error while processing queue/server resource {}".format(rname)
+            amount = rvalue / nodect if is_consumable else rvalue
+
+            try:
+                key = (rname, amount)
+                cons = self.__cache.get(key)
+            except TypeError:
+                # unhashable value, just build it
+                ret.append(self._new_constraint(rname, amount))
+                continue
 
-            if shared_resource_list[0].is_consumable:
+            if cons is None:
+                cons = self.__cache[key] = self._new_constraint(rname, amount)
+            ret.append(cons)
 
-                ret.append(
-                    conslib.SharedConsumableConstraint(
-                        shared_resource_list, rvalue / nodect
-                    )
-                )
-            else:
-                ret.append(
-                    conslib.SharedNonConsumableConstraint(
-                        shared_resource_list[0], rvalue
-                    )
-                )
         return ret
 
-    def __repr__(self) -> str:
-        return "Queue(name={}, running={}, queued={}, total={})".format(
-            self.name,
-            self.state_count.get("Running"),
-            self.state_count.get("Queued"),
-            self.total_jobs,
-        )
-
-
-def list_queue_names(pbscmd: PBSCMD) -> List[str]:
-    ret = []
-
-    lines_less_header = pbscmd.qstat("-Q").splitlines()[1:]
-    for line in lines_less_header:
-        line = line.strip()
-
-        if not line:
-            continue
-
-        if line.startswith("---"):
-            continue
-
-        qname = line.split()[0]
-        ret.append(qname)
-
-    return ret
+    def _new_constraint(self, rname: str, amount: Any) -> conslib.NodeConstraint:
+        is_consumable, shared_resource_list = self.__shared[rname]
+        if is_consumable:
+            return conslib.SharedConsumableConstraint(shared_resource_list, amount)
+        return conslib.SharedNonConsumableConstraint(shared_resource_list[0], amount)
 
 
 def read_queues(
@@ -172,12 +202,15 @@ def read_queues(
     pbscmd: PBSCMD,
     resource_definitions: Dict[str, PBSProResourceDefinition],
     scheduler_shared_resources: Dict[str, conslib.SharedResource],
+    server_config: Optional[ServerConfig] = None,
 ) -> Dict[str, PBSProQueue]:
     parser = get_pbspro_parser()
 
     ret: Dict[str, PBSProQueue] = {}
-    qnames = list_queue_names(pbscmd)
-    queue_dicts = pbscmd.qmgr_parsed("list", "queue", ",".join(qnames))
+    if server_config:
+        queue_dicts = server_config.queues
+    else:
+        queue_dicts = pbscmd.qmgr_parsed("list", "queue")
 
     # queue resources will include things like ncpus - i.e. the total amount of ncpus etc
     # They are meaningless as a shared constraint, they are only there for info purposes
@@ -202,6 +235,8 @@ def read_queues(
             enabled=qdict["enabled"].lower() == "true"
             and qdict["name"] not in ignore_queues,
             started=qdict["started"].lower() == "true",
+            limits=parser.parse_limits(qdict),
+            partition=qdict.get("partition") or None,
         )
         ret[queue.name] = queue
 
@@ -0,0 +1,132 @@
+import bisect
+from typing import Any, Dict, List, Optional, Tuple
+
+from hpc.autoscale import hpclogging as logging
+
+
+class PlacementGroupSummary:
+    def __init__(self, group_id: str, nodearray: str, vm_size: str) -> None:
+        self.group_id = group_id
+        self.nodearray = nodearray
+        self.vm_size = vm_size
+        self.node_count = 0
+        self.free_count = 0
+        self.free_ncpus = 0
+        self.job_ids: List[str] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "group_id": self.group_id,
+            "nodearray": self.nodearray,
+            "vm_size": self.vm_size,
+            "node_count": self.node_count,
+            "free_count": self.free_count,
+            "free_ncpus": self.free_ncpus,
+            "job_ids": self.job_ids,
+        }
+
+    def __repr__(self) -> str:
+        return "PlacementGroup({}, {}/{}, free={}/{})".format(
+            self.group_id,
+            self.nodearray,
+            self.vm_size,
+            self.free_count,
+            self.node_count,
+        )
+
+
+class PlacementGroupIndex:
+    """
+    Free capacity per placement group (group_id), built from the node manager's
+    nodes for azpbs placement_groups. The autoscale iteration does not use it.
+    Groups are kept sorted by free node count, so finding the smallest group
+    that can hold a colocated job is a bisect rather than a scan over every
+    node.
+
+    A node is free if it has no assignments and is not closed.
+    """
+
+    def __init__(self, nodes: List[Any]) -> None:
+        self.groups: Dict[str, PlacementGroupSummary] = {}
+        for node in nodes:
+            if not node.placement_group:
+                continue
+            summary = self.groups.get(node.placement_group)
+            if summary is None:
+                summary = PlacementGroupSummary(
+                    node.placement_group, node.nodearray, node.vm_size
+                )
+                self.groups[node.placement_group] = summary
+
+            summary.node_count += 1
+            if node.assignments:
+                for job_id in node.assignments:
+                    if job_id not in summary.job_ids:
+                        summary.job_ids.append(job_id)
+            elif not node.closed:
+                summary.free_count += 1
+                ncpus = node.available.get("ncpus")
+                if isinstance(ncpus, int):
+                    summary.free_ncpus += ncpus
+
+        # (free_count, group_id), ascending
+        self.__sorted: List[Tuple[int, str]] = sorted(
+            [(s.free_count, s.group_id) for s in self.groups.values()]
+        )
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def best_fit(
+        self, node_count: int, nodearray: Optional[str] = None
+    ) -> Optional[PlacementGroupSummary]:
+        """
+        The group with the fewest free nodes that still has node_count free nodes,
+        or None if a colocated job of this size needs new nodes.
+        """
+        start = bisect.bisect_left(self.__sorted, (node_count, ""))
+        for _, group_id in self.__sorted[start:]:
+            summary = self.groups[group_id]
+            if nodearray is None or summary.nodearray == nodearray:
+                return summary
+        return None
+
+    def largest_free(self) -> int:
+        return self.__sorted[-1][0] if self.__sorted else 0
+
+    def reserve(self, group_id: str, node_count: int, job_id: str = "") -> None:
+        """
+        Takes node_count free nodes from a group, so that the next best_fit
+        takes earlier jobs into account.
+        """
+        summary = self.groups[group_id]
+        self.__sorted.remove((summary.free_count, group_id))
+        summary.free_count = max(0, summary.free_count - node_count)
+        if job_id and job_id not in summary.job_ids:
+            summary.job_ids.append(job_id)
+        bisect.insort(self.__sorted, (summary.free_count, group_id))
+
+    def match_jobs(self, jobs: List[Any]) -> Dict[str, Optional[str]]:
+        """
+        Pending colocated job name -> the group it fits in or None, in the order
+        the demand calculator sees the jobs.
+        """
+        ret: Dict[str, Optional[str]] = {}
+        for job in jobs:
+            if not job.colocated or job.metadata.get("job_state") == "running":
+                continue
+
+            summary = self.best_fit(job.node_count)
+            if summary:
+                self.reserve(summary.group_id, job.node_count, job.name)
+                ret[job.name] = summary.group_id
+            else:
+                ret[job.name] = None
+                logging.info(
+                    "Colocated job %s needs %d nodes, but the most free nodes in an"
+                    + " existing placement group is %d. It will need new nodes.",
+                    job.name,
+                    job.node_count,
+                    self.largest_free(),
+                )
+        return ret
@@ -1,7 +1,9 @@
+import functools
 import os
+import sys
 from abc import abstractmethod
 from subprocess import CalledProcessError
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 import typing_extensions
 from hpc.autoscale import hpclogging as logging
@@ -10,6 +12,7 @@ from hpc.autoscale.hpctypes import add_magnitude_conversion
 from hpc.autoscale.node.constraints import SharedResource
 
 from pbspro.pbscmd import PBSCMD
+from pbspro.serverconfig import ServerConfig, read_server_config
 
 add_magnitude_conversion("w", 8)
 add_magnitude_conversion("kb", 1 * 1024)
@@ -55,6 +58,11 @@ class ResourceType:
 
 VALID_TRUE = ["TRUE", "True", "true", "T", "t", "Y", "y", "1"]
 VALID_FALSE = ["FALSE", "False", "false", "F", "f", "N", "n", "0"]
+_BOOLEANS = dict([(x, True) for x in VALID_TRUE] + [(x, False) for x in VALID_FALSE])
+
+# parse is called for every attribute of every job, node and queue, and the
+# same handful of expressions (16gb, 01:00:00 etc) show up over and over.
+_PARSE_CACHE_SIZE = 4096
 
 
 class BooleanType(ResourceType):
@@ -65,11 +73,9 @@ class BooleanType(ResourceType):
         """
 
         expr = str(expr)  # in case an int etc gets passed in
-        if expr in VALID_TRUE:
-            return True
-
-        if expr in VALID_FALSE:
-            return False
+        ret = _BOOLEANS.get(expr)
+        if ret is not None:
+            return ret
 
         raise ResourceParsingError(
             "Could not parse '{}' as a boolean. Expected one of {} or {}",
@@ -91,45 +97,56 @@ class DurationType(ResourceType):
                     [[HH:]MM:]SS[.milliseconds]
                 Milliseconds are rounded to the nearest second.
         """
+        if not isinstance(expr, str):
+            return int(expr)
+        return _parse_duration(expr)
+
+
+@functools.lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _parse_duration(expr: str) -> int:
+    if expr.isdecimal():
+        return int(expr)
+
+    if ":" not in expr and "." not in expr:
         try:
             return int(expr)
         except ValueError:
             pass
 
-        def _parse_int(e: str) -> int:
-            try:
-                return int(e)
-            except ValueError:
-                raise ResourceParsingError("Could not parse {} as an int".format(e))
+    def _parse_int(e: str) -> int:
+        try:
+            return int(e)
+        except ValueError:
+            raise ResourceParsingError("Could not parse {} as an int".format(e))
 
-        toks = expr.split(":")
-        # I'll just always add a milliseconds here
-        if "." in toks[-1]:
-            toks = toks[:-1] + toks[-1].split(".")
-        else:
-            toks = toks + ["0"]
+    toks = expr.split(":")
+    # I'll just always add a milliseconds here
+    if "." in toks[-1]:
+        toks = toks[:-1] + toks[-1].split(".")
+    else:
+        toks = toks + ["0"]
 
-        if len(toks) > 4:
-            raise ResourceParsingError(
-                "Too many fields ({} > 4): Could not parse duration '{}': expected [[hours:]minutes:]seconds[.milliseconds]".format(
-                    len(toks), expr
-                )
+    if len(toks) > 4:
+        raise ResourceParsingError(
+            "Too many fields ({} > 4): Could not parse duration '{}': expected [[hours:]minutes:]seconds[.milliseconds]".format(
+                len(toks), expr
             )
+        )
 
-        # weird... I guess I'll handle rounding myself
-        # >>> round(.5)
-        #    0
-        rounded_ms = 1 if _parse_int(toks[-1][0]) >= 5 else 0
+    # weird... I guess I'll handle rounding myself
+    # >>> round(.5)
+    #    0
+    rounded_ms = 1 if _parse_int(toks[-1][0]) >= 5 else 0
 
-        seconds = _parse_int(toks[-2]) + rounded_ms
+    seconds = _parse_int(toks[-2]) + rounded_ms
 
-        if len(toks) >= 3:
-            seconds += _parse_int(toks[-3]) * 60
+    if len(toks) >= 3:
+        seconds += _parse_int(toks[-3]) * 60
 
-        if len(toks) == 4:
-            seconds += _parse_int(toks[-4]) * 60 * 60
+    if len(toks) == 4:
+        seconds += _parse_int(toks[-4]) * 60 * 60
 
-        return seconds
+    return seconds
 
 
 class FloatType(ResourceType):
@@ -150,6 +167,16 @@ class LongType(ResourceType):
 
 class SizeType(ResourceType):
     def parse(self, expr: str) -> Any:
+        try:
+            return _parse_size(expr)
+        except TypeError:
+            # unhashable, so it can not be cached
+            pass
+        except Exception:
+            raise ResourceParsingError(
+                "Could not parse '{}' as type size (e.g. 1mb)".format(expr)
+            )
+
         try:
             return HPCSize.value_of(expr)
         except Exception:
@@ -158,15 +185,22 @@ class SizeType(ResourceType):
             )
 
 
+@functools.lru_cache(maxsize=_PARSE_CACHE_SIZE)
+def _parse_size(expr: str) -> HPCSize:
+    # Sizes are immutable, so handing out the same instance is safe
+    return HPCSize.value_of(expr)
+
+
 class StringType(ResourceType):
     def parse(self, expr: str) -> Any:
-        return str(expr)
+        # interned, as the same hostnames, queue names etc repeat across objects
+        return sys.intern(str(expr))
 
 
 class StringArrayType(ResourceType):
     def parse(self, expr: str) -> Any:
         expr = str(expr)
-        return [x.strip() for x in expr.split(",")]
+        return [sys.intern(x.strip()) for x in expr.split(",")]
 
 
 RESOURCE_TYPES: Dict[str, "ResourceType"] = {
@@ -181,10 +215,11 @@ RESOURCE_TYPES: Dict[str, "ResourceType"] = {
 
 
 def read_resource_definitions(
-    pbscmd: PBSCMD, config: Dict
+    pbscmd: PBSCMD, config: Dict, server_config: Optional[ServerConfig] = None
 ) -> Dict[str, "PBSProResourceDefinition"]:
     ret: Dict[str, PBSProResourceDefinition] = {}
-    res_dicts = pbscmd.qmgr_parsed("list", "resource")
+    server_config = server_config or read_server_config(pbscmd)
+    res_dicts = server_config.resources
 
     res_names = set([x["name"] for x in res_dicts])
 
@@ -192,8 +227,10 @@ def read_resource_definitions(
     # as a backup plan
     read_only = config.get("pbspro", {}).get("read_only_resources", ["host", "vnode"])
 
-    def_sched = pbscmd.qmgr_parsed("list", "sched", "default")
-    sched_priv = def_sched[0]["sched_priv"]
+    def_sched = server_config.get_sched("default")
+    if not def_sched:
+        raise RuntimeError("No default scheduler found!")
+    sched_priv = def_sched["sched_priv"]
     sched_config = os.path.join(sched_priv, "sched_config")
     from pbspro.parser import PBSProParser
 
@@ -0,0 +1,104 @@
+import math
+from typing import Dict, List, Tuple
+
+from hpc.autoscale import hpclogging as logging
+from hpc.autoscale.node.node import Node
+
+from pbspro.demandhistory import DemandHistory, node_bucket_key
+
+
+def select_for_scaledown(
+    config: Dict,
+    candidates: List[Node],
+    all_nodes: List[Node],
+    demand_history: DemandHistory,
+) -> List[Node]:
+    """
+    Filters the nodes that reached the idle_timeout down to the ones we should
+    actually drain, to avoid deleting nodes that will be needed again minutes later.
+
+    pbspro.scaledown.warm_pool - idle nodes to keep per nodearray, e.g. {"htc": 2}
+    pbspro.scaledown.demand_window - keep as many idle nodes per bucket as
+        newly submitted jobs are expected to need within this many seconds.
+        0, the default, disables this.
+    pbspro.scaledown.max_per_iteration - drain at most this many nodes per iteration
+
+    Nodes from the buckets with the lowest recent demand are drained first.
+    """
+    scaledown_config = config.get("pbspro", {}).get("scaledown", {})
+    warm_pool: Dict[str, int] = scaledown_config.get("warm_pool", {})
+    demand_window = int(scaledown_config.get("demand_window", 0))
+    max_per_iteration = scaledown_config.get("max_per_iteration")
+
+    if not candidates:
+        return []
+
+    candidate_names = set([n.name for n in candidates])
+
+    # idle nodes that have not reached the idle_timeout already count towards
+    # what we want to keep
+    keep_by_nodearray: Dict[str, int] = dict(
+        [(k, int(v)) for k, v in warm_pool.items()]
+    )
+    keep_by_bucket: Dict[str, int] = {}
+    if demand_window > 0:
+        for key, expected in demand_history.forecast(demand_window).items():
+            keep_by_bucket[key] = int(math.floor(expected))
+
+    for node in all_nodes:
+        if node.name in candidate_names or not _is_idle(node):
+            continue
+        if keep_by_nodearray.get(node.nodearray, 0) > 0:
+            keep_by_nodearray[node.nodearray] -= 1
+        key = node_bucket_key(node)
+        if keep_by_bucket.get(key, 0) > 0:
+            keep_by_bucket[key] -= 1
+
+    def score(node: Node) -> Tuple[float, float, float, str]:
+        bucket = demand_history.get(node_bucket_key(node))
+        return (
+            bucket.demand,
+            bucket.arrival_rate,
+            bucket.last_demand_time,
+            node.name,
+        )
+
+    # keep the nodes in the busiest buckets, drain the rest
+    to_drain: List[Node] = []
+    kept: List[Node] = []
+    for node in sorted(candidates, key=score, reverse=True):
+        key = node_bucket_key(node)
+        if keep_by_bucket.get(key, 0) > 0:
+            keep_by_bucket[key] -= 1
+            if keep_by_nodearray.get(node.nodearray, 0) > 0:
+                keep_by_nodearray[node.nodearray] -= 1
+            kept.append(node)
+        elif keep_by_nodearray.get(node.nodearray, 0) > 0:
+            keep_by_nodearray[node.nodearray] -= 1
+            kept.append(node)
+        else:
+            to_drain.append(node)
+
+    to_drain.reverse()
+
+    if max_per_iteration is not None and len(to_drain) > int(max_per_iteration):
+        kept.extend(to_drain[int(max_per_iteration) :])
+        to_drain = to_drain[: int(max_per_iteration)]
+
+    if kept:
+        logging.info(
+            "Keeping %s idle nodes for expected demand or the warm pool: %s",
+            len(kept),
+            [str(n) for n in kept],
+        )
+
+    return to_drain
+
+
+def _is_idle(node: Node) -> bool:
+    return (
+        node.exists
+        and not node.assignments
+        and not node.closed
+        and node.state not in ["Failed", "Terminating", "Deallocating"]
+    )
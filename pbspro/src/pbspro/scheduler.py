@@ -1,19 +1,26 @@
 import os
-from typing import Dict, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
 from hpc.autoscale import hpclogging as logging
-from hpc.autoscale.hpctypes import Hostname
 from hpc.autoscale.util import partition_single
 
 from pbspro.constants import ServerStates
 from pbspro.parser import get_pbspro_parser
 from pbspro.pbscmd import PBSCMD
+from pbspro.pbsqueue import PBSProLimit
 from pbspro.resource import BooleanType, PBSProResourceDefinition, ResourceState
+from pbspro.serverconfig import ServerConfig, read_server_config
+
+if TYPE_CHECKING:
+    from pbspro.pbsqueue import PBSProQueue
 
 
 class PBSProScheduler:
     def __init__(
-        self, sched_dict: Dict[str, str], resource_state: ResourceState,
+        self,
+        sched_dict: Dict[str, str],
+        resource_state: ResourceState,
+        limits: Optional[Dict[str, PBSProLimit]] = None,
     ) -> None:
         btype = BooleanType()
         self.do_not_span_psets = btype.parse(
@@ -36,7 +43,14 @@ class PBSProScheduler:
         )
         self.state = sched_dict["state"]
         self.hostname = sched_dict["sched_host"].split(".")[0]
+        self.name = sched_dict.get("name", "default")
+        # multi-sched: the partitions of the queues this scheduler schedules
+        self.partitions: List[str] = [
+            p.strip() for p in sched_dict.get("partition", "").split(",") if p.strip()
+        ]
         self.resource_state = resource_state
+        # server level max_run / max_run_res.* -> limit
+        self.limits: Dict[str, PBSProLimit] = limits or {}
 
         try:
             self.pbs_version: Tuple = tuple(
@@ -64,16 +78,33 @@ class PBSProScheduler:
     def is_default(self) -> bool:
         return self.sched_dict["name"] == "default"
 
+    def serves_queue(self, queue: "PBSProQueue") -> bool:
+        """
+        Queues without a partition belong to the default scheduler.
+        """
+        if not queue.partition:
+            return self.is_default
+        return queue.partition in self.partitions
+
     def __repr__(self) -> str:
-        return "Scheduler(hostname={}, state={})".format(self.hostname, self.state,)
+        return "Scheduler(name={}, hostname={}, state={})".format(
+            self.name, self.hostname, self.state
+        )
 
 
 def read_schedulers(
-    pbscmd: PBSCMD, resource_definitions: Dict[str, PBSProResourceDefinition]
-) -> Dict[Hostname, PBSProScheduler]:
+    pbscmd: PBSCMD,
+    resource_definitions: Dict[str, PBSProResourceDefinition],
+    server_config: Optional[ServerConfig] = None,
+) -> Dict[str, PBSProScheduler]:
+    """
+    Keyed by scheduler name - with multi-sched, every scheduler usually runs on
+    the same host.
+    """
     parser = get_pbspro_parser()
-    sched_dicts = pbscmd.qmgr_parsed("list", "sched")
-    server_dicts = pbscmd.qmgr_parsed("list", "server")
+    server_config = server_config or read_server_config(pbscmd)
+    sched_dicts = server_config.scheds
+    server_dicts = server_config.servers
 
     server_dicts_by_host = partition_single(server_dicts, lambda s: s["server_host"])
 
@@ -91,7 +122,9 @@ def read_schedulers(
         resource_state = parser.parse_resource_state(
             sched_dict, parent_shared_resources=None
         )
-        scheduler = PBSProScheduler(sched_dict, resource_state)
-        ret[scheduler.hostname] = scheduler
+        scheduler = PBSProScheduler(
+            sched_dict, resource_state, parser.parse_limits(sched_dict)
+        )
+        ret[scheduler.name] = scheduler
 
     return ret
@@ -0,0 +1,62 @@
+from subprocess import CalledProcessError
+from typing import Dict, List, Optional, Tuple
+
+from hpc.autoscale import hpclogging as logging
+
+from pbspro.pbscmd import PBSCMD
+
+COMBINED_COMMANDS: List[Tuple[str, ...]] = [
+    ("list", "server"),
+    ("list", "sched"),
+    ("list", "queue", "@default"),
+    ("list", "resource"),
+]
+
+
+class ServerConfig:
+    """
+    The server, scheduler, queue and resource records, which read_schedulers,
+    read_queues and read_resource_definitions would otherwise each query for.
+    """
+
+    def __init__(self, records: List[Dict[str, str]]) -> None:
+        self.servers: List[Dict[str, str]] = []
+        self.scheds: List[Dict[str, str]] = []
+        self.queues: List[Dict[str, str]] = []
+        self.resources: List[Dict[str, str]] = []
+        by_type = {
+            "server": self.servers,
+            "sched": self.scheds,
+            "queue": self.queues,
+            "resource": self.resources,
+        }
+        for record in records:
+            target = by_type.get(record.get("obj_type", "").lower())
+            if target is not None:
+                target.append(record)
+
+    def get_sched(self, name: str) -> Optional[Dict[str, str]]:
+        for sched in self.scheds:
+            if sched.get("name") == name:
+                return sched
+        return None
+
+
+def read_server_config(pbscmd: PBSCMD) -> ServerConfig:
+    """
+    A single qmgr call for everything. If that fails, e.g. an older qmgr that
+    does not accept several commands, each one is run on its own.
+    """
+    try:
+        return ServerConfig(pbscmd.qmgr_script_parsed(*COMBINED_COMMANDS))
+    except (CalledProcessError, AssertionError) as e:
+        logging.warning(
+            "Could not read the server configuration in one qmgr call, "
+            + "falling back to one call per object type: %s",
+            e,
+        )
+
+    records: List[Dict[str, str]] = []
+    for cmd in COMBINED_COMMANDS:
+        records.extend(pbscmd.qmgr_parsed(*[t for t in cmd if not t.startswith("@")]))
+    return ServerConfig(records)
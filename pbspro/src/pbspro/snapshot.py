@@ -0,0 +1,244 @@
+import json
+import os
+import time
+from subprocess import CalledProcessError
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from hpc.autoscale import hpclogging as logging
+
+from pbspro.parser import PBSProParser
+from pbspro.pbscmd import PBSCMD
+
+SNAPSHOT_FILE = "pbs_snapshot.json"
+SNAPSHOT_VERSION = 1
+
+# pbsnodes flags that modify a node rather than report on it
+_PBSNODES_WRITE_FLAGS = set(["-o", "-r", "-c", "-C", "-N", "-d"])
+
+
+def default_snapshot_path(config: Optional[Dict] = None) -> str:
+    path = (config or {}).get("pbspro", {}).get("snapshot", {}).get("path")
+    if path:
+        return path
+    home = os.getenv("AUTOSCALE_HOME") or os.path.join("/opt", "cycle", "pbspro")
+    return os.path.join(home, SNAPSHOT_FILE)
+
+
+def is_read(method: str, args: Tuple[str, ...]) -> bool:
+    if method in ["qstat", "qstat_json"]:
+        return True
+    if method in ["qmgr", "qmgr_parsed"]:
+        return bool(args) and str(args[0]) in ["list", "print"]
+    if method == "qmgr_script_parsed":
+        return all([is_read("qmgr", tuple(cmd)) for cmd in args])
+    if method in ["pbsnodes", "pbsnodes_parsed"]:
+        return not _PBSNODES_WRITE_FLAGS.intersection(args)
+    return False
+
+
+def _key(method: str, args: Tuple[Any, ...]) -> str:
+    return json.dumps([method] + [_key_arg(a) for a in args])
+
+
+def _key_arg(arg: Any) -> Any:
+    if isinstance(arg, (list, tuple)):
+        return [str(x) for x in arg]
+    return str(arg)
+
+
+class RecordingPBSCMD:
+    """
+    Wraps the PBSCMD used by an autoscale iteration and remembers the response
+    to every read, so that they can be saved as a snapshot at the end of the
+    iteration and replayed by the azpbs query commands (see ReplayPBSCMD).
+    """
+
+    def __init__(self, live: PBSCMD, now: Optional[float] = None) -> None:
+        self.live = live
+        self.parser = live.parser
+        self.created = time.time() if now is None else now
+        self.responses: Dict[str, Dict] = {}
+
+    def qstat(self, *args: str) -> str:
+        return self._call("qstat", args)
+
+    def qstat_json(self, *args: str) -> Dict:
+        return self._call("qstat_json", args)
+
+    def qmgr(self, *args: str) -> str:
+        return self._call("qmgr", args)
+
+    def qmgr_parsed(self, *args: str) -> List[Dict[str, str]]:
+        return self._call("qmgr_parsed", args)
+
+    def pbsnodes(self, *args: str) -> str:
+        return self._call("pbsnodes", args)
+
+    def pbsnodes_parsed(self, *args: str) -> List[Dict[str, str]]:
+        return self._call("pbsnodes_parsed", args)
+
+    def qmgr_script_parsed(self, *commands: Tuple[str, ...]) -> List[Dict[str, str]]:
+        return self._call("qmgr_script_parsed", commands)
+
+    def qmgr_script(self, *commands: Tuple[str, ...]) -> Dict[str, str]:
+        return self._call("qmgr_script", commands)
+
+    def close(self) -> None:
+        self.live.close()
+
+    def _call(self, method: str, args: Tuple[Any, ...]) -> Any:
+        func: Callable = getattr(self.live, method)
+        if not is_read(method, args):
+            return func(*args)
+
+        try:
+            ret = func(*args)
+        except CalledProcessError as e:
+            stderr = e.stderr or b""
+            if isinstance(stderr, bytes):
+                stderr = stderr.decode(errors="replace")
+            self.responses[_key(method, args)] = {
+                "error": {"returncode": e.returncode, "stderr": stderr}
+            }
+            raise
+
+        # encoded right away, as the caller is free to modify what we return.
+        # The latest response wins, i.e. after nodes were joined.
+        try:
+            self.responses[_key(method, args)] = {"response": json.dumps(ret)}
+        except (TypeError, ValueError):
+            logging.debug("Not recording %s %s", method, args)
+        return ret
+
+    def save(self, path: str) -> None:
+        tmp_path = path + ".tmp"
+        try:
+            with open(tmp_path, "w") as fw:
+                json.dump(
+                    {
+                        "version": SNAPSHOT_VERSION,
+                        "created": self.created,
+                        "responses": self.responses,
+                    },
+                    fw,
+                )
+            os.rename(tmp_path, path)
+        except OSError as e:
+            logging.warning("Could not save PBS snapshot to %s: %s", path, e)
+
+
+class ReplayPBSCMD:
+    """
+    Serves reads from a snapshot written by RecordingPBSCMD. Anything that
+    is not in the snapshot, and every command that modifies PBS, goes to a live
+    PBSCMD that is only created when needed.
+    """
+
+    def __init__(
+        self,
+        parser: PBSProParser,
+        responses: Dict[str, Dict],
+        created: float,
+        live_factory: Callable[[], PBSCMD],
+    ) -> None:
+        self.parser = parser
+        self.responses = responses
+        self.created = created
+        self.live_factory = live_factory
+        self.misses = 0
+        self.__live: Optional[PBSCMD] = None
+
+    @property
+    def live(self) -> PBSCMD:
+        if self.__live is None:
+            self.__live = self.live_factory()
+        return self.__live
+
+    def age(self, now: Optional[float] = None) -> float:
+        return max(0.0, (time.time() if now is None else now) - self.created)
+
+    def qstat(self, *args: str) -> str:
+        return self._call("qstat", args)
+
+    def qstat_json(self, *args: str) -> Dict:
+        return self._call("qstat_json", args)
+
+    def qmgr(self, *args: str) -> str:
+        return self._call("qmgr", args)
+
+    def qmgr_parsed(self, *args: str) -> List[Dict[str, str]]:
+        return self._call("qmgr_parsed", args)
+
+    def pbsnodes(self, *args: str) -> str:
+        return self._call("pbsnodes", args)
+
+    def pbsnodes_parsed(self, *args: str) -> List[Dict[str, str]]:
+        return self._call("pbsnodes_parsed", args)
+
+    def qmgr_script_parsed(self, *commands: Tuple[str, ...]) -> List[Dict[str, str]]:
+        return self._call("qmgr_script_parsed", commands)
+
+    def qmgr_script(self, *commands: Tuple[str, ...]) -> Dict[str, str]:
+        return self._call("qmgr_script", commands)
+
+    def close(self) -> None:
+        if self.__live is not None:
+            self.__live.close()
+
+    def _call(self, method: str, args: Tuple[Any, ...]) -> Any:
+        if not is_read(method, args):
+            return getattr(self.live, method)(*args)
+
+        recorded = self.responses.get(_key(method, args))
+        if recorded is None:
+            self.misses += 1
+            logging.debug("%s %s is not in the snapshot", method, args)
+            return getattr(self.live, method)(*args)
+
+        if "error" in recorded:
+            error = recorded["error"]
+            raise CalledProcessError(
+                error["returncode"],
+                [method] + [str(a) for a in args],
+                b"",
+                error["stderr"].encode(),
+            )
+        return json.loads(recorded["response"])
+
+
+def load_snapshot(
+    path: str,
+    parser: PBSProParser,
+    live_factory: Callable[[], PBSCMD],
+    max_age: float,
+    now: Optional[float] = None,
+) -> Optional[ReplayPBSCMD]:
+    """
+    Returns None if there is no usable snapshot - missing, unreadable, from a
+    different version or older than max_age seconds.
+    """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path) as fr:
+            data = json.load(fr)
+    except (OSError, ValueError) as e:
+        logging.warning("Could not read PBS snapshot %s: %s", path, e)
+        return None
+
+    if data.get("version") != SNAPSHOT_VERSION:
+        return None
+
+    snapshot = ReplayPBSCMD(
+        parser,
+        data.get("responses") or {},
+        float(data.get("created", 0)),
+        live_factory,
+    )
+    if snapshot.age(now) > max_age:
+        logging.debug(
+            "Ignoring PBS snapshot %s, it is %.0f seconds old", path, snapshot.age(now)
+        )
+        return None
+    return snapshot
@@ -0,0 +1,77 @@
+import os
+import time
+from typing import Callable, Optional
+
+DEFAULT_TRIGGER_FILE = os.path.join("/opt", "cycle", "pbspro", "autoscale.trigger")
+
+
+class AutoscaleTrigger:
+    """
+    The queuejob/modifyjob hook (autoscale_trigger_hook.py) only touches a file.
+    This watches that file's mtime and coalesces bursts of pokes - e.g. thousands
+    of qsubs - into a single iteration: once the file changes we wait until it has
+    been quiet for `debounce` seconds, but never longer than `max_delay` seconds
+    after the first change.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_TRIGGER_FILE,
+        debounce: float = 2.0,
+        max_delay: float = 10.0,
+        poll_interval: float = 0.5,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.path = path
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+        self.__last_mtime = self._mtime()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Returns True once a burst of pokes has settled, or False if there was no
+        poke within timeout seconds.
+        """
+        deadline = self.clock() + timeout
+        last_mtime = self.__last_mtime
+        first_change: Optional[float] = None
+        last_change = 0.0
+
+        while True:
+            now = self.clock()
+            mtime = self._mtime()
+            if mtime != last_mtime:
+                last_mtime = mtime
+                last_change = now
+                if first_change is None:
+                    first_change = now
+
+            if first_change is not None:
+                if (
+                    now - last_change >= self.debounce
+                    or now - first_change >= self.max_delay
+                ):
+                    self.__last_mtime = last_mtime
+                    return True
+            elif now >= deadline:
+                return False
+
+            self.sleep(self.poll_interval)
+
+    def poke(self) -> None:
+        """
+        Same as what autoscale_trigger_hook.py does.
+        """
+        with open(self.path, "a"):
+            pass
+        os.utime(self.path, None)
+
+    def _mtime(self) -> float:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return 0.0
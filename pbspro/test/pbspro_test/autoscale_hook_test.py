@@ -0,0 +1,86 @@
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+import types
+from typing import Any, List
+
+HOOK_PATH = os.path.join(
+    os.path.dirname(__file__), "..", "..", "conf", "autoscale_hook.py"
+)
+
+
+def _load_hook(tmpdir: Any, monkeypatch: Any) -> Any:
+    # the hook runs as soon as it is imported, so point it at a trigger file,
+    # which is all it does in that case
+    config_path = os.path.join(str(tmpdir), "hook.json")
+    with open(config_path, "w") as fw:
+        json.dump({"trigger_file": os.path.join(str(tmpdir), "trigger")}, fw)
+
+    messages: List[str] = []
+    pbs = types.ModuleType("pbs")
+    pbs.EVENT_DEBUG = 1  # type: ignore
+    pbs.EVENT_ERROR = 2  # type: ignore
+    pbs.logmsg = lambda level, msg: messages.append(msg)  # type: ignore
+    pbs.hook_config_filename = config_path  # type: ignore
+    monkeypatch.setitem(sys.modules, "pbs", pbs)
+
+    spec = importlib.util.spec_from_file_location("autoscale_hook", HOOK_PATH)
+    assert spec and spec.loader
+    hook = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(hook)
+    hook.messages = messages  # type: ignore
+    return hook
+
+
+def _wait_for(path: str, timeout: float = 10) -> None:
+    deadline = time.time() + timeout
+    while not os.path.exists(path) and time.time() < deadline:
+        time.sleep(0.05)
+    assert os.path.exists(path), path
+
+
+def test_run_detached_skips_while_running(tmpdir: Any, monkeypatch: Any) -> None:
+    hook = _load_hook(tmpdir, monkeypatch)
+    state_dir = str(tmpdir)
+    pid_path = os.path.join(state_dir, "autoscale_hook.pid")
+    status_path = os.path.join(state_dir, "autoscale_hook_status.json")
+    hook_config = {"state_dir": state_dir}
+
+    # a previous iteration that is still running
+    running = subprocess.Popen(["/bin/sh", "-c", "sleep 30; true", hook.WRAPPER_NAME])
+    try:
+        with open(pid_path, "w") as fw:
+            fw.write(str(running.pid))
+        assert hook.is_running(pid_path)
+        hook.run_detached(["/bin/sh", "-c", "exit 3"], dict(os.environ), hook_config)
+        assert "skipping this interval" in hook.messages[-1]
+        assert not os.path.exists(status_path)
+    finally:
+        running.kill()
+        running.wait()
+
+    assert not hook.is_running(pid_path)
+    hook.run_detached(["/bin/sh", "-c", "exit 3"], dict(os.environ), hook_config)
+    _wait_for(status_path)
+    with open(status_path) as fr:
+        assert json.load(fr)["exit_code"] == 3
+    # the wrapper removes its pid file once it is done
+    assert not os.path.exists(pid_path)
+
+
+def test_stale_pid_file(tmpdir: Any, monkeypatch: Any) -> None:
+    hook = _load_hook(tmpdir, monkeypatch)
+    pid_path = os.path.join(str(tmpdir), "autoscale_hook.pid")
+    assert not hook.is_running(pid_path)
+
+    # e.g. the wrapper was killed and its pid was reused by this process
+    with open(pid_path, "w") as fw:
+        fw.write(str(os.getpid()))
+    assert not hook.is_running(pid_path)
+
+    with open(pid_path, "w") as fw:
+        fw.write("garbage")
+    assert not hook.is_running(pid_path)
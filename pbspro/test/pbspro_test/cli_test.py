@@ -0,0 +1,83 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict
+
+# only imported by the commands that need them
+LAZY_MODULES = ["pbspro.driver", "pbspro.environment", "pbspro.autoscaler"]
+
+# microseconds, as reported by -X importtime
+IMPORT_BUDGET_US = 1000000
+
+# seconds, for all of azpbs offline -H, including starting the interpreter
+COMMAND_BUDGET_S = 1.5
+
+
+def _import_times(module: str) -> Dict[str, int]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import " + module],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=env,
+        check=True,
+    )
+    ret = {}
+    # import time: self [us] | cumulative | imported package
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        toks = [t.strip() for t in line[len("import time:") :].split("|")]
+        if toks[1].isdigit():
+            ret[toks[2].strip()] = int(toks[1])
+    return ret
+
+
+def test_cli_imports_are_lazy() -> None:
+    times = _import_times("pbspro.cli")
+    assert "pbspro.cli" in times
+
+    for module in LAZY_MODULES:
+        assert module not in times, "{} is imported by pbspro.cli".format(module)
+
+    assert times["pbspro.cli"] < IMPORT_BUDGET_US
+
+
+def test_offline_only_runs_pbsnodes(tmpdir: Any) -> None:
+    # every PBS command just records how it was called
+    bin_dir = os.path.join(str(tmpdir), "bin")
+    os.makedirs(bin_dir)
+    calls_path = os.path.join(str(tmpdir), "calls")
+    for name in ["qstat", "qmgr", "pbsnodes"]:
+        path = os.path.join(bin_dir, name)
+        with open(path, "w") as fw:
+            fw.write('#!/bin/sh\necho "{} $*" >> "{}"\n'.format(name, calls_path))
+        os.chmod(path, 0o755)
+
+    config_path = os.path.join(str(tmpdir), "autoscale.json")
+    with open(config_path, "w") as fw:
+        json.dump({}, fw)
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(sys.path)
+    env["PATH"] = bin_dir + os.pathsep + env.get("PATH", "")
+    start = time.time()
+    proc = subprocess.run(
+        [sys.executable, "-c", "from pbspro.cli import main; main()"]
+        + ["offline", "-c", config_path, "-H", "tux1"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        env=env,
+    )
+    elapsed = time.time() - start
+    assert proc.returncode == 0, proc.stderr
+
+    # in particular, no qmgr calls to read the server config
+    with open(calls_path) as fr:
+        assert fr.read().splitlines() == ["pbsnodes -o tux1 -C cyclecloud keep offline"]
+    assert elapsed < COMMAND_BUDGET_S
@@ -0,0 +1,72 @@
+from typing import Any, Dict, List
+
+from pbspro.demandcache import DemandCache, demand_fingerprint
+
+
+class MockJob:
+    def __init__(self, name: str, ncpus: int, job_state: str = "queued") -> None:
+        self.name = name
+        self.ncpus = ncpus
+        self.metadata = {"job_state": job_state}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "constraints": [{"ncpus": self.ncpus}]}
+
+
+class MockNode:
+    def __init__(self, name: str, state: str = "Ready") -> None:
+        self.name = name
+        self.hostname = name
+        self.state = state
+        self.exists = True
+        self.closed = False
+        self.vm_size = "Standard_F4"
+        self.assignments: set = set()
+        self.resources: Dict[str, Any] = {"ncpus": 4}
+        self.available: Dict[str, Any] = {"ncpus": 4}
+
+    def assign(self, assignment_id: str) -> None:
+        self.assignments.add(assignment_id)
+
+
+class MockBucket:
+    nodearray = "execute"
+    vm_size = "Standard_F4"
+    available_count = 10
+    max_count = 12
+
+
+def _fingerprint(jobs: List[MockJob], nodes: List[MockNode]) -> str:
+    return demand_fingerprint({"pbspro": {}}, jobs, nodes, [MockBucket()])
+
+
+def test_fingerprint() -> None:
+    jobs = [MockJob("1", 2), MockJob("2", 4)]
+    nodes = [MockNode("a"), MockNode("b")]
+    expected = _fingerprint(jobs, nodes)
+
+    # order does not matter, running jobs are not matched anyway
+    jobs_reordered = list(reversed(jobs)) + [MockJob("0", 1, "running")]
+    assert _fingerprint(jobs_reordered, list(reversed(nodes))) == expected
+
+    assert _fingerprint([MockJob("1", 2), MockJob("2", 8)], nodes) != expected
+    assert _fingerprint(jobs, [MockNode("a"), MockNode("b", "Failed")]) != expected
+
+
+def test_replay() -> None:
+    cache = DemandCache()
+    nodes = [MockNode("a"), MockNode("b")]
+    assert not cache.replay("abc", nodes)
+
+    nodes[0].assign("1")
+    nodes[0].assign("2")
+    cache.store("abc", nodes)
+
+    fresh = [MockNode("b"), MockNode("a")]
+    assert not cache.replay("def", fresh)
+    assert cache.replay("abc", fresh)
+    assert fresh[1].assignments == set(["1", "2"])
+    assert not fresh[0].assignments
+
+    # a node that was matched last time is gone
+    assert not cache.replay("abc", [MockNode("b")])
@@ -0,0 +1,89 @@
+import os
+from typing import Any, List
+
+from pbspro.demandhistory import (
+    PREBOOT_ASSIGNMENT_ID,
+    BucketDemand,
+    DemandHistory,
+    is_demand_history_enabled,
+    plan_preboot,
+)
+
+
+class MockNode:
+    def __init__(self, nodearray: str, vm_size: str, *job_ids: str) -> None:
+        self.nodearray = nodearray
+        self.vm_size = vm_size
+        self.assignments = set(job_ids)
+
+
+class MockDemandResult:
+    def __init__(self, *compute_nodes: MockNode) -> None:
+        self.compute_nodes: List[MockNode] = list(compute_nodes)
+
+
+def test_update_and_forecast(tmpdir: Any) -> None:
+    path = os.path.join(str(tmpdir), "demand_history.json")
+    history = DemandHistory(path, alpha=0.5)
+
+    # every job looks new the first time, so no arrival rate yet
+    history.update(MockDemandResult(MockNode("htc", "F2", "1")), now=1000)
+    assert history.get("htc/F2").arrival_rate == 0
+    assert history.get("htc/F2").demand == 0.5
+    assert history.get("htc/F2").last_demand_time == 1000
+
+    # 2 more nodes over 100 seconds. Job 2 shares a node with job 1.
+    history.update(
+        MockDemandResult(
+            MockNode("htc", "F2", "1", "2"),
+            MockNode("htc", "F2", "3"),
+            MockNode("htc", "F2", "4"),
+            MockNode("hpc", "H44", PREBOOT_ASSIGNMENT_ID),
+        ),
+        now=1100,
+    )
+    bucket = history.get("htc/F2")
+    assert bucket.count == 3
+    assert abs(bucket.arrival_rate - 0.5 * 2 / 100) < 1e-9
+    # preboot nodes are not demand
+    assert history.get("hpc/H44").demand == 0
+    assert abs(history.forecast(600)["htc/F2"] - 6) < 1e-9
+
+    history.save()
+    reloaded = DemandHistory(path)
+    assert reloaded.get("htc/F2").count == 3
+    assert reloaded.get("htc/F2").arrival_rate == bucket.arrival_rate
+    assert reloaded.last_update == 1100
+
+    # jobs finished, nothing new, so the rate decays
+    rate = bucket.arrival_rate
+    history.update(MockDemandResult(MockNode("htc", "F2", "5")), now=1200)
+    assert history.get("htc/F2").arrival_rate == rate / 2
+    assert history.get("htc/F2").count == 1
+
+
+def test_is_demand_history_enabled() -> None:
+    assert not is_demand_history_enabled({})
+    assert not is_demand_history_enabled({"pbspro": {"preboot": {"enabled": False}}})
+    assert is_demand_history_enabled({"pbspro": {"preboot": {"enabled": True}}})
+    assert is_demand_history_enabled({"pbspro": {"scaledown": {"demand_window": 600}}})
+
+
+def test_plan_preboot() -> None:
+    history = DemandHistory(None)
+    history.buckets["htc/F2"] = BucketDemand(arrival_rate=0.01)
+    history.buckets["hpc/H44"] = BucketDemand(arrival_rate=0.02)
+    history.buckets["idle/A1"] = BucketDemand(arrival_rate=0.001)
+
+    plans = plan_preboot(history, {"htc/F2": 2}, window=600, max_nodes=10)
+    # 12 expected, none idle, capped at 10
+    assert plans["hpc/H44"] == {"expected": 12, "idle": 0, "keep": 0, "boot": 10}
+    # 6 expected, 2 idle, but the cap is already used up
+    assert plans["htc/F2"] == {"expected": 6, "idle": 2, "keep": 2, "boot": 0}
+    # less than one node expected
+    assert "idle/A1" not in plans
+
+    plans = plan_preboot(history, {"htc/F2": 8}, window=600, max_nodes=20)
+    assert plans["htc/F2"]["keep"] == 6
+    assert plans["htc/F2"]["boot"] == 0
+    assert plans["hpc/H44"]["boot"] == 12
@@ -1,14 +1,22 @@
 import datetime
+import os
+import threading
 import time
-from typing import Any, Dict
+from subprocess import CalledProcessError
+from types import SimpleNamespace
+from typing import Any, Dict, List, Set, Tuple
 
 import pytest
 from hpc.autoscale.job.schedulernode import SchedulerNode
+from hpc.autoscale.node.node import Node
 
-from pbspro.constants import PBSProJobStates
-from pbspro.driver import PBSProDriver, parse_scheduler_node
+from pbspro import driver as driverlib
+from pbspro.constants import JoinStatus, PBSProJobStates
+from pbspro.driver import PBSProDriver, parse_partitioned_jobs, parse_scheduler_node
 from pbspro.parser import PBSProParser, get_pbspro_parser, set_pbspro_parser
 from pbspro.resource import BooleanType, LongType, PBSProResourceDefinition, StringType
+from pbspro.scheduler import PBSProScheduler
+from pbspro.snapshot import RecordingPBSCMD
 
 
 def setup_module() -> None:
@@ -99,3 +107,251 @@ def _pbs_job(
 @pytest.mark.skip
 def test_git_submodule() -> None:
     assert False, "fix git submodule"
+
+
+class MockNodeHistory:
+    def find_ignored(self) -> List[Tuple[str, str]]:
+        return []
+
+
+class MockPBSCMD:
+    def pbsnodes_parsed(self, *args: str) -> List[Dict[str, str]]:
+        return []
+
+    def qmgr(self, *args: str) -> str:
+        return ""
+
+
+class SlowJoinDriver(PBSProDriver):
+    def __init__(self, config: Dict) -> None:
+        super().__init__(config, pbscmd=MockPBSCMD())  # type: ignore
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def new_node_history(self, config: Dict) -> Any:
+        return MockNodeHistory()
+
+    def _join_node(self, node: Node, *args: Any) -> str:
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        # make later nodes finish first
+        time.sleep(0.01 * (10 - int(node.hostname[3:])))
+        with self.lock:
+            self.active -= 1
+        if int(node.hostname[3:]) % 3 == 0:
+            return JoinStatus.failed
+        return JoinStatus.joined
+
+
+def test_add_nodes_to_cluster_concurrency() -> None:
+    nodes: List[Node] = [SchedulerNode("tux{}".format(i), {}) for i in range(10)]
+    expected = [n.hostname for n in nodes if int(n.hostname[3:]) % 3 != 0]
+
+    serial = SlowJoinDriver({})
+    assert expected == [n.hostname for n in serial.add_nodes_to_cluster(nodes)]
+    assert serial.max_active == 1
+
+    parallel = SlowJoinDriver({"pbspro": {"join_concurrency": 4}})
+    # order of the result must not depend on which join finished first
+    assert expected == [n.hostname for n in parallel.add_nodes_to_cluster(nodes)]
+    assert 1 < parallel.max_active <= 4
+    assert parallel.join_results[nodes[0].name] == JoinStatus.failed
+    assert parallel.join_results[nodes[1].name] == JoinStatus.joined
+
+
+class MockReconcilePBSCMD(MockPBSCMD):
+    def pbsnodes_parsed(self, *args: str) -> List[Dict[str, str]]:
+        return [
+            {"name": "tux1", "state": "free", "resources_available.ccnodeid": "id-1"},
+            {"name": "tux2", "state": "offline", "comment": "cyclecloud offline"},
+            {"name": "tux3", "state": "free"},
+            {"name": "tux4", "state": "free"},
+        ]
+
+
+def test_add_nodes_to_cluster_reconciles_journal() -> None:
+    driver = PBSProDriver(
+        {"pbspro": {"journal": False}}, pbscmd=MockReconcilePBSCMD()  # type: ignore
+    )
+    driver.new_node_history = lambda config: MockNodeHistory()  # type: ignore
+    journal = driver.journal
+    # ccnodeid is set, so the join finished
+    journal.begin("join", "id-1", "tux1")
+    journal.begin("drain", "id-2", "tux2")
+    # pbsnodes -o never happened
+    journal.begin("drain", "id-3", "tux3")
+    journal.begin("delete", "id-4", "tux4")
+    journal.begin("delete", "id-5", "tux5")
+    # the node no longer exists
+    journal.begin("join", "id-6", "tux6")
+
+    driver.add_nodes_to_cluster([])
+
+    assert journal.in_flight() == []
+    phases = [journal.latest("id-{}".format(i))["phase"] for i in range(1, 7)]
+    assert phases == ["end", "end", "failed", "failed", "end", "failed"]
+
+
+class MockDeletePBSCMD:
+    def __init__(self) -> None:
+        self.parser: Any = None
+        self.scripts: List[Tuple] = []
+
+    def qmgr_script(self, *commands: Tuple[str, ...]) -> Dict[str, str]:
+        self.scripts.append(commands)
+        return {"TUX2": "Request invalid for state of node"}
+
+
+def test_handle_post_delete_batches() -> None:
+    pbscmd = MockDeletePBSCMD()
+    driver = PBSProDriver({}, pbscmd=pbscmd)  # type: ignore
+    in_pbs = [SchedulerNode("tux1", {}), SchedulerNode("tux2", {})]
+    driver.parse_scheduler_nodes = lambda: in_pbs  # type: ignore
+
+    nodes: List[Node] = [SchedulerNode("tux{}".format(i), {}) for i in range(1, 4)]
+    deleted = driver.handle_post_delete(nodes)
+
+    # tux3 was never in PBS and tux2 could not be deleted
+    assert [n.hostname for n in deleted] == ["tux3", "tux1"]
+    assert pbscmd.scripts == [(("delete", "node", "tux1"), ("delete", "node", "tux2"))]
+    assert nodes[0].metadata["pbs_state"] == "deleted"
+
+
+def test_handle_post_delete_while_recording() -> None:
+    pbscmd = MockDeletePBSCMD()
+    pbscmd.parser = get_pbspro_parser()
+    recorder = RecordingPBSCMD(pbscmd)  # type: ignore
+    driver = PBSProDriver({}, pbscmd=recorder)  # type: ignore
+    driver.parse_scheduler_nodes = lambda: [SchedulerNode("tux1", {})]  # type: ignore
+
+    deleted = driver.handle_post_delete([SchedulerNode("tux1", {})])
+    assert [n.hostname for n in deleted] == ["tux1"]
+    assert pbscmd.scripts == [(("delete", "node", "tux1"),)]
+    # deletes are writes, so they are not part of the snapshot
+    assert recorder.responses == {}
+
+
+class MockJoiningNode:
+    def __init__(self, hostname: str, node_id: str) -> None:
+        self.name = hostname
+        self.hostname = hostname
+        self.private_ip = "10.1.0.4"
+        self.state = "Ready"
+        self.assignments: Set[str] = set()
+        self.metadata: Dict[str, Any] = {}
+        self.resources = {"ccnodeid": node_id}
+        self.delayed_node_id = SimpleNamespace(node_id=node_id)
+
+
+class MockFailedJoinPBSCMD(MockDeletePBSCMD):
+    def __init__(self) -> None:
+        super().__init__()
+        self.qmgr_calls: List[Tuple[str, ...]] = []
+
+    def pbsnodes_parsed(self, *args: str) -> List[Dict[str, str]]:
+        return []
+
+    def qmgr_parsed(self, *args: str) -> List[Dict[str, str]]:
+        raise CalledProcessError(1, ["qmgr", "-c"] + list(args))
+
+    def qmgr(self, *args: str) -> str:
+        self.qmgr_calls.append(args)
+        if args[:2] == ("set", "node"):
+            raise CalledProcessError(1, ["qmgr", "-c"] + list(args))
+        return ""
+
+    def qmgr_script(self, *commands: Tuple[str, ...]) -> Dict[str, str]:
+        self.scripts.append(commands)
+        return {}
+
+
+def test_handle_post_delete_after_failed_join(monkeypatch: Any) -> None:
+    pbscmd = MockFailedJoinPBSCMD()
+    driver = PBSProDriver({"pbspro": {"journal": False}}, pbscmd=pbscmd)  # type: ignore
+    driver.new_node_history = lambda config: MockNodeHistory()  # type: ignore
+    driver._validate_reverse_dns = lambda node: True  # type: ignore
+    driver.parse_scheduler_nodes = lambda: []  # type: ignore
+    monkeypatch.setattr(driverlib, "is_valid_hostname", lambda config, node: True)
+
+    node = MockJoiningNode("tux1", "id-1")
+    assert driver.add_nodes_to_cluster([node]) == []  # type: ignore
+    assert driver.join_results["tux1"] == JoinStatus.failed
+    # create node went through, setting ccnodeid did not
+    assert ("create", "node", "tux1") in pbscmd.qmgr_calls
+
+    # so it is in PBS, even though it was not at the start of the iteration
+    assert driver.handle_post_delete([node]) == [node]  # type: ignore
+    assert pbscmd.scripts == [(("delete", "node", "tux1"),)]
+    assert node.metadata["pbs_state"] == "deleted"
+
+
+class MockQueue:
+    def __init__(self, name: str, partition: str = "") -> None:
+        self.name = name
+        self.partition = partition
+
+
+class MockQstat:
+    def qstat_json(self, *args: str) -> Dict:
+        return {
+            "Jobs": {
+                "1.pbsserver": {"queue": "workq"},
+                "2.pbsserver": {"queue": "p1q"},
+                "3.pbsserver": {"queue": "p2q"},
+                "4.pbsserver": {"queue": "unknownq"},
+            }
+        }
+
+
+def _scheduler(tmpdir: Any, name: str, partition: str, resources: str) -> Any:
+    sched_priv = os.path.join(str(tmpdir), name)
+    os.makedirs(sched_priv)
+    with open(os.path.join(sched_priv, "sched_config"), "w") as fw:
+        fw.write("resources: {}\n".format(resources))
+    sched_dict = {
+        "name": name,
+        "partition": partition,
+        "scheduling": "True",
+        "only_explicit_psets": "True",
+        "sched_log": "/var/spool/pbs/{}_logs".format(name),
+        "sched_priv": sched_priv,
+        "state": "Idle",
+        "sched_host": "pbsserver",
+        "pbs_version": "20.0.1",
+    }
+    return PBSProScheduler(sched_dict, None)  # type: ignore
+
+
+def test_parse_partitioned_jobs(tmpdir: Any, monkeypatch: Any) -> None:
+    schedulers = [
+        _scheduler(tmpdir, "default", "", "ncpus"),
+        _scheduler(tmpdir, "sched1", "p1", "ncpus, ngpus"),
+        _scheduler(tmpdir, "sched2", "p2", "mem"),
+    ]
+    queues = {
+        "workq": MockQueue("workq"),
+        "p1q": MockQueue("p1q", "p1"),
+        "p2q": MockQueue("p2q", "p2"),
+    }
+    calls = []
+
+    def parse_jobs(*args: Any, **kwargs: Any) -> List:
+        sched_queues, resources = args[2], args[3]
+        job_ids = sorted(kwargs["jobs_response"]["Jobs"])
+        if "mem" in resources:
+            raise RuntimeError("broken partition")
+        calls.append((sorted(sched_queues), sorted(resources), job_ids))
+        return job_ids
+
+    monkeypatch.setattr(driverlib, "parse_jobs", parse_jobs)
+    jobs = parse_partitioned_jobs(MockQstat(), {}, queues, schedulers)  # type: ignore
+
+    # the default scheduler also reports jobs in unknown queues, and a failure
+    # in p2 does not affect the other partitions
+    assert calls == [
+        (["workq"], ["ncpus"], ["1.pbsserver", "4.pbsserver"]),
+        (["p1q"], ["ncpus", "ngpus"], ["2.pbsserver"]),
+    ]
+    assert jobs == ["1.pbsserver", "4.pbsserver", "2.pbsserver"]
@@ -0,0 +1,83 @@
+import datetime
+import time
+from typing import Any, Dict
+
+from pbspro.constants import JobEligibility
+from pbspro.eligibility import EligibilityClassifier
+
+
+def _job(job_state: str = "Q", **kwargs: Any) -> Dict[str, Any]:
+    ret: Dict[str, Any] = {"job_state": job_state, "queue": "workq"}
+    ret.update(kwargs)
+    return ret
+
+
+def _ctime(offset: int) -> str:
+    return datetime.datetime.ctime(
+        datetime.datetime.fromtimestamp(time.time() + offset)
+    )
+
+
+def test_holds_reservations_and_execution_time() -> None:
+    classifier = EligibilityClassifier(lookahead=600)
+    c = classifier.classify
+
+    assert c(_job()) == JobEligibility.eligible
+    assert c(_job(Hold_Types="n")) == JobEligibility.eligible
+    assert c(_job("H", Hold_Types="u")) == JobEligibility.held
+    assert c(_job(queue="R123")) == JobEligibility.reservation
+    assert c(_job(queue="Rnd")) == JobEligibility.eligible
+    assert c(_job(accrue_type="1")) == JobEligibility.ineligible
+    assert c(_job(accrue_type="2")) == JobEligibility.eligible
+
+    assert c(_job("W", Execution_Time=_ctime(3600))) == JobEligibility.execution_time
+    assert c(_job("W", Execution_Time=_ctime(60))) == JobEligibility.eligible
+    assert c(_job("W")) == JobEligibility.waiting
+
+    assert classifier.counts == {
+        JobEligibility.eligible: 5,
+        JobEligibility.held: 1,
+        JobEligibility.reservation: 1,
+        JobEligibility.ineligible: 1,
+        JobEligibility.execution_time: 1,
+        JobEligibility.waiting: 1,
+    }
+
+
+def test_dependencies() -> None:
+    classifier = EligibilityClassifier(lookahead=600)
+    classifier.add_jobs(
+        {
+            "1.pbsserver": _job(
+                "R",
+                Resource_List={"walltime": "01:00:00"},
+                resources_used={"walltime": "00:55:00"},
+            ),
+            "2.pbsserver": _job(
+                "R",
+                Resource_List={"walltime": "01:00:00"},
+                resources_used={"walltime": "00:10:00"},
+            ),
+            "3.pbsserver": _job("R"),
+            "4.pbsserver": _job("Q"),
+        }
+    )
+
+    def c(depend: str) -> str:
+        return classifier.classify(_job("H", Hold_Types="s", depend=depend))
+
+    # 5 minutes left
+    assert c("afterok:1.pbsserver") == JobEligibility.eligible
+    # 50 minutes left
+    assert c("afterok:1.pbsserver:2.pbsserver") == JobEligibility.dependency
+    # no walltime, so we can't tell
+    assert c("afterany:3.pbsserver") == JobEligibility.dependency
+    assert c("afterok:4") == JobEligibility.dependency
+    # finished jobs are no longer reported
+    assert c("afterok:99.pbsserver@otherserver") == JobEligibility.eligible
+    # only after* dependencies matter for this job
+    assert c("beforeok:4.pbsserver") == JobEligibility.eligible
+
+    # released by PBS, which keeps the depend attribute around
+    released = _job("Q", Hold_Types="n", depend="afterok:4.pbsserver")
+    assert classifier.classify(released) == JobEligibility.eligible
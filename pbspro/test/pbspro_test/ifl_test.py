@@ -0,0 +1,204 @@
+import ctypes
+from subprocess import CalledProcessError
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+from pbspro import pbscmd as pbscmdlib
+from pbspro.ifl import IFLPBSCMD, Attrl, BatchStatus
+from pbspro.parser import PBSProParser
+
+
+class MockLibPBS:
+    """
+    Stand-in for libpbs that returns real ctypes batch_status lists, so the
+    IFL backend walks the same structures it would get from the library.
+    """
+
+    def __init__(self, objects: Dict[str, List[Tuple[str, Dict[str, str]]]]) -> None:
+        self.objects = objects
+        self.connects = 0
+        self.disconnects = 0
+        self.freed = 0
+        self.manager_calls: List[Tuple[int, int, str, Dict[str, str]]] = []
+        self.errmsg: Optional[bytes] = None
+        self.pbs_errno = ctypes.c_int(0)
+        # how newer versions of libpbs export pbs_errno
+        setattr(self, "__pbs_errno_location", lambda: ctypes.pointer(self.pbs_errno))
+        # ctypes only holds weak references to python allocated structures
+        self._keep_alive: List[Any] = []
+
+    def pbs_connect(self, server: Optional[bytes]) -> int:
+        self.connects += 1
+        return 1
+
+    def pbs_disconnect(self, conn: int) -> int:
+        self.disconnects += 1
+        return 0
+
+    def pbs_geterrmsg(self, conn: int) -> Optional[bytes]:
+        return self.errmsg
+
+    def pbs_statfree(self, status: Any) -> None:
+        self.freed += 1
+
+    def pbs_statjob(self, *args: Any) -> Any:
+        return self._stat("job", args[1])
+
+    def pbs_statvnode(self, *args: Any) -> Any:
+        return self._stat("node", args[1])
+
+    def pbs_statque(self, *args: Any) -> Any:
+        return self._stat("queue", args[1])
+
+    def pbs_statrsc(self, *args: Any) -> Any:
+        return self._stat("resource", args[1])
+
+    def pbs_statserver(self, *args: Any) -> Any:
+        return self._stat("server", None)
+
+    def pbs_statsched(self, *args: Any) -> Any:
+        return self._stat("sched", None)
+
+    def pbs_manager(
+        self, conn: int, cmd: int, obj_type: int, obj_name: bytes, attrib: Any, ext: Any
+    ) -> int:
+        attrs = {}
+        while attrib:
+            attr = attrib.contents
+            key = attr.name.decode()
+            if attr.resource:
+                key = key + "." + attr.resource.decode()
+            attrs[key] = attr.value.decode()
+            attrib = attr.next
+        self.manager_calls.append((cmd, obj_type, obj_name.decode(), attrs))
+        return 0
+
+    def _stat(self, obj_type: str, obj_id: Optional[bytes]) -> Any:
+        records = self.objects.get(obj_type, [])
+        if obj_id:
+            records = [r for r in records if r[0] == obj_id.decode()]
+            if not records:
+                self.errmsg = b"Unknown node"
+                self.pbs_errno.value = 15062
+                return ctypes.POINTER(BatchStatus)()
+
+        head = ctypes.POINTER(BatchStatus)()
+        for name, attrs in reversed(records):
+            bs = BatchStatus()
+            bs.name = name.encode()
+            attr_head = ctypes.POINTER(Attrl)()
+            for key, value in reversed(list(attrs.items())):
+                attr = Attrl()
+                name_part, _, resource = key.partition(".")
+                attr.name = name_part.encode()
+                attr.resource = resource.encode() if resource else None
+                attr.value = value.encode()
+                attr.next = attr_head
+                attr_head = ctypes.pointer(attr)
+                self._keep_alive.append(attr)
+            bs.attribs = attr_head
+            bs.next = head
+            head = ctypes.pointer(bs)
+            self._keep_alive.append(bs)
+        return head
+
+
+@pytest.fixture
+def ifl_cmd(monkeypatch: Any, parser: PBSProParser) -> IFLPBSCMD:
+    for bin_name in ["QSTAT_BIN", "QMGR_BIN", "PBSNODES_BIN"]:
+        monkeypatch.setattr(pbscmdlib, bin_name, "/bin/false")
+
+    lib = MockLibPBS(
+        {
+            "job": [
+                (
+                    "1.pbsserver",
+                    {
+                        "job_state": "Q",
+                        "queue": "workq",
+                        "Resource_List.ncpus": "2",
+                        "Resource_List.select": "1:ncpus=2",
+                        "schedselect": "1:ncpus=2",
+                        "qtime": "0",
+                    },
+                ),
+                ("2.pbsserver", {"job_state": "Q", "array": "True"}),
+            ],
+            "node": [
+                (
+                    "tux",
+                    {
+                        "state": "free",
+                        "resources_available.ncpus": "4",
+                        "last_state_change_time": "0",
+                    },
+                )
+            ],
+            "queue": [("workq", {"enabled": "True"}), ("htcq", {"enabled": "False"})],
+        }
+    )
+    return IFLPBSCMD(parser, lib)
+
+
+def test_qstat_json(ifl_cmd: IFLPBSCMD) -> None:
+    response = ifl_cmd.qstat_json("-f", "-t")
+    jobs = response["Jobs"]
+    assert list(jobs.keys()) == ["1.pbsserver", "2.pbsserver"]
+    job = jobs["1.pbsserver"]
+    assert job["Resource_List"] == {"ncpus": "2", "select": "1:ncpus=2"}
+    assert job["schedselect"] == "1:ncpus=2"
+    # rendered like qstat would, not as seconds since the epoch
+    assert not job["qtime"].isdigit()
+    assert jobs["2.pbsserver"]["array"] is True
+    assert ifl_cmd.libpbs.freed == 1
+
+
+def test_connection_reused_until_close(ifl_cmd: IFLPBSCMD) -> None:
+    ifl_cmd.qstat_json("-f", "-t")
+    ifl_cmd.pbsnodes_parsed("-a")
+    ifl_cmd.qmgr_parsed("list", "queue")
+    assert ifl_cmd.libpbs.connects == 1
+
+    ifl_cmd.close()
+    assert ifl_cmd.libpbs.disconnects == 1
+
+    ifl_cmd.pbsnodes_parsed("-a")
+    assert ifl_cmd.libpbs.connects == 2
+
+
+def test_pbsnodes_and_qmgr_parsed(ifl_cmd: IFLPBSCMD) -> None:
+    nodes = ifl_cmd.pbsnodes_parsed("-a")
+    assert len(nodes) == 1
+    assert nodes[0]["name"] == "tux"
+    assert nodes[0]["obj_type"] == "unknown"
+    assert nodes[0]["resources_available.ncpus"] == "4"
+
+    queues = ifl_cmd.qmgr_parsed("list", "queue", "htcq,workq")
+    assert [q["name"] for q in queues] == ["htcq", "workq"]
+    assert queues[0]["obj_type"] == "Queue"
+
+    assert ifl_cmd.qmgr_parsed("list", "node", "tux")[0]["state"] == "free"
+
+    with pytest.raises(CalledProcessError) as exc:
+        ifl_cmd.qmgr("list", "node", "missing")
+    assert exc.value.returncode == 15062
+
+
+def test_qmgr_manager(ifl_cmd: IFLPBSCMD) -> None:
+    ifl_cmd.qmgr("create", "resource", "ccnodeid", "type=string,", "flag=h")
+    ifl_cmd.qmgr("set", "node", "tux", "resources_available.ncpus=4")
+    calls = ifl_cmd.libpbs.manager_calls
+    assert calls[0] == (0, 5, "ccnodeid", {"type": "string", "flag": "h"})
+    assert calls[1] == (2, 3, "tux", {"resources_available.ncpus": "4"})
+
+
+def test_new_pbscmd_falls_back_to_cli(monkeypatch: Any, parser: PBSProParser) -> None:
+    for bin_name in ["QSTAT_BIN", "QMGR_BIN", "PBSNODES_BIN"]:
+        monkeypatch.setattr(pbscmdlib, bin_name, "/bin/false")
+
+    import pbspro.ifl
+
+    monkeypatch.setattr(pbspro.ifl, "load_libpbs", lambda path: None)
+    cmd = pbscmdlib.new_pbscmd(parser, {"pbspro": {"pbscmd_backend": "ifl"}})
+    assert type(cmd) is pbscmdlib.PBSCMD
@@ -0,0 +1,67 @@
+import pickle
+
+from hpc.autoscale.node import constraints as conslib
+
+from pbspro.jobdescriptor import ConstraintTemplates, JobDescriptor
+
+
+def test_templates_are_shared() -> None:
+    templates = ConstraintTemplates()
+    descriptors = [
+        JobDescriptor(
+            str(i),
+            [{"ncpus": 4, "exclusive": True}, {"in-a-placement-group": True}],
+            node_count=2,
+            templates=templates,
+        )
+        for i in range(100)
+    ]
+    assert len(templates) == 2
+    assert templates.requests == 200
+    assert descriptors[0].constraints[0] is descriptors[99].constraints[0]
+
+    # unhashable values are kept, just not shared
+    unshared = JobDescriptor("x", [{"slot_type": ["a", "b"]}], templates=templates)
+    assert unshared.constraints == ({"slot_type": ["a", "b"]},)
+    assert len(templates) == 2
+
+
+def test_to_job() -> None:
+    templates = ConstraintTemplates()
+    descriptor = JobDescriptor(
+        "1", [{"ncpus": 4}], remaining=3, node_count=2, templates=templates
+    )
+    job = descriptor.to_job()
+    assert job.name == "1"
+    assert job.iterations_remaining == 3
+    assert job.node_count == 2
+
+
+def test_pickle() -> None:
+    descriptor = JobDescriptor("1", [{"ncpus": 4}], node_count=2, colocated=True)
+    copy = pickle.loads(pickle.dumps(descriptor))
+    assert copy.name == "1"
+    assert copy.constraints == ({"ncpus": 4},)
+    assert copy.colocated
+    assert not hasattr(descriptor, "__dict__")
+
+
+def test_constraint_objects_pass_through() -> None:
+    # e.g. a queue level shared resource or a max_run_res limit
+    resource = conslib.SharedConsumableResource(
+        resource_name="max_run[o:PBS_ALL]",
+        source="server",
+        current_value=10,
+        initial_value=10,
+    )
+    shared = conslib.SharedConsumableConstraint([resource], 1)
+
+    templates = ConstraintTemplates()
+    descriptor = JobDescriptor(
+        "1", [{"ncpus": 4}, shared], node_count=1, templates=templates
+    )
+    assert descriptor.constraints[1] is shared
+    assert len(templates) == 1
+
+    job = descriptor.to_job()
+    assert job.name == "1"
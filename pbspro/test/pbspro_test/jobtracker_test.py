@@ -0,0 +1,62 @@
+from typing import Any, Dict, List
+
+from pbspro.jobtracker import JobTracker
+
+
+class MockParser:
+    def __init__(self) -> None:
+        self.parsed: List[Dict[str, Any]] = []
+
+    def convert_resource_list(self, raw_dict: Dict[str, Any]) -> Dict[str, Any]:
+        self.parsed.append(raw_dict)
+        return dict(raw_dict)
+
+
+def _job(mtime: str, select: str = "1:ncpus=2") -> Dict[str, Any]:
+    return {"mtime": mtime, "Resource_List": {"schedselect": select}}
+
+
+def test_unchanged_jobs_are_not_parsed_again() -> None:
+    parser = MockParser()
+    tracker = JobTracker()
+
+    mtime = "Mon Oct 19 10:00:00"
+    first = tracker.convert_resource_list(parser, "1", _job(mtime))
+    tracker.convert_resource_list(parser, "2", _job(mtime))
+    assert len(parser.parsed) == 2
+
+    assert tracker.convert_resource_list(parser, "1", _job(mtime)) is first
+    assert len(parser.parsed) == 2
+    assert tracker.hits == 1 and tracker.misses == 2
+
+    # qalter bumps mtime
+    tracker.convert_resource_list(parser, "1", _job("Mon Oct 19 10:05:00"))
+    assert len(parser.parsed) == 3
+
+    # no mtime, nothing to compare against
+    tracker.convert_resource_list(parser, "3", {"Resource_List": {}})
+    tracker.convert_resource_list(parser, "3", {"Resource_List": {}})
+    assert len(parser.parsed) == 5
+    assert len(tracker) == 2
+
+
+def test_finished_jobs_are_dropped() -> None:
+    parser = MockParser()
+    tracker = JobTracker()
+    for job_id in ["1", "2", "3"]:
+        tracker.convert_resource_list(parser, job_id, _job("t0"))
+
+    assert tracker.retain(["2", "4"]) == 2
+    assert len(tracker) == 1
+
+    tracker.convert_resource_list(parser, "1", _job("t0"))
+    assert len(parser.parsed) == 4
+
+
+def test_new_parser_clears_tracker() -> None:
+    tracker = JobTracker()
+    tracker.convert_resource_list(MockParser(), "1", _job("t0"))
+
+    parser = MockParser()
+    tracker.convert_resource_list(parser, "1", _job("t0"))
+    assert len(parser.parsed) == 1
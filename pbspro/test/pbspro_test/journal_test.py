@@ -0,0 +1,56 @@
+import os
+from typing import Any
+
+from pbspro.journal import TransitionJournal
+
+
+def test_in_memory() -> None:
+    journal = TransitionJournal(None)
+    assert not journal.is_joined("id-1", "tux")
+
+    journal.begin("join", "id-1", "tux")
+    assert not journal.is_joined("id-1", "tux")
+    assert [r["hostname"] for r in journal.in_flight()] == ["tux"]
+
+    journal.end("join", "id-1", "tux")
+    assert journal.is_joined("id-1", "tux")
+    assert journal.is_joined("id-1", "TUX")
+    # same node id, but the hostname changed - must be rechecked
+    assert not journal.is_joined("id-1", "tux2")
+    assert journal.in_flight() == []
+    assert journal.latest("id-1")["duration"] >= 0
+
+    journal.begin("drain", "id-1", "tux")
+    journal.end("drain", "id-1", "tux")
+    assert not journal.is_joined("id-1", "tux")
+
+    journal.begin("join", "id-2", "tux2")
+    journal.failed("join", "id-2", "tux2")
+    assert not journal.is_joined("id-2", "tux2")
+    assert journal.in_flight() == []
+
+
+def test_reload_and_compact(tmpdir: Any) -> None:
+    path = os.path.join(str(tmpdir), "transitions.jsonl")
+    journal = TransitionJournal(path, max_records=5)
+    journal.begin("join", "id-1", "tux1")
+    journal.end("join", "id-1", "tux1")
+    # simulate being killed part way through a join
+    journal.begin("join", "id-2", "tux2")
+
+    reloaded = TransitionJournal(path)
+    assert reloaded.is_joined("id-1", "tux1")
+    assert [r["node_id"] for r in reloaded.in_flight()] == ["id-2"]
+
+    for _ in range(3):
+        journal.begin("drain", "id-1", "tux1")
+    with open(path) as fr:
+        lines = fr.readlines()
+    # compacted down to one record per node
+    assert len(lines) == 2
+
+    # a partial write is ignored, not fatal
+    with open(path, "a") as fw:
+        fw.write('{"time": 1, "trans')
+    reloaded = TransitionJournal(path)
+    assert reloaded.latest("id-1")["transition"] == "drain"
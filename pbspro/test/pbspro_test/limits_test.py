@@ -0,0 +1,63 @@
+from hpc.autoscale.job.schedulernode import SchedulerNode
+
+from pbspro.limits import RunLimits, job_owner
+from pbspro.parser import PBSProParser
+
+
+def test_parse_limits(parser: PBSProParser) -> None:
+    limits = parser.parse_limits(
+        {
+            "name": "workq",
+            "max_run": "[u:PBS_GENERIC=2]",
+            "max_run_res.ncpus": "[o:PBS_ALL=64]",
+            "max_run_res.mem": "[u:PBS_GENERIC=10gb]",
+            "max_run_soft": "[u:PBS_GENERIC=1]",
+        }
+    )
+    assert set(limits.keys()) == set(["max_run", "max_run_res.ncpus"])
+    assert limits["max_run"].user == {"PBS_GENERIC": 2}
+    assert limits["max_run_res.ncpus"].overall == {"PBS_ALL": 64}
+
+
+def test_job_owner() -> None:
+    assert job_owner({"Job_Owner": "alice@head"}) == ("alice", None, None)
+    assert job_owner(
+        {"Job_Owner": "alice@head", "egroup": "devs", "project": "rnd"}
+    ) == ("alice", "devs", "rnd")
+
+
+def test_run_limits(parser: PBSProParser) -> None:
+    run_limits = RunLimits(
+        parser.parse_limits({"max_run_res.ncpus": "[o:PBS_ALL=16]"}),
+        {
+            "workq": parser.parse_limits({"max_run": "[u:PBS_GENERIC=2], [u:bob=3]"}),
+            "htcq": {},
+        },
+    )
+    assert run_limits
+    assert not RunLimits({}, {"workq": {}})
+
+    run_limits.add_running_job("workq", "alice", None, None, {"ncpus": "4"})
+
+    # alice has 1 job left, and there are 12 ncpus left overall
+    cons = run_limits.get_constraints("workq", "alice", None, None, {"ncpus": 4}, 0.5)
+    assert len(cons) == 2
+    by_name = dict([(c.shared_resources[0].resource_name, c) for c in cons])
+    max_run = by_name["max_run[u:alice]"].shared_resources[0]
+    assert max_run.current_value == 1
+    assert max_run.initial_value == 2
+    ncpus = by_name["max_run_res.ncpus[o:PBS_ALL]"].shared_resources[0]
+    assert ncpus.current_value == 12
+
+    # one job split over two nodes uses up the rest of alice's limit
+    node = SchedulerNode("tux", {})
+    assert node.decrement(cons)
+    assert node.decrement(cons)
+    assert max_run.current_value == 0
+    assert not node.decrement(cons)
+
+    # bob has a per-user limit, and htcq only has the server limit
+    assert len(run_limits.get_constraints("workq", "bob", None, None, {}, 1)) == 1
+    assert (
+        len(run_limits.get_constraints("htcq", "bob", None, None, {"ncpus": 1}, 1)) == 1
+    )
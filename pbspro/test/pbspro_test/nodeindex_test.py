@@ -0,0 +1,38 @@
+import datetime
+
+from hpc.autoscale.job.schedulernode import SchedulerNode
+
+from pbspro.nodeindex import NodeIndex, parse_pbs_time
+
+
+def test_parse_pbs_time() -> None:
+    now = datetime.datetime.now().replace(microsecond=0)
+    assert parse_pbs_time(datetime.datetime.ctime(now)) == now
+    # single digit days are padded with a space by ctime
+    assert parse_pbs_time("Mon Oct  5 10:11:12 2020") == datetime.datetime(
+        2020, 10, 5, 10, 11, 12
+    )
+    assert parse_pbs_time("") is None
+    assert parse_pbs_time("not a time") is None
+
+
+def test_node_index() -> None:
+    def snode(hostname: str, ccnodeid: str, pbs_state: str) -> SchedulerNode:
+        ret = SchedulerNode(hostname, {"ccnodeid": ccnodeid})
+        ret.metadata["pbs_state"] = pbs_state
+        return ret
+
+    tux1 = snode("Tux1", "id-1", "free")
+    tux2 = snode("tux2", "id-2", "down,offline")
+    tux3 = snode("tux3", "id-3", "state-unknown,down")
+    index = NodeIndex([tux1, tux2, tux3])
+
+    assert len(index) == 3
+    assert "id-2" in index
+    assert "id-4" not in index
+    assert index.get_by_ccnodeid("id-3") is tux3
+    assert index.get_by_hostname("tux1") is tux1
+    assert index.get_by_hostname("TUX2") is tux2
+    assert index.with_state("down") == [tux2, tux3]
+    assert index.with_state("offline") == [tux2]
+    assert index.with_state("busy") == []
@@ -0,0 +1,73 @@
+from typing import Any, Dict, Optional
+
+import pytest
+
+from pbspro import nodetable
+from pbspro.nodetable import NodeTable
+
+
+class MockNode:
+    def __init__(
+        self,
+        name: str,
+        nodearray: str,
+        ncpus: int,
+        used: int = 0,
+        placement_group: Optional[str] = None,
+    ) -> None:
+        self.name = name
+        self.hostname = name
+        self.nodearray = nodearray
+        self.vm_size = "F{}".format(ncpus)
+        self.placement_group = placement_group
+        self.resources: Dict[str, Any] = {"ncpus": ncpus, "mem": "4g", "gpu": False}
+        self.available: Dict[str, Any] = {"ncpus": ncpus - used, "mem": "4g"}
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "python"])
+def use_numpy(request: Any, monkeypatch: Any) -> bool:
+    if request.param and nodetable.np is None:
+        pytest.skip("numpy is not installed")
+    if not request.param:
+        monkeypatch.setattr(nodetable, "np", None)
+    return request.param
+
+
+def test_aggregates(use_numpy: bool) -> None:
+    nodes = [
+        MockNode("htc-1", "htc", 4, used=1),
+        MockNode("htc-2", "htc", 4),
+        MockNode("hpc-1", "hpc", 8, used=8, placement_group="pg0"),
+        MockNode("hpc-2", "hpc", 8, placement_group="pg0"),
+        MockNode("hpc-3", "hpc", 16, placement_group="pg1"),
+    ]
+    table = NodeTable(nodes)
+    # only numeric resources are tracked
+    assert table.resources == ["ncpus"]
+    assert len(table) == 5
+
+    assert table.total("ncpus") == 31
+    assert table.total("ncpus", available=False) == 40
+    assert table.sum_by("ncpus", "nodearray") == {"htc": 7, "hpc": 24}
+    assert table.sum_by("ncpus", "bucket") == {
+        "htc/F4": 7,
+        "hpc/F8": 8,
+        "hpc/F16": 16,
+    }
+    assert table.sum_by("ncpus", "placement_group", available=False) == {
+        "": 8,
+        "pg0": 16,
+        "pg1": 16,
+    }
+    assert table.count_by("nodearray") == {"htc": 2, "hpc": 3}
+
+    with pytest.raises(KeyError):
+        table.sum_by("ngpus", "nodearray")
+    with pytest.raises(KeyError):
+        table.sum_by("ncpus", "vm_size")
+
+
+def test_empty(use_numpy: bool) -> None:
+    table = NodeTable([], ["ncpus"])
+    assert table.total("ncpus") == 0
+    assert table.sum_by("ncpus", "nodearray") == {}
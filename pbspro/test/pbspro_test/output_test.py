@@ -0,0 +1,62 @@
+import io
+import json
+from typing import Any, Dict, Iterator
+
+import pytest
+
+from pbspro.output import iter_rows, parse_filter, write_rows
+
+
+class MockNode:
+    def __init__(self, name: str, state: str, ncpus: int) -> None:
+        self.name = name
+        self.state = state
+        self.job_ids = ["1", "2"] if state == "Ready" else []
+        self.resources: Dict[str, Any] = {"ncpus": ncpus, "instance_id": "abcdef"}
+        self.available: Dict[str, Any] = {"ncpus": ncpus // 2}
+
+
+def test_parse_filter() -> None:
+    assert parse_filter("state=Ready") == ("state", False, "Ready")
+    assert parse_filter("name!=htc-*") == ("name", True, "htc-*")
+    with pytest.raises(ValueError):
+        parse_filter("state")
+
+
+def test_stream_formats() -> None:
+    nodes = [MockNode("htc-1", "Ready", 4), MockNode("htc-2", "Off", 8)]
+    columns = ["name", "job_ids", "/ncpus", "id@instance_id[:3]"]
+
+    out = io.StringIO()
+    assert write_rows(iter_rows(nodes, columns), columns, "jsonl", out) == 2
+    first = json.loads(out.getvalue().splitlines()[0])
+    assert first == {
+        "name": "htc-1",
+        "job_ids": ["1", "2"],
+        "ncpus": "2/4",
+        "id": "abc",
+    }
+
+    out = io.StringIO()
+    write_rows(iter_rows(nodes, columns), columns, "tsv", out)
+    assert out.getvalue().splitlines() == [
+        "name\tjob_ids\tncpus\tid",
+        "htc-1\t1,2\t2/4\tabc",
+        "htc-2\t\t4/8\tabc",
+    ]
+
+
+def test_filter_and_limit_are_lazy() -> None:
+    seen = []
+
+    def nodes() -> Iterator[MockNode]:
+        for i in range(1000):
+            seen.append(i)
+            yield MockNode("htc-{}".format(i), "Ready" if i % 2 else "Off", 2)
+
+    rows = list(iter_rows(nodes(), ["name"], [("state", False, "Ready")], limit=3))
+    assert rows == [("htc-1",), ("htc-3",), ("htc-5",)]
+    assert len(seen) == 6
+
+    rows = list(iter_rows(nodes(), ["name"], [("name", True, "htc-?")], limit=1))
+    assert rows == [("htc-10",)]
@@ -0,0 +1,58 @@
+from typing import Any, Dict
+
+from pbspro.parallel import ResourceListConverter, new_resource_list_converter
+from pbspro.parser import PBSProParser
+
+
+def _res_lists(count: int) -> Dict[str, Dict[str, Any]]:
+    return dict(
+        [
+            (
+                str(i),
+                {
+                    "ncpus": str(i % 8 + 1),
+                    "place": "scatter:excl" if i % 2 else "free",
+                    "schedselect": "{}:ncpus={}".format(i % 3 + 1, i % 8 + 1),
+                },
+            )
+            for i in range(count)
+        ]
+    )
+
+
+def test_parallel_matches_serial(parser: PBSProParser) -> None:
+    res_lists = _res_lists(200)
+    serial = ResourceListConverter(parser).convert(res_lists)
+    parallel = ResourceListConverter(parser, workers=2, threshold=100)
+    assert parallel.convert(res_lists) == serial
+    assert len(serial) == 200
+    assert serial["3"]["schedselect"] == parser.parse_select("1:ncpus=4")
+
+
+def test_below_threshold_is_serial(parser: PBSProParser) -> None:
+    converter = ResourceListConverter(parser, workers=2, threshold=100)
+
+    def fail(res_lists: Dict) -> Dict:
+        raise AssertionError("should not start a process pool")
+
+    converter._convert_parallel = fail  # type: ignore
+    assert len(converter.convert(_res_lists(99))) == 99
+
+
+def test_pool_failure_falls_back(parser: PBSProParser) -> None:
+    converter = ResourceListConverter(parser, workers=2, threshold=1)
+
+    def fail(res_lists: Dict) -> Dict:
+        raise OSError("no more processes")
+
+    converter._convert_parallel = fail  # type: ignore
+    assert len(converter.convert(_res_lists(5))) == 5
+
+
+def test_config(parser: PBSProParser) -> None:
+    assert new_resource_list_converter({}, parser).workers == 0
+    converter = new_resource_list_converter(
+        {"pbspro": {"parallel_parse": {"workers": "auto", "threshold": 5}}}, parser
+    )
+    assert converter.workers >= 1
+    assert converter.threshold == 5
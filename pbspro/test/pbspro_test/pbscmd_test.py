@@ -1,6 +1,10 @@
+from subprocess import CalledProcessError
+from typing import List
+
 import pytest
 
 from pbspro.parser import PBSProParser
+from pbspro.pbscmd import PBSCMD, parse_qmgr_failures
 
 
 @pytest.mark.skip
@@ -72,3 +76,44 @@ ip-0A010008
     actual = parser.parse_key_value(pbsnodes_example)
 
     assert actual == expected
+
+
+def test_parse_qmgr_failures() -> None:
+    output = """qmgr obj=ip-0a010008 svr=default: Unknown node
+qmgr: Error (15062) returned from server
+Qmgr: qmgr obj=ip-0a010009 svr=default: Request invalid for state of node
+qmgr: Error (15049) returned from server"""
+    assert parse_qmgr_failures(output) == {
+        "ip-0a010008": "Unknown node",
+        "ip-0a010009": "Request invalid for state of node",
+    }
+    assert parse_qmgr_failures("qmgr: Error (15007) returned from server") == {}
+
+
+class MockQmgrPBSCMD(PBSCMD):
+    def __init__(self, stderr: str) -> None:
+        self.qmgr_session = None
+        self.stderr = stderr
+        self.scripts: List[str] = []
+
+    def qmgr(self, *args: str) -> str:
+        self.scripts.append(" ".join(args))
+        if self.stderr:
+            raise CalledProcessError(1, ["qmgr"], b"", self.stderr.encode())
+        return ""
+
+
+def test_qmgr_script() -> None:
+    pbscmd = MockQmgrPBSCMD("")
+    assert pbscmd.qmgr_script(("delete", "node", "a"), ("delete", "node", "b")) == {}
+    assert pbscmd.scripts == ["delete node a; delete node b"]
+
+    pbscmd = MockQmgrPBSCMD("qmgr obj=b svr=default: Unknown node")
+    assert pbscmd.qmgr_script(("delete", "node", "a"), ("delete", "node", "b")) == {
+        "b": "Unknown node"
+    }
+
+    # nothing to attribute the failure to
+    pbscmd = MockQmgrPBSCMD("qmgr: cannot connect to server")
+    with pytest.raises(CalledProcessError):
+        pbscmd.qmgr_script(("delete", "node", "a"))
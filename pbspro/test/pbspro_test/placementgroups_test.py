@@ -0,0 +1,60 @@
+from typing import Any, Dict, List, Optional
+
+from pbspro.placementgroups import PlacementGroupIndex
+
+
+class MockNode:
+    def __init__(
+        self, name: str, placement_group: Optional[str], busy: bool = False
+    ) -> None:
+        self.name = name
+        self.nodearray = "hpc"
+        self.vm_size = "H44"
+        self.placement_group = placement_group
+        self.assignments = set(["9"]) if busy else set()
+        self.closed = False
+        self.available: Dict[str, Any] = {"ncpus": 0 if busy else 44}
+
+
+class MockJob:
+    def __init__(self, name: str, node_count: int, colocated: bool = True) -> None:
+        self.name = name
+        self.node_count = node_count
+        self.colocated = colocated
+        self.metadata = {"job_state": "queued"}
+
+
+def _nodes() -> List[MockNode]:
+    return (
+        [MockNode("a-{}".format(i), "pg-a") for i in range(4)]
+        + [MockNode("b-{}".format(i), "pg-b", busy=i < 2) for i in range(4)]
+        + [MockNode("c-{}".format(i), "pg-c") for i in range(8)]
+        + [MockNode("htc-1", None)]
+    )
+
+
+def test_summaries() -> None:
+    index = PlacementGroupIndex(_nodes())
+    assert len(index) == 3
+    pg_b = index.groups["pg-b"]
+    assert (pg_b.node_count, pg_b.free_count, pg_b.free_ncpus) == (4, 2, 88)
+    assert pg_b.job_ids == ["9"]
+    assert index.largest_free() == 8
+
+
+def test_best_fit_and_match() -> None:
+    index = PlacementGroupIndex(_nodes())
+    assert index.best_fit(2).group_id == "pg-b"  # type: ignore
+    assert index.best_fit(3).group_id == "pg-a"  # type: ignore
+    assert index.best_fit(9) is None
+    assert index.best_fit(2, nodearray="htc") is None
+
+    jobs = [
+        MockJob("1", 6),
+        MockJob("2", 4),
+        MockJob("3", 4),
+        MockJob("4", 1, colocated=False),
+    ]
+    # job 1 takes pg-c, leaving 2 free in it, so job 3 does not fit anywhere
+    assert index.match_jobs(jobs) == {"1": "pg-c", "2": "pg-a", "3": None}
+    assert index.groups["pg-c"].free_count == 2
@@ -0,0 +1,72 @@
+import os
+import stat
+import sys
+from shutil import which
+from subprocess import CalledProcessError
+from typing import Any, Iterator
+
+import pytest
+
+from pbspro.pbscmd import QmgrSession
+
+FAKE_QMGR = """#!{python}
+import sys
+
+nodes = {{"tux": "free"}}
+
+for line in sys.stdin:
+    toks = line.split()
+    if not toks:
+        continue
+    if toks[0] == "crash":
+        sys.exit(1)
+    if toks[:2] == ["list", "node"]:
+        name = toks[2]
+        if name in nodes:
+            print("Node " + name)
+            print("    state = " + nodes[name])
+            print()
+        else:
+            print("qmgr obj=%s svr=default: Unknown node" % name, file=sys.stderr)
+            print("qmgr: Error (15062) returned from server", file=sys.stderr)
+    elif toks[:2] == ["create", "node"]:
+        nodes[toks[2]] = "free"
+    sys.stdout.flush()
+"""
+
+
+@pytest.fixture
+def session(tmpdir: Any) -> Iterator[QmgrSession]:
+    stdbuf = which("stdbuf")
+    if not stdbuf:
+        pytest.skip("stdbuf is required for the qmgr session")
+    path = os.path.join(str(tmpdir), "qmgr")
+    with open(path, "w") as fw:
+        fw.write(FAKE_QMGR.format(python=sys.executable))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    ret = QmgrSession(path, stdbuf)
+    yield ret
+    ret.close()
+
+
+def test_responses_are_delimited(session: QmgrSession) -> None:
+    assert "state = free" in session.execute("list node tux")
+
+    with pytest.raises(CalledProcessError):
+        session.execute("list node missing")
+
+    # the sentinel's error output must not leak into the next response
+    assert session.execute("create node missing") == ""
+    assert "Node missing" in session.execute("list node missing")
+    assert session.restarts == 0
+
+
+def test_restart_on_crash(session: QmgrSession) -> None:
+    assert "state = free" in session.execute("list node tux")
+
+    with pytest.raises(CalledProcessError):
+        session.execute("crash")
+
+    # next command gets a fresh coprocess
+    assert "state = free" in session.execute("list node tux")
+    assert session.restarts >= 1
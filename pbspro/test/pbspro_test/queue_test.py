@@ -3,7 +3,7 @@ from hpc.autoscale.job.schedulernode import SchedulerNode
 from hpc.autoscale.node.constraints import SharedConsumableResource
 
 from pbspro.parser import PBSProParser
-from pbspro.pbsqueue import PBSProLimit, PBSProQueue
+from pbspro.pbsqueue import PBSProLimit, PBSProQueue, QueueConstraintFactory
 from pbspro.resource import LongType, PBSProResourceDefinition, ResourceState
 
 
@@ -100,6 +100,36 @@ def test_non_schedulable_shared_resources() -> None:
     assert test_queue.resource_state.shared_resources["qres"][0].current_value == 3
 
 
+def test_constraint_factory() -> None:
+    qres = [
+        SharedConsumableResource(
+            resource_name="qres", source="queue", current_value=4, initial_value=4,
+        )
+    ]
+    factory = QueueConstraintFactory(
+        {
+            "qres": PBSProResourceDefinition("qres", LongType(), flag="q"),
+            "ncpus": PBSProResourceDefinition("ncpus", LongType(), flag="nh"),
+            "undef": PBSProResourceDefinition("undef", LongType(), flag="q"),
+        },
+        {"qres": qres},
+    )
+    assert factory.non_host_resources == set(["qres", "undef"])
+
+    # host resources are ignored
+    assert factory.get_constraints({"ncpus": 4}, 1) == []
+
+    first = factory.get_constraints({"qres": 2, "ncpus": 4}, 2)
+    assert len(first) == 1
+    assert first[0].shared_resources == qres
+    # identical requests share the same constraint
+    assert factory.get_constraints({"qres": 2}, 2)[0] is first[0]
+    assert factory.get_constraints({"qres": 2}, 1)[0] is not first[0]
+
+    with pytest.raises(RuntimeError):
+        factory.get_constraints({"undef": 1}, 1)
+
+
 @pytest.mark.skip
 def test_disabled_queues() -> None:
     assert False
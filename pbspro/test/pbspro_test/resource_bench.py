@@ -0,0 +1,37 @@
+"""
+Micro-benchmark for the ResourceType parsers, which are called for every
+attribute of every job, node and queue. Not collected by pytest.
+
+    python test/pbspro_test/resource_bench.py [iterations]
+"""
+import sys
+import timeit
+
+from pbspro.resource import RESOURCE_TYPES
+
+SAMPLES = {
+    "boolean": ["True", "false", "1", "f"],
+    "duration": ["3600", "01:00:00", "00:30:00.5", "10:00"],
+    "float": ["1.5", "0.25", "16"],
+    "long": ["1", "16", "120"],
+    "size": ["16gb", "4096mb", "1kw", "512kb"],
+    "string": ["workq", "scatter:excl", "Standard_F2s_v2"],
+    "string_array": ["a,b,c", "htc, hpc"],
+}
+
+
+def main(iterations: int) -> None:
+    for type_name, samples in SAMPLES.items():
+        rtype = RESOURCE_TYPES[type_name]
+
+        def run() -> None:
+            for sample in samples:
+                rtype.parse(sample)
+
+        elapsed = timeit.timeit(run, number=iterations)
+        per_call = elapsed / (iterations * len(samples)) * 1e9
+        print("{:<14} {:>10.0f} ns/parse".format(type_name, per_call))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
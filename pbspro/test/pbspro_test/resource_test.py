@@ -75,6 +75,25 @@ def test_parse_size() -> None:
     assert HPCSize.value_of("8t") == SizeType().parse("1tw")
     assert HPCSize.value_of("8p") == SizeType().parse("1pw")
 
+    # repeated expressions are served from the cache
+    assert SizeType().parse("16gb") is SizeType().parse("16gb")
+    try:
+        SizeType().parse("16xyz")
+        assert False
+    except ResourceParsingError:
+        pass
+
+
+def test_parse_cached_duration_and_string() -> None:
+    assert 3600 == DurationType().parse("01:00:00")
+    assert 3600 == DurationType().parse("01:00:00")
+    assert 3600 == DurationType().parse("3600")
+    assert -1 == DurationType().parse("-1")
+    assert 600 == DurationType().parse("10:00")
+    assert 1801 == DurationType().parse("00:30:00.5")
+    assert 5 == DurationType().parse(5)  # type: ignore
+    assert StringType().parse("".join(["work", "q"])) is StringType().parse("workq")
+
 
 def test_pbspro_resource() -> None:
     ncpus = PBSProResourceDefinition("ncpus", LongType(), "nh")
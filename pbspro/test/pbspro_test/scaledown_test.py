@@ -0,0 +1,69 @@
+from typing import Any, Dict, List
+
+from pbspro.demandhistory import BucketDemand, DemandHistory
+from pbspro.scaledown import select_for_scaledown
+
+
+class MockNode:
+    def __init__(self, name: str, nodearray: str, vm_size: str = "F2") -> None:
+        self.name = name
+        self.nodearray = nodearray
+        self.vm_size = vm_size
+        self.exists = True
+        self.assignments: set = set()
+        self.closed = False
+        self.state = "Ready"
+
+    def __str__(self) -> str:
+        return self.name
+
+
+def _config(**scaledown: Any) -> Dict:
+    return {"pbspro": {"scaledown": scaledown}}
+
+
+def _names(nodes: List[Any]) -> List[str]:
+    return [n.name for n in nodes]
+
+
+def test_default_drains_everything() -> None:
+    nodes = [MockNode("htc-1", "htc"), MockNode("htc-2", "htc")]
+    assert select_for_scaledown({}, nodes, nodes, DemandHistory(None)) == nodes  # type: ignore
+
+
+def test_warm_pool_and_demand() -> None:
+    history = DemandHistory(None)
+    history.buckets["htc/F2"] = BucketDemand(arrival_rate=0.002, demand=5)
+    history.buckets["hpc/H44"] = BucketDemand(demand=1)
+    history.buckets["gpu/NC6"] = BucketDemand(demand=3)
+
+    candidates = [
+        MockNode("htc-1", "htc"),
+        MockNode("htc-2", "htc"),
+        MockNode("hpc-1", "hpc", "H44"),
+        MockNode("hpc-2", "hpc", "H44"),
+        MockNode("gpu-1", "gpu", "NC6"),
+    ]
+    # idle, but not past the idle_timeout yet
+    recently_idle = MockNode("hpc-3", "hpc", "H44")
+    busy = MockNode("hpc-4", "hpc", "H44")
+    busy.assignments.add("1")
+    all_nodes = candidates + [recently_idle, busy]
+
+    to_drain = select_for_scaledown(
+        _config(warm_pool={"hpc": 2}, demand_window=600),
+        candidates,  # type: ignore
+        all_nodes,  # type: ignore
+        history,
+    )
+    # htc expects 1.2 nodes of new jobs in 600 seconds, so keeps 1.
+    # hpc keeps 1 plus the recently idle node, lowest demand is drained first
+    assert _names(to_drain) == ["hpc-1", "gpu-1", "htc-1"]
+
+    to_drain = select_for_scaledown(
+        _config(max_per_iteration=2),
+        candidates,  # type: ignore
+        all_nodes,  # type: ignore
+        history,
+    )
+    assert _names(to_drain) == ["hpc-1", "hpc-2"]
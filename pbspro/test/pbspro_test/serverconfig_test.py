@@ -0,0 +1,70 @@
+from subprocess import CalledProcessError
+from typing import Dict, List, Tuple
+
+from pbspro.parser import PBSProParser
+from pbspro.serverconfig import read_server_config
+
+QMGR_OUTPUT = """Server pbsserver
+    server_state = Active
+    server_host = pbsserver
+Sched default
+    sched_host = pbsserver
+    sched_priv = /var/spool/pbs/sched_priv
+
+Sched multi
+    sched_host = pbsserver
+    partition = p1
+Queue workq
+    queue_type = Execution
+    enabled = True
+
+Queue htcq
+    queue_type = Execution
+    enabled = True
+Resource ncpus
+    type = long
+    flag = nh
+"""
+
+
+class MockPBSCMD:
+    def __init__(self, parser: PBSProParser, combined: bool = True) -> None:
+        self.parser = parser
+        self.combined = combined
+        self.calls: List[Tuple] = []
+
+    def qmgr_script_parsed(self, *commands: Tuple[str, ...]) -> List[Dict[str, str]]:
+        self.calls.append(commands)
+        if not self.combined:
+            raise CalledProcessError(1, ["qmgr"], b"", b"syntax error")
+        return self.parser.parse_key_value(QMGR_OUTPUT)
+
+    def qmgr_parsed(self, *args: str) -> List[Dict[str, str]]:
+        self.calls.append(args)
+        records = self.parser.parse_key_value(QMGR_OUTPUT)
+        return [r for r in records if r["obj_type"].lower() == args[1]]
+
+
+def test_combined(parser: PBSProParser) -> None:
+    pbscmd = MockPBSCMD(parser)
+    server_config = read_server_config(pbscmd)  # type: ignore
+    assert len(pbscmd.calls) == 1
+
+    assert [s["name"] for s in server_config.servers] == ["pbsserver"]
+    assert [s["name"] for s in server_config.scheds] == ["default", "multi"]
+    assert [q["name"] for q in server_config.queues] == ["workq", "htcq"]
+    assert [r["name"] for r in server_config.resources] == ["ncpus"]
+    assert server_config.get_sched("multi")["partition"] == "p1"  # type: ignore
+    assert server_config.get_sched("other") is None
+
+
+def test_fallback(parser: PBSProParser) -> None:
+    pbscmd = MockPBSCMD(parser, combined=False)
+    server_config = read_server_config(pbscmd)  # type: ignore
+    assert pbscmd.calls[1:] == [
+        ("list", "server"),
+        ("list", "sched"),
+        ("list", "queue"),
+        ("list", "resource"),
+    ]
+    assert [q["name"] for q in server_config.queues] == ["workq", "htcq"]
@@ -0,0 +1,80 @@
+import os
+from subprocess import CalledProcessError
+from typing import Any, Dict, List
+
+import pytest
+
+from pbspro.parser import PBSProParser
+from pbspro.snapshot import RecordingPBSCMD, load_snapshot
+
+
+class MockPBSCMD:
+    def __init__(self) -> None:
+        self.parser = PBSProParser({})
+        self.calls: List[tuple] = []
+
+    def qstat_json(self, *args: str) -> Dict:
+        self.calls.append(("qstat_json",) + args)
+        return {"Jobs": {"1.pbsserver": {"job_state": "Q"}}}
+
+    def qmgr(self, *args: str) -> str:
+        self.calls.append(("qmgr",) + args)
+        if args[0] == "list" and args[2] == "missing":
+            raise CalledProcessError(153, ["qmgr"], b"", b"Unknown node")
+        return ""
+
+    def pbsnodes_parsed(self, *args: str) -> List[Dict[str, str]]:
+        self.calls.append(("pbsnodes_parsed",) + args)
+        return [{"name": "tux-1", "state": "free"}]
+
+    def close(self) -> None:
+        pass
+
+
+def test_record_and_replay(tmpdir: Any) -> None:
+    path = os.path.join(str(tmpdir), "pbs_snapshot.json")
+    live = MockPBSCMD()
+    recorder = RecordingPBSCMD(live, now=1000)  # type: ignore
+
+    jobs = recorder.qstat_json("-f", "-t")
+    # callers may modify what they get back
+    jobs["Jobs"].clear()
+    recorder.pbsnodes_parsed("-a")
+    with pytest.raises(CalledProcessError):
+        recorder.qmgr("list", "node", "missing")
+    recorder.qmgr("set", "node", "tux-1", "resources_available.ncpus=4")
+    recorder.save(path)
+
+    replay_live = MockPBSCMD()
+    snapshot = load_snapshot(
+        path,
+        PBSProParser({}),
+        lambda: replay_live,  # type: ignore
+        max_age=60,
+        now=1030,
+    )
+    assert snapshot is not None
+    assert snapshot.age(now=1030) == 30
+
+    assert snapshot.qstat_json("-f", "-t") == {
+        "Jobs": {"1.pbsserver": {"job_state": "Q"}}
+    }
+    assert snapshot.pbsnodes_parsed("-a") == [{"name": "tux-1", "state": "free"}]
+    with pytest.raises(CalledProcessError) as e:
+        snapshot.qmgr("list", "node", "missing")
+    assert e.value.returncode == 153
+    assert replay_live.calls == []
+
+    # writes and reads that were not recorded go to PBS
+    snapshot.qmgr("set", "node", "tux-1", "resources_available.ncpus=4")
+    snapshot.pbsnodes_parsed("tux-1")
+    assert replay_live.calls == [
+        ("qmgr", "set", "node", "tux-1", "resources_available.ncpus=4"),
+        ("pbsnodes_parsed", "tux-1"),
+    ]
+    assert snapshot.misses == 1
+
+    # too old, or not there at all
+    parser = PBSProParser({})
+    assert load_snapshot(path, parser, MockPBSCMD, 60, now=1061) is None  # type: ignore
+    assert load_snapshot(path + ".x", parser, MockPBSCMD, 60) is None  # type: ignore
@@ -0,0 +1,62 @@
+import os
+from typing import Any, List
+
+from pbspro.trigger import AutoscaleTrigger
+
+
+class FakeClock:
+    def __init__(self, trigger_path: str) -> None:
+        self.now = 0.0
+        self.trigger_path = trigger_path
+        # times at which the hook pokes the trigger file
+        self.pokes: List[float] = []
+        self.mtime = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+        while self.pokes and self.pokes[0] <= self.now:
+            self.pokes.pop(0)
+            self.mtime += 1
+            os.utime(self.trigger_path, (self.mtime, self.mtime))
+
+
+def _trigger(tmpdir: Any) -> AutoscaleTrigger:
+    path = os.path.join(str(tmpdir), "autoscale.trigger")
+    clock = FakeClock(path)
+    trigger = AutoscaleTrigger(
+        path, debounce=2, max_delay=10, clock=clock, sleep=clock.sleep
+    )
+    # created after the trigger, so the first wait sees it as a change
+    trigger.poke()
+    os.utime(path, (clock.mtime, clock.mtime))
+    return trigger
+
+
+def test_timeout_without_pokes(tmpdir: Any) -> None:
+    trigger = _trigger(tmpdir)
+    clock: FakeClock = trigger.clock  # type: ignore
+    assert trigger.wait(5)
+    start = clock.now
+    assert not trigger.wait(5)
+    assert clock.now - start >= 5
+
+
+def test_bursts_are_coalesced(tmpdir: Any) -> None:
+    trigger = _trigger(tmpdir)
+    clock: FakeClock = trigger.clock  # type: ignore
+    assert trigger.wait(15)
+
+    # a short burst ends 2 seconds after the last poke
+    start = clock.now
+    clock.pokes = [start + 1, start + 1.5, start + 2]
+    assert trigger.wait(15)
+    assert clock.now - start == 4
+
+    # a burst that never goes quiet is cut off after max_delay
+    start = clock.now
+    clock.pokes = [start + 1 + n for n in range(30)]
+    assert trigger.wait(15)
+    assert clock.now - start == 11